@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+TextEdit Benchmarks
+Times the document core of textedit-native.py (load, save, find, replace,
+word count, line lookups, highlighting) on generated files, without a display.
+With --tk the widget-bound paths are timed too; run those under Xvfb on CI:
+
+    xvfb-run python3 benchmark-textedit.py --tk
+
+Results are written as JSON so runs can be compared between commits:
+
+    python3 benchmark-textedit.py --output before.json
+    python3 benchmark-textedit.py --output after.json --compare before.json
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+SIZES = {'K': 1024, 'M': 1024 * 1024, 'G': 1024 * 1024 * 1024}
+WORDS = ("the quick brown fox jumps over lazy dog lorem ipsum dolor sit amet "
+         "editor buffer piece table search replace undo line index").split()
+LOOKUPS = 10000
+
+def load_core():
+    """Import textedit-native.py as a module; nothing in it needs a display until TextEditApp is created"""
+    spec = importlib.util.spec_from_file_location('textedit', ROOT / 'textedit-native.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def parse_size(text):
+    """Bytes in a size like 1M or 512K"""
+    text = text.strip().upper()
+    if text[-1:] in SIZES:
+        return int(float(text[:-1]) * SIZES[text[-1]])
+    return int(text)
+
+def format_size(size):
+    for unit in ('G', 'M', 'K'):
+        if size >= SIZES[unit] and not size % SIZES[unit]:
+            return f"{size // SIZES[unit]}{unit}"
+    return str(size)
+
+# Corpora: each yields lines of text; all are seeded so every run writes the same bytes
+def prose_lines(rng):
+    while True:
+        yield ' '.join(rng.choice(WORDS) for _ in range(rng.randint(4, 16))) + '\n'
+
+def long_lines(rng):
+    while True:
+        yield ' '.join(rng.choice(WORDS) for _ in range(20000)) + '\n'
+
+def match_lines(rng):
+    # "needle" several times a line, so find and replace deal with millions of matches
+    while True:
+        yield ' '.join('needle' if rng.random() < 0.3 else rng.choice(WORDS) for _ in range(12)) + '\n'
+
+def python_lines(rng):
+    while True:
+        name = rng.choice(WORDS)
+        yield (f'@decorator\ndef {name}_{rng.randint(0, 999)}(value, count=10):\n'
+               f'    """Docstring for {name}\n    spanning two lines"""\n'
+               f'    result = len(value) * {rng.random():.3f}  # {rng.choice(WORDS)}\n'
+               f'    return "{name}" if result else \'empty\'\n\n')
+
+CORPORA = {
+    # name: (lines, suffix, encoding, newline, query)
+    'prose': (prose_lines, '.txt', 'utf-8', '\n', 'lazy dog'),
+    'long-lines': (long_lines, '.txt', 'utf-8', '\n', 'lazy dog'),
+    'many-matches': (match_lines, '.txt', 'utf-8', '\n', 'needle'),
+    'crlf': (prose_lines, '.txt', 'utf-8', '\r\n', 'lazy dog'),
+    'latin-1': (lambda rng: (line.replace('e', '\xe9') for line in prose_lines(rng)), '.txt', 'latin-1', '\n', 'l\xe9'),
+    'python': (python_lines, '.py', 'utf-8', '\n', 'return'),
+}
+
+def write_corpus(directory, name, size):
+    """Generate a corpus file of about size bytes, reusing one left by an earlier run"""
+    lines, suffix, encoding, newline, query = CORPORA[name]
+    path = Path(directory) / f"{name}-{format_size(size)}{suffix}"
+    if path.exists() and path.stat().st_size >= size:
+        return path
+    rng = random.Random(name)
+    written = 0
+    with open(path, 'w', encoding=encoding, newline=newline) as f:
+        for line in lines(rng):
+            f.write(line)
+            written += len(line)
+            if written >= size:
+                break
+    return path
+
+def timed(function, repeat):
+    """Run function repeat times; (seconds of each run, last result)"""
+    runs = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        runs.append(time.perf_counter() - start)
+    return runs, result
+
+def load_document(core, path):
+    """Stream a file into a PieceTable the way the editor does, minus the widget"""
+    loader = core.FileLoader(str(path))
+    loader.start()
+    document = core.PieceTable()
+    while True:
+        text = loader.chunks.get()
+        if text is None:
+            break
+        document.insert(len(document), text)
+    if loader.error:
+        raise loader.error
+    return loader, document
+
+def find_all(core, document, query):
+    search = core.IncrementalSearch(document, query)
+    while not search.step(budget=float('inf')):
+        pass
+    return len(search.results)
+
+def replace_all(core, document, query, replacement):
+    """Replace every match in a copy of the document as one edit, as the editor applies them"""
+    copy = core.PieceTable(document.get_text())
+    stats = core.DocumentStats(copy)
+    pattern = core.search_pattern(query)
+    text = copy.get_text()
+    changes = list(core.replacements(pattern, text, replacement))
+    if changes:
+        first, last = changes[0][0], changes[-1][1]
+        stats.edit(first, last - first, core.replaced_text(text, changes))
+    return len(changes)
+
+def lookups(document, rng):
+    """Random line-to-offset and offset-to-line conversions, as Go to Line and the status bar make"""
+    lines = len(document.lines)
+    for _ in range(LOOKUPS):
+        document.line_offset(rng.randrange(lines))
+        document.position(rng.randrange(len(document) + 1))
+
+def highlight(core, document):
+    highlighter = core.SyntaxHighlighter(document, core.PythonLexer())
+    highlighter.advance(highlighter.line_count)
+    return highlighter.line_count
+
+def save(core, loader, document, directory):
+    path = Path(directory) / 'saved.tmp'
+    job = core.SaveJob(str(path), document.snapshot(), len(document), loader.encoding, newline=loader.newline)
+    job.run()
+    if job.error:
+        raise job.error
+    path.unlink()
+
+def core_benchmarks(core, name, path, directory, repeat):
+    """(operation, runs, result) for each headless operation on one corpus"""
+    lines, suffix, encoding, newline, query = CORPORA[name]
+    yield ('sniff',) + timed(lambda: core.sniff_file(str(path)), repeat)
+    runs, (loader, document) = timed(lambda: load_document(core, path), repeat)
+    yield 'load', runs, len(document)
+    yield ('word_count',) + timed(lambda: core.DocumentStats(document).words, repeat)
+    yield ('line_index',) + timed(lambda: len(core.LineIndex(document.get_text())), repeat)
+    yield ('lookups',) + timed(lambda: lookups(document, random.Random(0)), repeat)
+    yield ('find',) + timed(lambda: find_all(core, document, query), repeat)
+    yield ('replace_all',) + timed(lambda: replace_all(core, document, query, query.upper()), repeat)
+    # Replacements that change the length move every later line start
+    yield ('replace_all_longer',) + timed(lambda: replace_all(core, document, query, query + 'x'), repeat)
+    yield ('replace_all_delete',) + timed(lambda: replace_all(core, document, query, ''), repeat)
+    if suffix == '.py':
+        yield ('highlight',) + timed(lambda: highlight(core, document), repeat)
+    yield ('save',) + timed(lambda: save(core, loader, document, directory), repeat)
+
+def tk_benchmarks(core, name, path, repeat):
+    """(operation, runs, result) for the widget-bound paths; needs a display"""
+    import tkinter as tk
+    lines, suffix, encoding, newline, query = CORPORA[name]
+    loader, document = load_document(core, path)
+    text = document.get_text()
+    root = tk.Tk()
+    try:
+        widget = tk.Text(root)
+        widget.pack()
+
+        def insert():
+            widget.delete('1.0', tk.END)
+            for start in range(0, len(text), core.LOAD_BATCH_CHARS):
+                widget.insert(tk.END, text[start:start + core.LOAD_BATCH_CHARS])
+            root.update_idletasks()
+        yield ('widget_insert',) + timed(insert, repeat)
+
+        search = core.IncrementalSearch(document, query)
+        while not search.step(budget=float('inf')):
+            pass
+        results = search.results
+
+        def tag_matches():
+            # Matches are tagged a block at a time, one tag_add per block
+            widget.tag_remove('found', '1.0', tk.END)
+            for block in range(0, len(results), core.SEARCH_TAG_BLOCK):
+                indices = []
+                for number in range(block, min(block + core.SEARCH_TAG_BLOCK, len(results))):
+                    indices.append("%d.%d" % document.position(results.starts[number]))
+                    indices.append("%d.%d" % document.position(results.ends[number]))
+                widget.tag_add('found', *indices)
+            root.update_idletasks()
+            return len(results)
+        yield ('widget_tag_matches',) + timed(tag_matches, repeat)
+    finally:
+        root.destroy()
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline_path, threshold):
+    """Print each timing against a baseline run; returns whether none got slower than threshold"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    before = {(entry['corpus'], entry['operation']): entry['best'] for entry in baseline['results']}
+    ok = True
+    print(f"\nCompared with {baseline.get('commit') or baseline_path}:")
+    for entry in results:
+        old = before.get((entry['corpus'], entry['operation']))
+        if not old or entry['best'] is None:
+            continue
+        ratio = entry['best'] / old
+        flag = ""
+        if ratio > threshold:
+            flag = "  <-- slower"
+            ok = False
+        print(f"  {entry['corpus']:<20} {entry['operation']:<20} {old:9.4f}s -> {entry['best']:9.4f}s  x{ratio:.2f}{flag}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the TextEdit document core")
+    parser.add_argument('--sizes', default='1M,16M', help="corpus sizes, e.g. 1M,64M,1G (default: 1M,16M)")
+    parser.add_argument('--corpora', default=','.join(CORPORA), help="comma-separated corpora to run")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per operation; the best is reported")
+    parser.add_argument('--corpus-dir', help="where to keep generated files between runs (default: a temporary directory)")
+    parser.add_argument('--tk', action='store_true', help="also time the Tk widget paths (needs a display, e.g. Xvfb)")
+    parser.add_argument('--output', default='benchmark-results.json', help="JSON file to write")
+    parser.add_argument('--compare', help="earlier JSON results to compare against")
+    parser.add_argument('--threshold', type=float, default=1.25, help="slowdown ratio that fails --compare")
+    args = parser.parse_args()
+
+    core = load_core()
+    sizes = [parse_size(size) for size in args.sizes.split(',')]
+    names = [name for name in args.corpora.split(',') if name]
+    unknown = [name for name in names if name not in CORPORA]
+    if unknown:
+        parser.error(f"unknown corpora: {', '.join(unknown)} (choose from {', '.join(CORPORA)})")
+
+    results = []
+    with tempfile.TemporaryDirectory() as scratch:
+        corpus_dir = args.corpus_dir or scratch
+        os.makedirs(corpus_dir, exist_ok=True)
+        for size in sizes:
+            for name in names:
+                path = write_corpus(corpus_dir, name, size)
+                corpus = f"{name}-{format_size(size)}"
+                file_bytes = path.stat().st_size
+                benchmarks = core_benchmarks(core, name, path, scratch, args.repeat)
+                if args.tk:
+                    benchmarks = list(benchmarks)
+                    try:
+                        benchmarks.extend(tk_benchmarks(core, name, path, args.repeat))
+                    except Exception as e:  # No display: record it rather than fail the run
+                        print(f"  Tk benchmarks skipped: {e}")
+                        benchmarks.append(('widget_insert', [], f"skipped: {e}"))
+                for operation, runs, result in benchmarks:
+                    best = min(runs) if runs else None
+                    entry = {
+                        'corpus': corpus,
+                        'operation': operation,
+                        'bytes': file_bytes,
+                        'runs': runs,
+                        'best': best,
+                        'median': statistics.median(runs) if runs else None,
+                        'mb_per_s': file_bytes / best / SIZES['M'] if best else None,
+                        'result': result,
+                    }
+                    results.append(entry)
+                    if best is not None:
+                        print(f"{corpus:<20} {operation:<20} {best:9.4f}s  {entry['mb_per_s']:10.1f} MB/s")
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare and not compare(results, args.compare, args.threshold):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
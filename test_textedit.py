@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+"""
+TextEdit Tests
+Checks the document core of textedit-native.py without a display:
+
+    python3 -m pytest test_textedit.py
+"""
+
+import importlib.util
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+ROOT = Path(__file__).resolve().parent
+
+def load_core():
+    """Import textedit-native.py as a module; nothing in it needs a display until TextEditApp is created"""
+    spec = importlib.util.spec_from_file_location('textedit', ROOT / 'textedit-native.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+textedit = load_core()
+
+def random_edit(rng, text, pieces=('', 'x', 'ab', ' ', '\n', 'a\nb', 'word\n\n')):
+    """(offset, length, inserted) of a random edit of text"""
+    offset = rng.randint(0, len(text))
+    return offset, rng.randint(0, min(6, len(text) - offset)), rng.choice(pieces)
+
+def apply_edit(text, offset, length, inserted):
+    return text[:offset] + inserted + text[offset + length:]
+
+class PieceTableTest(unittest.TestCase):
+    """Inserts, deletes and position lookups must agree with the same edits made to a string"""
+    
+    def test_random_edits(self):
+        rng = random.Random(3)
+        text = 'first line\nsecond line\n' * 5
+        # Small pieces, so edits split and join them often
+        with mock.patch.object(textedit, 'PIECE_MAX', 7):
+            document = textedit.PieceTable(text)
+            for _ in range(2000):
+                offset, length, inserted = random_edit(rng, text)
+                self.assertEqual(document.delete(offset, length), text[offset:offset + length])
+                document.insert(offset, inserted)
+                text = apply_edit(text, offset, length, inserted)
+                self.assertEqual(len(document), len(text))
+                self.assertEqual(document.newlines, text.count('\n'))
+                offset = rng.randint(0, len(text))
+                line = text.count('\n', 0, offset)
+                col = offset - text.rfind('\n', 0, offset) - 1
+                self.assertEqual(document.position(offset), (line + 1, col))
+                self.assertEqual(document.offset(line + 1, col), offset)
+                end = rng.randint(offset, len(text))
+                self.assertEqual(document.get_text(offset, end), text[offset:end])
+            self.assertEqual(''.join(document.snapshot()), text)
+
+class DocumentStatsTest(unittest.TestCase):
+    """Incremental counts must always match a count of the whole text"""
+
+    def check(self, stats):
+        text = stats.document.get_text()
+        self.assertEqual(stats.words, textedit.count_words(text))
+        self.assertEqual(stats.chars, len(text))
+        self.assertEqual(stats.chars_no_spaces, len(text) - sum(text.count(c) for c in ' \n\t'))
+
+    def test_single_line(self):
+        stats = textedit.DocumentStats(textedit.PieceTable('hello'))
+        stats.edit(5, 0, ' world')
+        self.assertEqual(stats.words, 2)
+        stats.edit(5, 1, '')
+        self.assertEqual(stats.words, 1)
+        stats.edit(0, 10, '')
+        self.assertEqual(stats.words, 0)
+        self.check(stats)
+
+    def test_empty_document(self):
+        stats = textedit.DocumentStats(textedit.PieceTable())
+        for i, char in enumerate('one two'):
+            stats.edit(i, 0, char)
+        self.assertEqual(stats.words, 2)
+        self.check(stats)
+
+    def test_random_edits(self):
+        rng = random.Random(4)
+        pieces = ['a', 'bc', ' ', '\n', '\t', 'word ', ' x\ny ', '\n\n', 'long line of words']
+        stats = textedit.DocumentStats(textedit.PieceTable('first line\nsecond line\n'))
+        for _ in range(2000):
+            size = len(stats.document)
+            offset = rng.randint(0, size)
+            length = rng.randint(0, min(8, size - offset))
+            text = rng.choice(pieces) if rng.random() < 0.7 else ''
+            stats.edit(offset, length, text)
+            self.check(stats)
+
+class LineIndexTest(unittest.TestCase):
+    """Line starts must match a fresh index of the text, and edits must only touch the lines between them"""
+    
+    def test_random_edits(self):
+        rng = random.Random(18)
+        text = 'abc\n' * 50
+        lines = textedit.LineIndex(text)
+        for _ in range(3000):
+            offset = rng.randint(0, len(text))
+            removed = text[offset:offset + rng.randint(0, 6)]
+            inserted = rng.choice(['', 'x', '\n', 'a\nb', '\n\n\n'])
+            lines.delete(offset, removed)
+            lines.insert(offset, inserted)
+            text = text[:offset] + inserted + text[offset + len(removed):]
+            self.assertEqual([lines[i] for i in range(len(lines))], [0] + list(textedit.line_starts(text)))
+            self.assertEqual(lines.line_at(offset), text.count('\n', 0, offset))
+    
+    def test_reverse_edits_move_gap_once(self):
+        # Replace All applies its edits last first; each must cost only the lines up to the one before it
+        count = 20000
+        lines = textedit.LineIndex('line of text\n' * count)
+        moved = 0
+        move_gap = lines._move_gap
+        def counting_move_gap(line):
+            nonlocal moved
+            moved += abs(line - lines.gap)
+            move_gap(line)
+        lines._move_gap = counting_move_gap
+        for line in range(count - 1, 0, -7):
+            offset = line * 13
+            lines.delete(offset, 'line')
+            lines.insert(offset, 'replaced')
+        self.assertLess(moved, 2 * count)
+        self.assertEqual(lines[count - 1], (count - 1) * 13 + 4 * len(range(count - 1, 0, -7)) - 4)
+
+class ReplaceTest(unittest.TestCase):
+    """Replace All makes every change in one edit from the first match to the last"""
+    
+    def test_replaced_text(self):
+        text = 'say foo, then foofoo and\nfoo.'
+        for template, regex in (('bar', False), ('', False), ('<\\g<0>>', True)):
+            pattern = textedit.search_pattern('f(o)o', regex) if regex else textedit.search_pattern('foo')
+            changes = list(textedit.replacements(pattern, text[2:], template, regex, 2))
+            first, last = changes[0][0], changes[-1][1]
+            replaced = text[:first] + textedit.replaced_text(text[2:], changes, 2) + text[last:]
+            self.assertEqual(replaced, pattern.sub(template, text))
+
+class FileLoaderTest(unittest.TestCase):
+    """Bytes that don't decode past the sniffed sample must not fail the load"""
+    
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.data = b'a' * (textedit.SNIFF_BYTES + 1000) + b'caf\xe9\n'
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+    
+    def tearDown(self):
+        os.remove(self.path)
+    
+    def test_read_document(self):
+        text, encoding, bom, newline = textedit.read_document(self.path)
+        self.assertEqual(encoding, textedit.FALLBACK_ENCODING)
+        self.assertEqual(text, self.data.decode(encoding))
+    
+    def test_loader_restarts(self):
+        loader = textedit.FileLoader(self.path)
+        self.assertEqual(loader.encoding, 'utf-8')
+        loader.start()
+        chunks = []
+        while (chunk := loader.chunks.get(timeout=10)) is not None:
+            chunks.append(chunk)
+        self.assertIsNone(loader.error)
+        self.assertEqual(loader.encoding, textedit.FALLBACK_ENCODING)
+        restart = chunks.index(textedit.LOAD_RESTART)
+        self.assertEqual(''.join(chunks[restart + 1:]), self.data.decode(loader.encoding))
+
+class SearchTest(unittest.TestCase):
+    """Incremental and narrowed searches must find what a plain scan of the text finds"""
+    
+    def search(self, document, query, previous=None, regex=False, match_case=False):
+        search = textedit.IncrementalSearch(document, query, previous, regex, match_case)
+        while not search.step(budget=float('inf')):
+            pass
+        return search.results
+    
+    def expected(self, text, query, regex=False, match_case=False):
+        pattern = textedit.search_pattern(query, regex, match_case)
+        return [match.span() for match in pattern.finditer(text) if match.end() > match.start()]
+    
+    def test_can_narrow(self):
+        self.assertTrue(textedit.can_narrow('ab', 'abc'))
+        self.assertTrue(textedit.can_narrow('Ab', 'aBc'))
+        self.assertFalse(textedit.can_narrow('Ab', 'abc', match_case=True))
+        self.assertFalse(textedit.can_narrow('ab', 'xab'))
+        self.assertFalse(textedit.can_narrow('', 'a'))
+        # "aa" can overlap itself, so a scan for it skips positions "aab" matches at
+        self.assertFalse(textedit.can_narrow('aa', 'aab'))
+    
+    def test_incremental_search(self):
+        rng = random.Random(6)
+        text = ''.join(rng.choice(['ab', 'abc', 'Abc', 'x', ' ', '\n', 'aab']) for _ in range(20000))
+        document = textedit.PieceTable(text)
+        for query, regex, match_case in (('ab', False, False), ('Abc', False, True), (r'^a+b', True, False)):
+            results = self.search(document, query, regex=regex, match_case=match_case)
+            self.assertEqual(list(zip(results.starts, results.ends)), self.expected(text, query, regex, match_case))
+    
+    def test_narrowed_search(self):
+        rng = random.Random(7)
+        text = ''.join(rng.choice(['ab', 'abc', 'abcd', 'x', ' ', '\n']) for _ in range(20000))
+        document = textedit.PieceTable(text)
+        previous = self.search(document, 'ab')
+        for query in ('abc', 'abcd'):
+            narrowed = textedit.IncrementalSearch(document, query, previous)
+            self.assertIsNotNone(narrowed.candidates)
+            results = self.search(document, query, previous)
+            self.assertEqual(list(zip(results.starts, results.ends)), self.expected(text, query))
+            previous = results
+
+class UndoHistoryTest(unittest.TestCase):
+    """Undo and redo must restore every state, merging typing and keeping within their limits"""
+    
+    def setUp(self):
+        self.text = ''
+        self.history = textedit.UndoHistory()
+    
+    def edit(self, offset, length, inserted):
+        """Make an edit the way text_proxy does, in its own event-loop turn"""
+        removed = self.text[offset:offset + length]
+        self.text = apply_edit(self.text, offset, length, inserted)
+        self.history.record(offset, removed, inserted)
+        self.history.end_turn()
+    
+    def type(self, offset, chars):
+        for i, char in enumerate(chars):
+            self.edit(offset + i, 0, char)
+    
+    def undo(self):
+        step = self.history.undo()
+        for offset, removed, inserted in reversed(list(step.texts())):
+            self.text = apply_edit(self.text, offset, len(inserted), removed)
+    
+    def redo(self):
+        step = self.history.redo()
+        for offset, removed, inserted in step.texts():
+            self.text = apply_edit(self.text, offset, len(removed), inserted)
+    
+    def test_typing_merges_per_word(self):
+        self.type(0, 'hello world')
+        self.assertEqual(len(self.history.undo_steps), 2)
+        self.undo()
+        self.assertEqual(self.text, 'hello ')
+        self.edit(6, 0, '\n')  # A newline is never merged
+        self.type(7, 'ab')
+        self.assertEqual(len(self.history.undo_steps), 3)
+        self.undo()
+        self.assertEqual(self.text, 'hello \n')
+    
+    def test_random_undo_redo(self):
+        rng = random.Random(24)
+        states = [self.text]
+        for _ in range(300):
+            self.history.close()  # No merging, so each edit is one step
+            self.edit(*random_edit(rng, self.text))
+            states.append(self.text)
+        for state in reversed(states[:-1]):
+            self.undo()
+            self.assertEqual(self.text, state)
+        self.assertIsNone(self.history.undo())
+        for state in states[1:]:
+            self.redo()
+            self.assertEqual(self.text, state)
+    
+    def test_large_edits_are_compressed(self):
+        inserted = 'line of text\n' * (textedit.UNDO_COMPRESS_CHARS // 10)
+        self.edit(0, 0, inserted)
+        offset, removed, stored = self.history.undo_steps[-1].edits[0]
+        self.assertIsInstance(stored, bytes)
+        self.assertLess(self.history.memory, len(inserted))
+        self.undo()
+        self.assertEqual(self.text, '')
+        self.redo()
+        self.assertEqual(self.text, inserted)
+    
+    def test_trim(self):
+        self.history = textedit.UndoHistory(max_steps=3)
+        self.history.mark_saved()
+        for i in range(5):
+            self.history.close()
+            self.edit(0, 0, 'ab')
+        self.assertEqual(len(self.history.undo_steps), 3)
+        # The oldest steps are gone, so the empty, saved text can't be reached again
+        for _ in range(3):
+            self.undo()
+            self.assertFalse(self.history.at_saved)
+        self.assertEqual(self.text, 'abab')
+        self.assertIsNone(self.history.undo())
+        
+        self.history = textedit.UndoHistory(budget=1000)
+        for i in range(50):
+            self.history.close()
+            self.edit(0, 0, 'x' * 10)
+        self.assertLessEqual(self.history.memory, 1000)
+    
+    def test_at_saved(self):
+        self.edit(0, 0, 'one ')
+        self.history.close()
+        self.history.mark_saved()
+        self.assertTrue(self.history.at_saved)
+        self.edit(4, 0, 'two')
+        self.assertFalse(self.history.at_saved)
+        self.undo()
+        self.assertTrue(self.history.at_saved)
+        self.undo()
+        self.assertFalse(self.history.at_saved)
+        self.redo()
+        self.assertTrue(self.history.at_saved)
+        # A new edit after undoing past the save drops the redo steps that led back to it
+        self.undo()
+        self.history.close()
+        self.edit(0, 0, 'zero ')
+        self.assertEqual(self.history.saved, -1)
+        self.assertFalse(self.history.at_saved)
+
+class EditJournalTest(unittest.TestCase):
+    """Replaying a journal must rebuild the buffer, across compactions and from a file on disk"""
+    
+    def setUp(self):
+        self.root_dir = tempfile.TemporaryDirectory()
+        self.journal = textedit.EditJournal(Path(self.root_dir.name) / 'journal')
+    
+    def tearDown(self):
+        self.journal.discard()
+        self.root_dir.cleanup()
+    
+    def edit_randomly(self, rng, text, count):
+        for _ in range(count):
+            offset, length, inserted = random_edit(rng, text, ('', 'x', 'café', '\n', '"quoted"\n'))
+            self.journal.record(offset, length, inserted)
+            text = apply_edit(text, offset, length, inserted)
+        self.journal.flush()
+        return text
+    
+    def test_replay_on_file(self):
+        path = Path(self.root_dir.name) / 'base.txt'
+        path.write_text('base line\n' * 10, encoding='utf-8')
+        self.journal.reset(str(path))
+        text = self.edit_randomly(random.Random(9), path.read_text(encoding='utf-8'), 500)
+        meta, replayed = textedit.EditJournal.replay(self.journal.dir)
+        self.assertEqual(meta['file'], str(path.resolve()))
+        self.assertEqual(replayed, text)
+        
+        # The edits no longer apply to a base file that has changed
+        path.write_text('changed\n', encoding='utf-8')
+        with self.assertRaises(ValueError):
+            textedit.EditJournal.replay(self.journal.dir)
+    
+    def test_compaction(self):
+        rng = random.Random(10)
+        self.journal.reset()
+        text = self.edit_randomly(rng, '', 300)
+        self.journal.compact(textedit.PieceTable(text).snapshot(), len(text))
+        text = self.edit_randomly(rng, text, 300)
+        self.journal.compaction.wait()
+        self.journal.finish_compaction()
+        self.assertEqual(textedit.EditJournal._generations(self.journal.dir, 'deltas'), [1])
+        self.assertEqual(textedit.EditJournal._generations(self.journal.dir, 'snapshot'), [1])
+        self.assertEqual(textedit.EditJournal.replay(self.journal.dir)[1], text)
+
+class TextChangesTest(unittest.TestCase):
+    """The ranges reload applies must turn the old text into the new one"""
+    
+    def test_random_changes(self):
+        rng = random.Random(22)
+        lines = ['alpha\n', 'beta\n', 'gamma\n', 'delta\n', '\n', 'x']
+        for _ in range(300):
+            old = ''.join(rng.choice(lines) for _ in range(rng.randint(0, 30)))
+            new = old
+            for _ in range(rng.randint(0, 4)):
+                new = apply_edit(new, *random_edit(rng, new))
+            changes = textedit.text_changes(old, new)
+            self.assertEqual(changes, sorted(changes))
+            text = old
+            for start, end, replacement in reversed(changes):
+                text = text[:start] + replacement + text[end:]
+            self.assertEqual(text, new)
+        self.assertEqual(textedit.text_changes('same\n', 'same\n'), [])
+
+class LineDiffTest(unittest.TestCase):
+    """Runs must pair equal lines, in order, and stay valid through edits of the buffer"""
+    
+    def check(self, diff, old_lines, new_lines):
+        old = new = 0
+        for old_start, new_start, length in diff.runs:
+            self.assertGreaterEqual(old_start, old)
+            self.assertGreaterEqual(new_start, new)
+            self.assertEqual(old_lines[old_start:old_start + length], new_lines[new_start:new_start + length])
+            old, new = old_start + length, new_start + length
+        # Replacing every hunk's old lines with its new ones gives the buffer
+        rebuilt = list(old_lines)
+        for old_start, old_end, new_start, new_end in reversed(list(diff.hunks())):
+            rebuilt[old_start:old_end] = new_lines[new_start:new_end]
+        self.assertEqual(rebuilt, new_lines)
+    
+    def test_align(self):
+        old = ['def f():\n', '    return 1\n', '\n', 'def g():\n', '    return 2\n']
+        new = ['def f():\n', '    return 3\n', '\n', 'def g():\n', '    return 2\n', 'g()\n']
+        diff = textedit.LineDiff(old, list(new))
+        self.assertEqual(list(diff.hunks()), [(1, 2, 1, 2), (5, 5, 5, 6)])
+        self.check(diff, old, new)
+    
+    def test_random_edits(self):
+        rng = random.Random(25)
+        words = ['a\n', 'b\n', 'c\n', 'd\n', 'unique %d\n']
+        old = [rng.choice(words).replace('%d', str(i)) for i in range(200)]
+        new = list(old)
+        diff = textedit.LineDiff(old, list(new))
+        for _ in range(300):
+            first = rng.randint(0, len(new))
+            removed = rng.randint(0, min(3, len(new) - first))
+            inserted = [rng.choice(words).replace('%d', str(rng.randint(0, 300))) for _ in range(rng.randint(0, 3))]
+            new[first:first + removed] = inserted
+            diff.edit(first, removed, inserted)
+            self.check(diff, old, new)
+        self.assertEqual(diff.new_lines, new)
+
+class BatchTest(unittest.TestCase):
+    """--batch runs stats, find and replace over files without a window"""
+    
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.paths = []
+        for i, text in enumerate(('one two\nthree two\n', 'two\r\n', 'nothing here\n')):
+            path = Path(self.dir.name) / f'file{i}.txt'
+            path.write_bytes(text.encode('utf-8'))
+            self.paths.append(path)
+    
+    def tearDown(self):
+        self.dir.cleanup()
+    
+    def batch(self, *args):
+        result = subprocess.run([sys.executable, str(ROOT / 'textedit-native.py'), '--batch'] + list(args),
+                                capture_output=True, text=True, timeout=60)
+        records = [json.loads(line) for line in result.stdout.splitlines()]
+        return result.returncode, sorted(records, key=lambda record: record['file']), json.loads(result.stderr)
+    
+    def test_stats(self):
+        code, records, counts = self.batch('stats', '-j', '2', self.dir.name)
+        self.assertEqual(code, 0)
+        self.assertEqual(counts['files'], 3)
+        self.assertEqual([(record['lines'], record['words']) for record in records], [(2, 4), (1, 1), (1, 2)])
+        self.assertEqual(records[1]['newline'], 'CRLF')
+    
+    def test_find(self):
+        code, records, counts = self.batch('find', 't(w)o', '--regex', '-j', '1', self.dir.name)
+        self.assertEqual([(Path(record['file']).name, record['line'], record['col']) for record in records],
+                         [('file0.txt', 1, 4), ('file0.txt', 2, 6), ('file1.txt', 1, 0)])
+    
+    def test_replace(self):
+        code, records, counts = self.batch('replace', 'two', '2', '--dry-run', *map(str, self.paths))
+        self.assertEqual([record['replacements'] for record in records], [2, 1, 0])
+        self.assertEqual(self.paths[0].read_text(), 'one two\nthree two\n')
+        code, records, counts = self.batch('replace', 'two', '2', *map(str, self.paths))
+        self.assertEqual([record['written'] for record in records], [True, True, False])
+        self.assertEqual(self.paths[0].read_bytes(), b'one 2\nthree 2\n')
+        self.assertEqual(self.paths[1].read_bytes(), b'2\r\n')
+
+if __name__ == '__main__':
+    unittest.main()
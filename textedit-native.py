@@ -5,28 +5,2612 @@ A modern, lightweight text editor with permanent dark mode for macOS and Linux.
 Based on the TextEdit/Notepads concept but built natively for Unix systems.
 """
 
+import time
+STARTUP_TIME = time.perf_counter()  # Reference point for --profile-startup
+STARTUP_CPU = time.process_time()   # Roughly the interpreter's own startup
+
 import sys
 import os
+import io
+import re
 import json
+import codecs
+import errno
+import bisect
+import collections
+import operator
+import itertools
+import importlib
+import keyword
+import builtins
+import queue
+import socket
+import stat
+import struct
 import platform
+import threading
+from array import array
 from pathlib import Path
-from datetime import datetime
 
 try:
     import tkinter as tk
-    from tkinter import ttk, filedialog, messagebox, font as tkfont
+    from tkinter import font as tkfont
     from tkinter.scrolledtext import ScrolledText
 except ImportError:
-    print("Error: tkinter not available. Install with:")
-    print("  macOS: brew install python-tk")
-    print("  Linux: sudo apt-get install python3-tk")
-    sys.exit(1)
+    if sys.argv[1:2] == ['--batch']:
+        tk = None  # Batch mode never opens a window
+    else:
+        print("Error: tkinter not available. Install with:")
+        print("  macOS: brew install python-tk")
+        print("  Linux: sudo apt-get install python3-tk")
+        sys.exit(1)
 
-class TextEditApp:
+class LazyModule:
+    """Stand-in for a module that is imported on first use, off the startup path"""
+    
+    def __init__(self, name):
+        self.name = name
+        self.module = None
+    
+    def __getattr__(self, attr):
+        if self.module is None:
+            self.module = importlib.import_module(self.name)
+        return getattr(self.module, attr)
+
+# Only needed for dialogs, saving, large files, crash recovery, file watching and batch mode
+filedialog = LazyModule('tkinter.filedialog')
+messagebox = LazyModule('tkinter.messagebox')
+simpledialog = LazyModule('tkinter.simpledialog')
+tempfile = LazyModule('tempfile')
+shutil = LazyModule('shutil')
+uuid = LazyModule('uuid')
+mmap = LazyModule('mmap')
+argparse = LazyModule('argparse')
+futures = LazyModule('concurrent.futures')
+multiprocessing = LazyModule('multiprocessing')
+fnmatch = LazyModule('fnmatch')
+ctypes = LazyModule('ctypes')
+difflib = LazyModule('difflib')
+zlib = LazyModule('zlib')
+
+# Default TextEdit ASCII banner shown in new documents
+DEFAULT_TEXT = '''                                                                      
+                                                     ,,    ,,         
+MMP""MM""YMM                 mm   `7MM"""YMM       `7MM    db   mm    
+P'   MM   `7                 MM     MM    `7         MM         MM    
+     MM  .gP"Ya `7M'   `MF'mmMMmm   MM   d      ,M""bMM  `7MM mmMMmm  
+     MM ,M'   Yb  `VA ,V'    MM     MMmmMM    ,AP    MM    MM   MM    
+     MM 8M""""""    XMX      MM     MM   Y  , 8MI    MM    MM   MM    
+     MM YM.    ,  ,V' VA.    MM     MM     ,M `Mb    MM    MM   MM    
+   .JMML.`Mbmmd'.AM.   .MA.  `Mbmo.JMMmmmmMMM  `Wbmd"MML..JMML. `Mbmo 
+                                                                      
+                                                                      
+
+
+Welcome to TextEdit - The permanent dark mode text editor!
+
+Click anywhere to start editing...
+'''
+SHORTCUT_MODIFIERS = 0x4 | 0x8      # Control, and Command (Alt off the Mac): keys pressed with these aren't typing
+
+# Progressive loading
+LOAD_FIRST_CHUNK = 64 * 1024        # Bytes read before the first screen is shown
+LOAD_CHUNK_SIZE = 1024 * 1024       # Bytes read per chunk afterwards
+LOAD_BATCH_CHARS = 256 * 1024       # Characters inserted into the widget per tick
+LOAD_QUEUE_CHUNKS = 16              # Decoded chunks buffered ahead of the widget
+LOAD_POLL_MS = 15
+LOAD_RESTART = object()             # Queued when a load starts over in FALLBACK_ENCODING
+
+# Encoding detection
+SNIFF_BYTES = 8 * 1024              # Bytes examined per file, however large it is
+FALLBACK_ENCODING = 'latin-1'       # Decodes any bytes, for files that turn out not to be what was sniffed
+BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32-le'),  # Checked before UTF-16 LE, whose BOM it starts with
+    (codecs.BOM_UTF32_BE, 'utf-32-be'),
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+)
+NEWLINE_NAMES = {'\n': 'LF', '\r\n': 'CRLF', '\r': 'CR'}
+
+# Large file viewer
+LARGE_FILE_THRESHOLD = 100 * 1024 * 1024  # Files above this open read-only via mmap
+LARGE_VIEW_MARGIN = 200             # Lines kept above and below the visible ones
+LARGE_VIEW_MAX_LINE = 64 * 1024     # Longer lines are shown in slices of this many bytes
+LARGE_INDEX_CHUNK = 16 * 1024 * 1024
+
+# Syntax highlighting
+SYNTAX_FRAME_BUDGET = 0.004         # Seconds of highlighting per frame, so typing stays smooth
+SYNTAX_SLICE_LINES = 500            # Lines tagged per background step
+SYNTAX_CHUNK_LINES = 2000           # Lines read from the document at a time while lexing
+
+# Saving
+SAVE_POLL_MS = 50
+
+# Undo history
+UNDO_MEMORY_BUDGET = 64 * 1024 * 1024  # Bytes of undo and redo steps kept per tab
+UNDO_MAX_STEPS = 10000              # Steps kept per tab, however small
+UNDO_MERGE_SECONDS = 1.0            # A longer pause between keystrokes starts a new step
+UNDO_COMPRESS_CHARS = 64 * 1024     # Edits with more text than this are stored compressed
+UNDO_EDIT_OVERHEAD = 120            # Rough bytes per edit besides its text
+
+# Crash-recovery journal
+JOURNAL_FLUSH_MS = 1000             # How often appended edits are flushed to disk
+JOURNAL_COMPACT_BYTES = 8 * 1024 * 1024  # Delta log size that triggers a snapshot
+
+# Settings
+CONFIG_SAVE_DELAY = 1.0             # Seconds of quiet before changed settings are written
+
+# Recent files
+STAT_WORKERS = 4                    # Threads checking recent files; a hung mount only blocks its own
+STAT_TIMEOUT = 2.0                  # Seconds before a check is reported as unavailable
+STAT_TTL = 30.0                     # Seconds a result is reused before it is checked again
+STAT_POLL_MS = 50
+
+# External changes
+WATCH_POLL_MS = 250                 # How often reported changes are picked up
+WATCH_POLL_INTERVAL = 2.0           # Seconds between checks of files inotify can't watch
+RELOAD_DIFF_LINES = 50000           # Longer differing runs are reloaded as one replacement
+IN_MODIFY = 0x00000002              # inotify event bits, from <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_CLOEXEC = 0o2000000
+WATCH_EVENTS = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+                | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+# Compare with Saved
+DIFF_FALLBACK_CELLS = 4 * 1024 * 1024  # Largest stretch without anchors handed to difflib, in line pairs
+DIFF_CONTEXT_LINES = 3              # Unchanged lines shown around each change
+DIFF_MAX_ROWS = 20000               # Rows rendered before the rest of the changes are summarized
+DIFF_POLL_MS = 50
+DIFF_REFRESH_MS = 300               # Quiet time after an edit before the view is redrawn
+
+# Follow mode
+FOLLOW_BATCH_BYTES = 1024 * 1024    # Bytes appended to the widget per tick while catching up
+FOLLOW_TAIL_BYTES = 4 * 1024 * 1024  # How much of a large file's end is shown when following it
+
+# Single instance
+INSTANCE_TIMEOUT = 2.0              # Seconds to wait on the other end of the socket
+INSTANCE_POLL_MS = 100
+INSTANCE_MAX_MESSAGE = 1024 * 1024
+
+# Find in Files
+IGNORED_DIRS = frozenset(['node_modules', '__pycache__', 'venv', 'build', 'dist', 'target'])
+FIND_FILES_BATCH = 64               # Most files per worker task; the first tasks are smaller
+FIND_FILES_BATCH_BYTES = 32 * 1024 * 1024  # Or fewer, if they add up to this
+FIND_FILES_MAX_HITS = 1000          # Matches listed per file; the rest are only counted
+FIND_FILES_PREVIEW = 200            # Bytes of a matching line shown in the results
+FIND_FILES_POLL_MS = 50
+FIND_FILES_ROWS_PER_POLL = 2000     # Results added to the list per poll, so the UI keeps up
+
+# Batch mode
+BATCH_CHUNK_FILES = 8               # Files handed to a worker process at a time
+
+# Tabs
+TAB_MEMORY_BUDGET = 256 * 1024 * 1024  # Clean inactive tabs are released beyond this
+TAB_BYTES_PER_CHAR = 3              # Rough cost of a character in the widget and document
+TAB_BYTES_PER_LINE = 120            # Rough per-line overhead of the Tk text B-tree
+
+# Piece table
+PIECE_MAX = 64 * 1024               # Longest span covered by a single piece
+ADD_CHUNK_MAX = 4 * 1024            # Typing coalesces into append-buffer chunks up to this size
+PIECE_COMPACT_LIMIT = 50000         # Pieces allowed before the table is rebuilt
+
+# Document statistics
+WORD_COUNT_SLICE = 1024 * 1024      # Characters split at a time when counting words
+
+# Search highlighting
+SEARCH_TAG_BLOCK = 1000             # Matches tagged together once the view reaches them
+SEARCH_SLICE = 1024 * 1024          # Characters scanned per step of an incremental search
+SEARCH_FRAME_BUDGET = 0.008         # Seconds a search may run before yielding to Tk
+SEARCH_CACHE_SIZE = 8               # Completed searches remembered until the next edit
+
+def sniff_encoding(head):
+    """Guess (encoding, bom, newline) from the first bytes of a file
+    
+    A BOM decides the encoding outright. Otherwise NULs in every other (or
+    three of every four) bytes mean BOM-less UTF-16 (or UTF-32), and a
+    sample that isn't valid UTF-8 is taken as Latin-1, which decodes any
+    bytes and writes them back unchanged. newline is the most common line
+    ending in the sample, or None if it has none.
+    """
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding, True, sniff_newline(head[len(bom):], encoding)
+    
+    encoding = 'utf-8'
+    if b'\0' in head:
+        size = max(len(head) // 4, 1)
+        nuls = [head[i::4].count(0) / size for i in range(4)]
+        if nuls[0] < 0.5 and nuls[1] > 0.9 and nuls[2] > 0.9 and nuls[3] > 0.9:
+            encoding = 'utf-32-le'
+        elif nuls[0] > 0.9 and nuls[1] > 0.9 and nuls[2] > 0.9 and nuls[3] < 0.5:
+            encoding = 'utf-32-be'
+        elif nuls[1] + nuls[3] > 1 and nuls[0] + nuls[2] < 0.2:
+            encoding = 'utf-16-le'
+        elif nuls[0] + nuls[2] > 1 and nuls[1] + nuls[3] < 0.2:
+            encoding = 'utf-16-be'
+    try:
+        # Not final: the sample may end part way through a character
+        codecs.getincrementaldecoder(encoding)().decode(head)
+    except UnicodeDecodeError:
+        encoding = FALLBACK_ENCODING
+    return encoding, False, sniff_newline(head, encoding)
+
+def sniff_newline(head, encoding):
+    """Most common line ending in a sample, or None if it has none"""
+    text = head.decode(encoding, errors='replace')
+    crlf = text.count('\r\n')
+    counts = {'\r\n': crlf, '\n': text.count('\n') - crlf, '\r': text.count('\r') - crlf}
+    newline = max(counts, key=counts.get)
+    return newline if counts[newline] else None
+
+def sniff_file(file_path):
+    """sniff_encoding for the start of a file"""
+    with open(file_path, 'rb') as f:
+        return sniff_encoding(f.read(SNIFF_BYTES))
+
+def read_document(file_path):
+    """A file's text as the editor would load it, and the (encoding, bom, newline) to write it back with"""
+    encoding, bom, newline = sniff_file(file_path)
+    try:
+        with open(file_path, 'r', encoding=encoding) as f:
+            text = f.read()
+    except UnicodeDecodeError:
+        # Invalid past the sniffed sample
+        encoding, bom = FALLBACK_ENCODING, False
+        with open(file_path, 'r', encoding=encoding) as f:
+            text = f.read()
+    if bom:
+        text = text[1:]
+    return text, encoding, bom, newline
+
+class FileLoader:
+    """Read and decode a file in chunks on a background thread
+    
+    The encoding and line ending are sniffed from the start of the file
+    unless an encoding is given. Bytes that don't decode further on make the
+    load start over in FALLBACK_ENCODING, queueing LOAD_RESTART so the text
+    already shown is discarded. Every line ending is read as a newline;
+    the newline attribute records which one to write back.
+    """
+    
+    def __init__(self, file_path, encoding=None):
+        self.file_path = file_path
+        if encoding is None:
+            self.encoding, self.bom, self.newline = sniff_file(file_path)
+        else:
+            self.encoding, self.bom, self.newline = encoding, False, None
+        self.total_bytes = os.path.getsize(file_path)
+        self.bytes_read = 0
+        self.error = None
+        self.chunks = queue.Queue(maxsize=LOAD_QUEUE_CHUNKS)
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+    
+    def start(self):
+        """Start reading in the background"""
+        self.thread.start()
+    
+    def cancel(self):
+        """Stop reading as soon as possible"""
+        self.cancelled.set()
+    
+    @property
+    def progress(self):
+        """Fraction of the file read so far"""
+        if not self.total_bytes:
+            return 1.0
+        return min(self.bytes_read / self.total_bytes, 1.0)
+    
+    def _put(self, item):
+        """Queue a chunk, giving up if the load is cancelled"""
+        while not self.cancelled.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+    
+    def _read(self):
+        """Decode the whole file into the queue; False if cancelled"""
+        # Universal newlines, with CRLF pairs split across chunks handled
+        decoder = io.IncrementalNewlineDecoder(
+            codecs.getincrementaldecoder(self.encoding)(), translate=True)
+        size = LOAD_FIRST_CHUNK
+        bom = self.bom
+        with open(self.file_path, 'rb') as f:
+            while not self.cancelled.is_set():
+                data = f.read(size)
+                size = LOAD_CHUNK_SIZE
+                text = decoder.decode(data, final=not data)
+                if bom and text:
+                    text = text[1:]  # The BOM itself, decoded as U+FEFF
+                    bom = False
+                self.bytes_read += len(data)
+                if text and not self._put(text):
+                    return False
+                if not data:
+                    return True
+        return False
+    
+    def _run(self):
+        """Reader thread: decode chunks and hand them to the UI"""
+        try:
+            try:
+                finished = self._read()
+            except UnicodeDecodeError:
+                if self.encoding == FALLBACK_ENCODING:
+                    raise
+                self.encoding, self.bom = FALLBACK_ENCODING, False
+                self.bytes_read = 0
+                finished = self._put(LOAD_RESTART) and self._read()
+            if not finished:
+                return
+        except Exception as e:
+            self.error = e
+        self._put(None)  # End of file (or error)
+
+def line_starts(text, base=0):
+    """Offsets just past each newline in text, counted from base, in one pass of C-level iterators"""
+    lengths = map(operator.add, map(len, text.split('\n')[:-1]), itertools.repeat(1))
+    return itertools.islice(itertools.accumulate(lengths, initial=base), 1, None)
+
+class LineIndex:
+    """Start offset of every line of a text, in an array('q') kept current through edits
+    
+    An edit moves every later line start by the same amount. Rather than
+    rewrite them all, that move is held as a pending delta for the lines
+    from `gap` on. The gap follows the edits up or down the text, rewriting
+    only the lines between the old and new position, so typing in one place
+    leaves the rest of the index alone and a run of edits in either order
+    costs one pass over the lines it spans. Lines past the gap are stored
+    less the delta, which can go below zero, hence the signed array.
+    """
+    
+    def __init__(self, text=''):
+        self.starts = array('q', [0])
+        self.starts.extend(line_starts(text))
+        self.gap = len(self.starts)  # Lines from here on start at their stored offset plus delta
+        self.delta = 0
+    
+    def __len__(self):
+        return len(self.starts)
+    
+    def __getitem__(self, line):
+        """Offset of the start of a 0-based line"""
+        start = self.starts[line]
+        return start + self.delta if line >= self.gap else start
+    
+    def line_at(self, offset):
+        """0-based line containing an offset"""
+        line = bisect.bisect_right(self.starts, offset, 0, self.gap)
+        if line < self.gap:
+            return line - 1
+        return bisect.bisect_right(self.starts, offset - self.delta, self.gap) - 1
+    
+    def _move_gap(self, line):
+        """Make line the first one the pending delta applies to"""
+        starts = self.starts
+        if self.delta and line < self.gap:
+            # Lines between take the delta on
+            starts[line:self.gap] = array('q', map((-self.delta).__add__, starts[line:self.gap]))
+        elif self.delta and line > self.gap:
+            # Lines between have it folded in
+            starts[self.gap:line] = array('q', map(self.delta.__add__, starts[self.gap:line]))
+        self.gap = line
+    
+    def insert(self, offset, text):
+        """Account for text inserted at offset"""
+        line = self.line_at(offset)
+        self._move_gap(line + 1)
+        self.delta += len(text)
+        if '\n' in text:
+            new = array('q', line_starts(text, offset))
+            self.starts[line + 1:line + 1] = new
+            self.gap += len(new)
+    
+    def delete(self, offset, removed):
+        """Account for the text removed from offset"""
+        line = self.line_at(offset)
+        self._move_gap(line + 1)
+        self.delta -= len(removed)
+        # The starts of lines inside the removed text go
+        del self.starts[line + 1:line + 1 + removed.count('\n')]
+
+class PieceTable:
+    """Document text kept as an original buffer, an append buffer and a list of pieces
+    
+    Each piece is a (buffer, start, length) tuple covering a span of the original
+    text or of a chunk of the append buffer. Pieces never exceed PIECE_MAX
+    characters, so work inside a single piece stays bounded. Piece offsets are
+    summed lazily and only recomputed from the first edited piece; line starts
+    live in a LineIndex.
+    """
+    
+    def __init__(self, text=''):
+        self.original = text
+        self.added = []           # Append buffer, as a list of chunks
+        self.pieces = list(self._split(text, 0, len(text)))
+        self.length = len(text)
+        self.lines = LineIndex(text)
+        self._starts = []         # Offset of each piece, valid for the first _valid pieces
+        self._valid = 0
+    
+    @staticmethod
+    def _split(buffer, start, length):
+        """Pieces covering a span of a buffer"""
+        end = start + length
+        while start < end:
+            size = min(PIECE_MAX, end - start)
+            yield (buffer, start, size)
+            start += size
+    
+    def __len__(self):
+        return self.length
+    
+    @property
+    def newlines(self):
+        return len(self.lines) - 1
+    
+    def _extend(self, done):
+        """Sum offsets forward one piece at a time until done(index, start) is true"""
+        pieces = self.pieces
+        starts = self._starts
+        i = self._valid
+        start = starts[i - 1] + pieces[i - 1][2] if i else 0
+        while i < len(pieces):
+            if i < len(starts):
+                starts[i] = start
+            else:
+                starts.append(start)
+            i += 1
+            self._valid = i
+            if done(i - 1, start):
+                return i - 1
+            start += pieces[i - 1][2]
+        return len(pieces)
+    
+    def _piece_at(self, offset):
+        """Index of the piece containing offset (len(pieces) at the end) and its start"""
+        valid = self._valid
+        if valid and offset < self._starts[valid - 1] + self.pieces[valid - 1][2]:
+            i = bisect.bisect_right(self._starts, offset, 0, valid) - 1
+            return i, self._starts[i]
+        i = self._extend(lambda i, start: offset < start + self.pieces[i][2])
+        return i, (self._starts[i] if i < len(self.pieces) else self.length)
+    
+    def _invalidate(self, index):
+        """Forget summed offsets from a piece onwards"""
+        self._valid = min(self._valid, index)
+    
+    def insert(self, offset, text):
+        """Insert text at a character offset"""
+        if not text:
+            return
+        offset = min(max(offset, 0), self.length)
+        i, start = self._piece_at(offset)
+        self.length += len(text)
+        self.lines.insert(offset, text)
+        
+        # Typing right after the newest append chunk extends it in place
+        if offset == start and i > 0 and self.added:
+            buffer, begin, size = self.pieces[i - 1]
+            if (buffer is self.added[-1] and begin + size == len(buffer)
+                    and len(buffer) + len(text) <= ADD_CHUNK_MAX):
+                chunk = buffer + text
+                self.added[-1] = chunk
+                self.pieces[i - 1] = (chunk, begin, size + len(text))
+                self._invalidate(i)
+                return
+        
+        self.added.append(text)
+        new = list(self._split(text, 0, len(text)))
+        if offset > start:
+            buffer, begin, size = self.pieces[i]
+            cut = offset - start
+            new.insert(0, (buffer, begin, cut))
+            new.append((buffer, begin + cut, size - cut))
+            self.pieces[i:i + 1] = new
+        else:
+            self.pieces[i:i] = new
+        self._invalidate(i)
+        self._maybe_compact()
+    
+    def delete(self, offset, length):
+        """Delete length characters at offset and return the removed text"""
+        offset = min(max(offset, 0), self.length)
+        end = min(offset + length, self.length)
+        if end <= offset:
+            return ''
+        removed = self.get_text(offset, end)
+        i, start = self._piece_at(offset)
+        j, j_start = self._piece_at(end)
+        
+        new = []
+        if offset > start:
+            buffer, begin, size = self.pieces[i]
+            new.append((buffer, begin, offset - start))
+        if j < len(self.pieces) and end > j_start:
+            buffer, begin, size = self.pieces[j]
+            cut = end - j_start
+            new.append((buffer, begin + cut, size - cut))
+            j += 1
+        self.pieces[i:j] = new
+        self.length -= len(removed)
+        self.lines.delete(offset, removed)
+        self._invalidate(i)
+        self._maybe_compact()
+        return removed
+    
+    def _maybe_compact(self):
+        """Rebuild the table once edits have fragmented it into too many pieces"""
+        if len(self.pieces) > PIECE_COMPACT_LIMIT:
+            self.__init__(self.get_text())
+    
+    def chunks(self, start=0, end=None):
+        """Yield the text between two offsets piece by piece, without joining it"""
+        end = self.length if end is None else min(end, self.length)
+        if start >= end:
+            return
+        i, piece_start = self._piece_at(start)
+        pieces = self.pieces
+        while i < len(pieces) and piece_start < end:
+            buffer, begin, size = pieces[i]
+            lo = max(start - piece_start, 0)
+            hi = min(end - piece_start, size)
+            yield buffer[begin + lo:begin + hi]
+            piece_start += size
+            i += 1
+    
+    def snapshot(self):
+        """An iterator over the whole text, piece by piece, as it is now
+        
+        Pieces and their buffers are immutable, so the iterator can be consumed on
+        another thread while the table keeps being edited.
+        """
+        pieces = list(self.pieces)
+        return (buffer[begin:begin + size] for buffer, begin, size in pieces)
+    
+    def get_text(self, start=0, end=None):
+        """Text between two offsets"""
+        return ''.join(self.chunks(start, end))
+    
+    def line_offset(self, line):
+        """Offset of the start of a 0-based line, clamped to the end of the document"""
+        if line <= 0:
+            return 0
+        if line >= len(self.lines):
+            return self.length
+        return self.lines[line]
+    
+    def offset(self, line, col):
+        """Offset of a 1-based line and 0-based column"""
+        return min(self.line_offset(line - 1) + col, self.length)
+    
+    def position(self, offset):
+        """1-based line and 0-based column of an offset"""
+        offset = min(max(offset, 0), self.length)
+        line = self.lines.line_at(offset)
+        return line + 1, offset - self.lines[line]
+
+def count_words(text):
+    """Number of whitespace-separated words, counted in bounded slices"""
+    if len(text) <= WORD_COUNT_SLICE:
+        return len(text.split())
+    words = 0
+    for start in range(0, len(text), WORD_COUNT_SLICE):
+        words += len(text[start:start + WORD_COUNT_SLICE].split())
+        # A word running across the slice boundary was counted twice
+        if start and not text[start - 1].isspace() and not text[start].isspace():
+            words -= 1
+    return words
+
+class DocumentStats:
+    """Line, word and character counts of a PieceTable, updated one edit at a time
+    
+    Words are recounted only on the lines an edit touches: newlines always
+    separate words, so the counts of untouched lines never change.
+    """
+    
+    def __init__(self, document):
+        self.document = document
+        text = document.get_text()
+        self.words = count_words(text)
+        self.whitespace = text.count(' ') + text.count('\n') + text.count('\t')
+    
+    @property
+    def chars(self):
+        return len(self.document)
+    
+    @property
+    def chars_no_spaces(self):
+        return len(self.document) - self.whitespace
+    
+    @property
+    def lines(self):
+        """Line count, not counting an empty line after a trailing newline"""
+        document = self.document
+        if not len(document):
+            return 0
+        last = document.get_text(len(document) - 1)
+        return document.newlines + (last != '\n')
+    
+    def words_around(self, start, end):
+        """Words on the lines spanning two offsets"""
+        document = self.document
+        lo = document.line_offset(document.position(start)[0] - 1)
+        hi = document.line_offset(document.position(end)[0])
+        return count_words(document.get_text(lo, hi))
+    
+    def edit(self, offset, length, text):
+        """Replace length characters at offset with text in the document and update the counts"""
+        before = self.words_around(offset, offset + length)
+        removed = self.document.delete(offset, length)
+        self.document.insert(offset, text)
+        self.words += self.words_around(offset, offset + len(text)) - before
+        self.whitespace += (text.count(' ') + text.count('\n') + text.count('\t')
+                            - removed.count(' ') - removed.count('\n') - removed.count('\t'))
+        return removed
+
+class SearchResults:
+    """Spans of every match of one search, kept sorted by offset"""
+    
+    def __init__(self, query, pattern):
+        self.query = query
+        self.pattern = pattern
+        self.starts = array('Q')
+        self.ends = array('Q')
+        self.key = (query, False, True)  # Query and options, for caching
+        self.current = -1
+        self.tagged = set()       # Blocks of SEARCH_TAG_BLOCK matches already tagged
+    
+    def __len__(self):
+        return len(self.starts)
+    
+    def add(self, start, end):
+        """Record a match after all those already found"""
+        self.starts.append(start)
+        self.ends.append(end)
+    
+    def scan(self, text, base=0, pos=0, endpos=None):
+        """Record the matches in text, which starts at offset base in the document"""
+        endpos = len(text) if endpos is None else endpos
+        for match in self.pattern.finditer(text, pos, endpos):
+            start, end = match.span()
+            if end > start:
+                self.add(base + start, base + end)
+    
+    def apply_edit(self, document, offset, removed, inserted):
+        """Rescan only the lines an edit touched and shift the matches after them
+        
+        Returns the range of match numbers found on those lines and whether
+        the numbering of the matches after them changed.
+        """
+        delta = inserted - removed
+        lo = document.line_offset(document.position(offset)[0] - 1)
+        hi = document.line_offset(document.position(offset + inserted)[0])
+        first = bisect.bisect_right(self.ends, lo)
+        last = bisect.bisect_left(self.starts, hi - delta)
+        
+        found = SearchResults(self.query, self.pattern)
+        found.scan(document.get_text(lo, hi), lo)
+        shift = itertools.repeat(delta)
+        self.starts = self.starts[:first] + found.starts + array('Q', map(operator.add, self.starts[last:], shift))
+        self.ends = self.ends[:first] + found.ends + array('Q', map(operator.add, self.ends[last:], shift))
+        self.current = -1
+        return range(first, first + len(found)), len(found) != last - first
+    
+    def between(self, start, end):
+        """Range of match numbers overlapping two offsets"""
+        return range(bisect.bisect_right(self.ends, start), bisect.bisect_left(self.starts, end))
+    
+    def next_match(self, offset):
+        """Number of the first match starting at or after offset, wrapping around"""
+        if not self.starts:
+            return -1
+        return bisect.bisect_left(self.starts, offset) % len(self.starts)
+    
+    def previous_match(self, offset):
+        """Number of the last match starting before offset, wrapping around"""
+        if not self.starts:
+            return -1
+        return (bisect.bisect_left(self.starts, offset) - 1) % len(self.starts)
+
+def search_pattern(query, regex=False, match_case=False):
+    """Compile a find bar query; raises re.error for a bad regular expression"""
+    flags = 0 if match_case else re.IGNORECASE
+    if regex:
+        return re.compile(query, flags | re.MULTILINE)  # ^ and $ match at every line
+    return re.compile(re.escape(query), flags)
+
+def can_narrow(previous, query, match_case=False):
+    """Whether the matches of literal query are a subset of those of the previous query
+    
+    That holds when query extends previous, unless previous can overlap itself:
+    then a non-overlapping scan may have skipped a position query matches at.
+    """
+    if not match_case:
+        previous = previous.lower()
+        query = query.lower()
+    if not previous or not query.startswith(previous):
+        return False
+    return not any(previous[:k] == previous[-k:] for k in range(1, len(previous)))
+
+class IncrementalSearch:
+    """Search over a PieceTable that runs in time-boxed steps
+    
+    Regular expression matches are found within slices that end on a line
+    boundary, so a match spanning two slices is not found.
+    """
+    
+    def __init__(self, document, query, previous=None, regex=False, match_case=False):
+        self.document = document
+        self.results = SearchResults(query, search_pattern(query, regex, match_case))
+        self.results.key = (query if match_case else query.lower(), regex, match_case)
+        self.regex = regex
+        self.pos = 0              # Next offset (or candidate number) to look at
+        self.end = 0              # End of the last match, so matches never overlap
+        self.candidates = None
+        if (previous is not None and not regex and previous.key[1:] == (False, match_case)
+                and can_narrow(previous.query, query, match_case)):
+            self.candidates = previous.starts
+        self.done = False
+    
+    @property
+    def progress(self):
+        total = len(self.candidates) if self.candidates is not None else len(self.document)
+        return self.pos / total if total else 1.0
+    
+    def step(self, budget=SEARCH_FRAME_BUDGET):
+        """Search until done or out of time, returning whether the search finished"""
+        deadline = time.perf_counter() + budget
+        results = self.results
+        size = len(results.query)
+        while not self.done and time.perf_counter() < deadline:
+            if self.candidates is not None:
+                # Narrowing: only positions where the shorter query matched can match
+                for start in self.candidates[self.pos:self.pos + 1000]:
+                    if start >= self.end and results.pattern.fullmatch(self.document.get_text(start, start + size)):
+                        results.add(start, start + size)
+                        self.end = start + size
+                self.pos = min(self.pos + 1000, len(self.candidates))
+                self.done = self.pos >= len(self.candidates)
+            elif self.regex:
+                # Scan a slice cut at a line boundary
+                end = self.document.line_offset(self.document.position(self.pos + SEARCH_SLICE)[0])
+                results.scan(self.document.get_text(self.pos, end), self.pos)
+                self.pos = end
+                self.done = self.pos >= len(self.document)
+            else:
+                # Scan a slice, overlapping the next one by the length of a match
+                text = self.document.get_text(self.pos, self.pos + SEARCH_SLICE + size - 1)
+                count = len(results)
+                results.scan(text, self.pos, max(self.end - self.pos, 0), len(text))
+                # Keep only matches starting inside this slice; the next slice finds the rest
+                while len(results) > count and results.starts[-1] >= self.pos + SEARCH_SLICE:
+                    results.starts.pop()
+                    results.ends.pop()
+                if len(results) > count:
+                    self.end = results.ends[-1]
+                self.pos += SEARCH_SLICE
+                self.done = self.pos >= len(self.document)
+        return self.done
+
+def replacements(pattern, text, template, regex=False, base=0):
+    """(start, end, replacement) for every match in text, which starts at offset base
+    
+    With regex, template may refer to groups like re.sub: \\1 or \\g<name>.
+    """
+    for match in pattern.finditer(text):
+        start, end = match.span()
+        yield base + start, base + end, match.expand(template) if regex else template
+
+def replaced_text(text, changes, base=0):
+    """text, which starts at offset base, with sorted (start, end, replacement) changes made, from the first change to the last"""
+    parts = []
+    pos = changes[0][0]
+    for start, end, replacement in changes:
+        parts.append(text[pos - base:start - base])
+        parts.append(replacement)
+        pos = end
+    return ''.join(parts)
+
+class PythonLexer:
+    """Tokenize Python a line at a time; the state between lines is an open triple quote"""
+    
+    KEYWORDS = frozenset(keyword.kwlist)
+    BUILTINS = frozenset(name for name in dir(builtins) if not name.startswith('_'))
+    
+    token = re.compile(r'''
+        (?P<comment>\#.*)
+      | (?P<triple>[rRbBuUfF]{0,2}(?:'{3}|"{3}))
+      | (?P<string>[rRbBuUfF]{0,2}(?:'(?:\\.|[^'\\])*'?|"(?:\\.|[^"\\])*"?))
+      | (?P<decorator>(?<![\w)\]])@[\w.]+)
+      | (?P<number>(?<![\w.])(?:0[xXoObB][\da-fA-F_]+|\d[\d_]*\.?[\d_]*(?:[eE][+-]?\d+)?[jJ]?|\.\d[\d_]*(?:[eE][+-]?\d+)?[jJ]?))
+      | (?P<name>[^\W\d]\w*)
+    ''', re.VERBOSE)
+    closers = {
+        1: re.compile(r"(?:[^\\]|\\.)*?'''"),
+        2: re.compile(r'(?:[^\\]|\\.)*?"""'),
+    }
+    
+    def tokens(self, line, state=0):
+        """(start, end, kind) spans of a line without its newline, and the state after it"""
+        spans = []
+        pos = 0
+        if state:
+            match = self.closers[state].match(line)
+            if match is None:
+                return [(0, len(line), 'string')], state
+            spans.append((0, match.end(), 'string'))
+            pos = match.end()
+        
+        previous = None
+        while True:
+            match = self.token.search(line, pos)
+            if match is None:
+                return spans, 0
+            kind = match.lastgroup
+            start, pos = match.span()
+            if kind == 'triple':
+                state = 1 if match.group().endswith("'") else 2
+                close = self.closers[state].match(line, pos)
+                if close is None:
+                    spans.append((start, len(line), 'string'))
+                    return spans, state
+                pos = close.end()
+                kind = 'string'
+            elif kind == 'name':
+                word = match.group()
+                if previous in ('def', 'class'):
+                    kind = 'definition'
+                elif word in self.KEYWORDS:
+                    kind = 'keyword'
+                elif word in self.BUILTINS:
+                    kind = 'builtin'
+                else:
+                    kind = None
+                previous = word
+            if kind:
+                spans.append((start, pos, kind))
+
+class MarkdownLexer:
+    """Tokenize Markdown a line at a time; the state between lines is an open code fence"""
+    
+    fence = re.compile(r' {0,3}(```|~~~)')
+    block = re.compile(r'(?P<heading> {0,3}#{1,6}(?:\s.*)?$)|(?P<quote> {0,3}>.*)|(?P<list>\s*(?:[-*+]|\d+[.)])(?=\s))')
+    inline = re.compile(r"""
+        (?P<code>`[^`]+`)
+      | (?P<link>!?\[[^\]]*\]\([^)]*\))
+      | (?P<emphasis>\*\*[^*]+\*\*|__[^_]+__|\*[^*\s][^*]*\*|(?<!\w)_[^_\s][^_]*_(?!\w))
+    """, re.VERBOSE)
+    FENCES = {'```': 1, '~~~': 2}
+    
+    def tokens(self, line, state=0):
+        """(start, end, kind) spans of a line without its newline, and the state after it"""
+        match = self.fence.match(line)
+        if state:
+            if match and self.FENCES[match.group(1)] == state:
+                state = 0
+            return [(0, len(line), 'code')], state
+        if match:
+            return [(0, len(line), 'code')], self.FENCES[match.group(1)]
+        
+        spans = []
+        pos = 0
+        match = self.block.match(line)
+        if match:
+            if match.lastgroup != 'list':
+                return [(0, len(line), match.lastgroup)], 0
+            spans.append((match.start('list'), match.end(), 'list'))
+            pos = match.end()
+        for match in self.inline.finditer(line, pos):
+            spans.append((match.start(), match.end(), match.lastgroup))
+        return spans, 0
+
+LEXERS = {
+    '.py': PythonLexer,
+    '.pyw': PythonLexer,
+    '.md': MarkdownLexer,
+    '.markdown': MarkdownLexer,
+}
+
+class SyntaxHighlighter:
+    """Per-line lexer states for a document, kept valid across edits by re-lexing until they converge
+    
+    states[i] is the lexer state at the start of line i, and lines below
+    `valid` have their real one. Beyond that a state may be stale or a
+    guess used to tag the view early; trusted[i] records that states[i]
+    is what lexing line i - 1 from states[i - 1] gives, so once re-lexing
+    reproduces a stored state, the states up to the next untrusted line
+    are real without being lexed again. tagged[i] is 1 once line i is
+    tagged from its real state, 2 if it was tagged from a guess that
+    still stands, and 0 if it needs tagging.
+    """
+    
+    def __init__(self, document, lexer):
+        self.document = document
+        self.lexer = lexer
+        self.line_count = document.newlines + 1
+        self.states = array('B', bytes(self.line_count))
+        self.trusted = bytearray(self.line_count)
+        self.tagged = bytearray(self.line_count)
+        self.trusted[0] = 1
+        self.valid = 1
+    
+    @property
+    def complete(self):
+        return self.valid >= self.line_count and self.tagged.find(0) < 0
+    
+    def edit(self, start, end):
+        """Account for an edit that left offsets start to end of the text changed"""
+        first = self.document.position(start)[0] - 1
+        last = self.document.position(end)[0] - 1
+        count = self.document.newlines + 1
+        old_last = last - (count - self.line_count)
+        
+        # Line first keeps its start state; the lines after it up to last are new
+        self.states[first + 1:old_last + 1] = array('B', bytes(last - first))
+        self.trusted[first + 1:old_last + 1] = bytes(last - first)
+        self.tagged[first:old_last + 1] = bytes(last - first + 1)
+        self.line_count = count
+        if last + 1 < count:
+            self.trusted[last + 1] = 0
+        self.valid = min(self.valid, first + 1)
+    
+    def _lines(self, first, last):
+        """Text of lines first to last, without newlines"""
+        document = self.document
+        end = document.line_offset(last + 1) - 1 if last + 1 < self.line_count else len(document)
+        return document.get_text(document.line_offset(first), end).split('\n')
+    
+    def _set_state(self, line, state):
+        """Store a new start state for a line, which invalidates its tags and its successor's state"""
+        self.states[line] = state
+        self.tagged[line] = 0
+        self.trusted[line] = 1
+        if line + 1 < self.line_count:
+            self.trusted[line + 1] = 0
+    
+    def advance(self, limit, deadline=None):
+        """Find the real states up to line limit; False if the deadline came first"""
+        tokens = self.lexer.tokens
+        while self.valid <= limit and self.valid < self.line_count:
+            first = self.valid - 1
+            last = min(first + SYNTAX_CHUNK_LINES, self.line_count - 2)
+            for line, text in enumerate(self._lines(first, last), first):
+                if deadline and not line % 256 and line > first and time.perf_counter() > deadline:
+                    return False
+                following = line + 1
+                state = tokens(text, self.states[line])[1]
+                if self.states[following] == state:
+                    # Converged: every trusted state after this one is real too
+                    end = self.trusted.find(0, following + 1)
+                    if end < 0:
+                        end = self.line_count
+                    self.trusted[following] = 1
+                    self.tagged[following:end] = self.tagged[following:end].replace(b'\x02', b'\x01')
+                    self.valid = end
+                    if end > following + 1:
+                        break
+                    continue
+                self._set_state(following, state)
+                self.valid = following + 1
+        return True
+    
+    def untagged(self, first, last):
+        """Runs (first, last) of the lines in a range that need tagging"""
+        runs = []
+        last = min(last, self.line_count - 1)
+        line = self.tagged.find(0, first, last + 1)
+        while line >= 0:
+            end = line
+            while end < last and not self.tagged[end + 1]:
+                end += 1
+            runs.append((line, end))
+            line = self.tagged.find(0, end + 1, last + 1)
+        return runs
+    
+    def spans(self, first, last):
+        """(line, start, end, kind) spans of lines first to last, marking them tagged
+        
+        Lines past the valid ones are lexed from their current guess, which
+        also becomes the guess for the line after.
+        """
+        tokens = self.lexer.tokens
+        result = []
+        for line, text in enumerate(self._lines(first, last), first):
+            line_spans, state = tokens(text, self.states[line])
+            result.extend((line, start, end, kind) for start, end, kind in line_spans)
+            self.tagged[line] = 1 if line < self.valid else 2
+            following = line + 1
+            if self.valid <= following < self.line_count:
+                if self.states[following] != state:
+                    self._set_state(following, state)
+                else:
+                    self.trusted[following] = 1
+        return result
+
+def default_file_mode():
+    """Permissions a newly created file gets under the current umask"""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+def atomic_write(file_path, chunks, encoding='utf-8', mode=None, progress=None, newline=None):
+    """Stream text chunks to a temporary file beside file_path, fsync it and rename it over file_path
+    
+    The target keeps its permissions (or gets mode if it is new), and a crash
+    part way through leaves the original file untouched.
+    """
+    target = os.path.realpath(file_path)
+    directory = os.path.dirname(target)
+    try:
+        info = os.stat(target)
+    except FileNotFoundError:
+        info = None
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(target)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding=encoding, newline=newline) as f:
+            for chunk in chunks:
+                f.write(chunk)
+                if progress:
+                    progress(len(chunk))
+            f.flush()
+            os.fsync(f.fileno())
+        if info is not None:
+            os.chmod(temp_path, stat.S_IMODE(info.st_mode))
+            try:
+                os.chown(temp_path, info.st_uid, info.st_gid)
+            except (AttributeError, OSError):
+                pass  # Not permitted (or not POSIX); the file is ours now
+        elif mode is not None:
+            os.chmod(temp_path, mode)
+        os.replace(temp_path, target)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+    
+    # Make the rename itself durable
+    if hasattr(os, 'O_DIRECTORY'):
+        try:
+            dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        except OSError:
+            pass
+
+class SaveJob:
+    """Write a document snapshot with atomic_write on a worker thread"""
+    
+    def __init__(self, file_path, chunks, total_chars, encoding='utf-8', version=None, newline=None):
+        self.file_path = file_path
+        self.chunks = chunks
+        self.total_chars = total_chars
+        self.encoding = encoding
+        self.newline = newline
+        self.version = version    # Caller's document version when the snapshot was taken
+        self.mode = default_file_mode()  # os.umask is process-wide, so read it here
+        self.written = 0
+        self.error = None
+        # Not a daemon: a save still running at exit is allowed to finish
+        self.thread = threading.Thread(target=self.run)
+    
+    @property
+    def progress(self):
+        return self.written / self.total_chars if self.total_chars else 1.0
+    
+    @property
+    def done(self):
+        return not self.thread.is_alive()
+    
+    def start(self):
+        self.thread.start()
+    
+    def wait(self):
+        self.thread.join()
+    
+    def run(self):
+        """Write the file, recording any error for the UI thread"""
+        try:
+            atomic_write(self.file_path, self.chunks, self.encoding, self.mode, self._advance, self.newline)
+        except Exception as e:
+            self.error = e
+    
+    def _advance(self, chars):
+        self.written += chars
+
+class UndoStep:
+    """One undoable action: [offset, removed, inserted] edits, in the order they were made"""
+    
+    def __init__(self, serial):
+        self.serial = serial
+        self.edits = []
+        self.size = 0
+        self.time = time.monotonic()
+        self.typing = True        # Only keystroke-sized edits so far, so more may be merged in
+    
+    def add(self, offset, removed, inserted):
+        self.edits.append([offset, removed, inserted])
+        self.size += UNDO_EDIT_OVERHEAD + sys.getsizeof(removed) + sys.getsizeof(inserted)
+        self.typing = self.typing and len(removed) + len(inserted) == 1 and '\n' not in inserted
+    
+    def merge(self, offset, removed, inserted):
+        """Extend the last edit with a keystroke that continues it; False if it doesn't"""
+        if not self.typing or len(removed) + len(inserted) != 1 or inserted == '\n' \
+                or time.monotonic() - self.time > UNDO_MERGE_SECONDS:
+            return False
+        last = self.edits[-1]
+        last_offset, last_removed, last_inserted = last
+        if inserted and not last_removed and offset == last_offset + len(last_inserted) \
+                and not (last_inserted[-1].isspace() and not inserted.isspace()):
+            last[2] = last_inserted + inserted      # Typing, up to the start of the next word
+        elif removed and not last_inserted and offset + 1 == last_offset:
+            last[0], last[1] = offset, removed + last_removed  # Backspace
+        elif removed and not last_inserted and offset == last_offset:
+            last[1] = last_removed + removed        # Forward delete
+        else:
+            return False
+        self.size += 1
+        self.time = time.monotonic()
+        return True
+    
+    def compact(self):
+        """Compress the text of large edits, once the step is complete"""
+        self.size = 0
+        for edit in self.edits:
+            for i in (1, 2):
+                if isinstance(edit[i], str) and len(edit[i]) >= UNDO_COMPRESS_CHARS:
+                    edit[i] = zlib.compress(edit[i].encode('utf-8', 'surrogatepass'), 1)
+            self.size += UNDO_EDIT_OVERHEAD + sys.getsizeof(edit[1]) + sys.getsizeof(edit[2])
+        self.typing = False
+    
+    def texts(self):
+        """The edits as (offset, removed, inserted) with any compressed text restored"""
+        for offset, removed, inserted in self.edits:
+            if isinstance(removed, bytes):
+                removed = zlib.decompress(removed).decode('utf-8', 'surrogatepass')
+            if isinstance(inserted, bytes):
+                inserted = zlib.decompress(inserted).decode('utf-8', 'surrogatepass')
+            yield offset, removed, inserted
+
+class UndoHistory:
+    """Undo and redo stacks of a document, bounded by a memory budget and a step count
+    
+    record() is given every edit. Edits made in one event-loop turn, such as
+    a paste over a selection or a Replace All, form one step until
+    end_turn(); consecutive keystrokes are merged into a step per word.
+    Large edits are stored as compressed deltas, and the oldest steps are
+    dropped when the history grows past its limits. saved tracks the step
+    the file was last saved at, so undoing back to it leaves the document
+    unmodified.
+    """
+    
+    def __init__(self, budget=UNDO_MEMORY_BUDGET, max_steps=UNDO_MAX_STEPS):
+        self.budget = budget
+        self.max_steps = max_steps
+        self.undo_steps = collections.deque()
+        self.redo_steps = []
+        self.current = None       # The step edits are going into, while it is open
+        self.in_turn = False      # Edits since the last end_turn() join the current step
+        self.serial = 0
+        self.saved = 0            # Serial of the newest undo step at the last save; 0 is empty
+        self.memory = 0
+        self.applying = False     # Set while undoing or redoing, whose edits aren't recorded
+    
+    def reset(self):
+        """Forget all steps, for instance after loading a file"""
+        self.undo_steps.clear()
+        self.redo_steps.clear()
+        self.current = None
+        self.in_turn = False
+        self.saved = 0
+        self.memory = 0
+    
+    def record(self, offset, removed, inserted):
+        """Add an edit to the current step, merge it in as typing, or start a step with it"""
+        if self.applying:
+            return
+        if self.redo_steps:
+            if any(step.serial == self.saved for step in self.redo_steps):
+                self.saved = -1   # The saved state can't be reached any more
+            self.memory -= sum(step.size for step in self.redo_steps)
+            self.redo_steps.clear()
+        step = self.current
+        if step is not None and not self.in_turn and step.merge(offset, removed, inserted):
+            self.memory += 1
+            return
+        if step is None or not self.in_turn:
+            self.close()
+            self.serial += 1
+            step = self.current = UndoStep(self.serial)
+            self.undo_steps.append(step)
+        self.memory -= step.size
+        step.add(offset, removed, inserted)
+        self.memory += step.size
+        self.in_turn = True
+    
+    def end_turn(self):
+        """The event-loop turn is over; later edits start a new step unless they continue typing"""
+        self.in_turn = False
+        if self.current is not None and not self.current.typing:
+            self.close()          # Nothing can be merged into it, so compact it now
+        else:
+            self.trim()
+    
+    def close(self):
+        """Stop merging into the current step and compact it"""
+        step, self.current = self.current, None
+        self.in_turn = False
+        if step is not None:
+            self.memory -= step.size
+            step.compact()
+            self.memory += step.size
+        self.trim()
+    
+    def trim(self):
+        """Drop the oldest steps, then far redo steps, until the history is within its limits"""
+        while self.undo_steps and (self.memory > self.budget or len(self.undo_steps) > self.max_steps):
+            step = self.undo_steps.popleft()
+            self.memory -= step.size
+            if step is self.current:
+                self.current = None
+            # The oldest state left is now the one after this step
+            if self.saved == 0:
+                self.saved = -1
+            elif self.saved == step.serial:
+                self.saved = 0
+        while self.redo_steps and self.memory > self.budget:
+            step = self.redo_steps.pop(0)
+            self.memory -= step.size
+            if step.serial == self.saved:
+                self.saved = -1
+    
+    def undo(self):
+        """The step to undo, moved onto the redo stack; None if there is none"""
+        self.close()
+        if not self.undo_steps:
+            return None
+        step = self.undo_steps.pop()
+        self.redo_steps.append(step)
+        return step
+    
+    def redo(self):
+        """The step to redo, moved back onto the undo stack; None if there is none"""
+        self.close()
+        if not self.redo_steps:
+            return None
+        step = self.redo_steps.pop()
+        self.undo_steps.append(step)
+        return step
+    
+    def mark_saved(self):
+        """Record the current state as the one on disk"""
+        self.close()
+        self.saved = self.undo_steps[-1].serial if self.undo_steps else 0
+    
+    @property
+    def at_saved(self):
+        """Whether undo and redo have returned to the saved state"""
+        return self.saved == (self.undo_steps[-1].serial if self.undo_steps else 0)
+
+class EditJournal:
+    """Append-only log of a buffer's edits since it was last clean, for crash recovery
+    
+    Each buffer gets a directory holding meta.json, which describes what the
+    buffer started from (a file on disk or nothing), and numbered generations:
+    deltas-N.log replays on top of snapshot-N.txt, or on top of the base for
+    N = 0, followed by any later deltas files. Compaction writes the next
+    snapshot in the background and starts a new deltas file straight away, so
+    a crash part way through still leaves a complete chain.
+    """
+    
+    def __init__(self, root_dir):
+        self.root_dir = Path(root_dir)
+        self.dir = None
+        self.base = {'file': None}
+        self.log = None           # Open deltas file, once the first edit is recorded
+        self.generation = 0
+        self.log_bytes = 0
+        self.compaction = None    # SaveJob writing the next snapshot
+    
+    def reset(self, file_path=None, encoding='utf-8', bom=False, newline=None):
+        """Mark the buffer clean: it now matches file_path on disk, or is empty"""
+        self.discard()
+        self.base = {'file': None}
+        if file_path:
+            info = os.stat(file_path)
+            self.base = {
+                'file': str(Path(file_path).resolve()),
+                'size': info.st_size,
+                'mtime_ns': info.st_mtime_ns,
+                'encoding': encoding,
+                'bom': bom,
+                'newline': newline
+            }
+    
+    def record(self, offset, length, text):
+        """Append one edit: length characters at offset replaced with text"""
+        if self.log is None:
+            self._start()
+        line = json.dumps([offset, length, text], ensure_ascii=False, separators=(',', ':'))
+        self.log.write(line + '\n')
+        self.log_bytes += len(line) + 1
+    
+    def flush(self):
+        """Hand buffered records to the OS"""
+        if self.log is not None:
+            self.log.flush()
+    
+    def _start(self):
+        """Create the journal directory on the first edit since the buffer was clean"""
+        self.dir = self.root_dir / uuid.uuid4().hex
+        self.dir.mkdir(parents=True)
+        self._write_meta()
+        self._open_log(0)
+    
+    def _write_meta(self):
+        meta = dict(self.base, pid=os.getpid())
+        atomic_write(self.dir / 'meta.json', [json.dumps(meta)])
+    
+    def _open_log(self, generation):
+        if self.log is not None:
+            self.log.close()
+        self.generation = generation
+        path = self.dir / f'deltas-{generation}.log'
+        self.log = open(path, 'a', encoding='utf-8')
+        self.log_bytes = path.stat().st_size
+    
+    @property
+    def needs_compaction(self):
+        return self.log_bytes > JOURNAL_COMPACT_BYTES and self.compaction is None
+    
+    def compact(self, chunks, total_chars):
+        """Start snapshotting the document; later edits go to the next generation"""
+        generation = self.generation + 1
+        self._open_log(generation)
+        self.compaction = SaveJob(self.dir / f'snapshot-{generation}.txt', chunks, total_chars, newline='')
+        self.compaction.generation = generation
+        self.compaction.start()
+    
+    def finish_compaction(self):
+        """Drop the generations a completed snapshot has made redundant"""
+        job = self.compaction
+        if job is None or not job.done:
+            return
+        self.compaction = None
+        if job.error or self.dir is None:
+            return  # Keep replaying from the older generations
+        for path in self.dir.glob('*-*.*'):
+            number = path.stem.rsplit('-', 1)[-1]
+            if number.isdigit() and int(number) < job.generation:
+                path.unlink()
+    
+    def discard(self):
+        """Delete the journal, e.g. once the buffer has been saved"""
+        if self.compaction is not None:
+            self.compaction.wait()
+            self.compaction = None
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+        if self.dir is not None:
+            shutil.rmtree(self.dir, ignore_errors=True)
+            self.dir = None
+        self.generation = 0
+        self.log_bytes = 0
+    
+    def adopt(self, journal_dir):
+        """Continue a recovered journal, whose edits the buffer now holds"""
+        self.discard()
+        self.dir = Path(journal_dir)
+        meta = json.loads((self.dir / 'meta.json').read_text(encoding='utf-8'))
+        self.base = {key: meta[key] for key in ('file', 'size', 'mtime_ns', 'encoding', 'bom', 'newline') if key in meta}
+        self._write_meta()
+        self._open_log(max(EditJournal._generations(self.dir, 'deltas'), default=0))
+        if self.log_bytes:
+            with open(self.dir / f'deltas-{self.generation}.log', 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read() != b'\n':
+                    self.log.write('\n')  # Don't extend a record torn by the crash
+    
+    @staticmethod
+    def _generations(journal_dir, kind):
+        numbers = (path.stem.rsplit('-', 1)[-1] for path in Path(journal_dir).glob(f'{kind}-*.*'))
+        return sorted(int(number) for number in numbers if number.isdigit())
+    
+    @staticmethod
+    def pending(root_dir):
+        """Journals left behind by processes that are no longer running, newest first"""
+        found = []
+        for journal_dir in Path(root_dir).glob('*'):
+            try:
+                meta = json.loads((journal_dir / 'meta.json').read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                continue
+            if os.name == 'posix' and meta.get('pid') != os.getpid():
+                try:
+                    os.kill(meta.get('pid', 0), 0)
+                    continue  # Still running: another window's journal
+                except ProcessLookupError:
+                    pass
+                except (PermissionError, OverflowError, TypeError):
+                    continue
+            logs = list(journal_dir.glob('deltas-*.log'))
+            modified = max((path.stat().st_mtime for path in logs), default=0)
+            found.append((modified, journal_dir, meta))
+        return [(journal_dir, meta, modified) for modified, journal_dir, meta in sorted(found, key=operator.itemgetter(0), reverse=True)]
+    
+    @staticmethod
+    def replay(journal_dir):
+        """Rebuild a journaled buffer's text; raises ValueError if its base file changed"""
+        journal_dir = Path(journal_dir)
+        meta = json.loads((journal_dir / 'meta.json').read_text(encoding='utf-8'))
+        snapshots = EditJournal._generations(journal_dir, 'snapshot')
+        start = snapshots[-1] if snapshots else 0
+        if start:
+            with open(journal_dir / f'snapshot-{start}.txt', encoding='utf-8', newline='') as f:
+                text = f.read()
+        elif meta.get('size') is not None:
+            info = os.stat(meta['file'])
+            if (info.st_size, info.st_mtime_ns) != (meta['size'], meta['mtime_ns']):
+                raise ValueError(f"{meta['file']} has changed since the journal was started")
+            with open(meta['file'], encoding=meta.get('encoding', 'utf-8')) as f:
+                text = f.read()
+            if meta.get('bom'):
+                text = text[1:]
+        else:
+            text = ''
+        
+        document = PieceTable(text)
+        for generation in EditJournal._generations(journal_dir, 'deltas'):
+            if generation < start:
+                continue
+            with open(journal_dir / f'deltas-{generation}.log', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        offset, length, inserted = json.loads(line)
+                    except ValueError:
+                        continue  # Torn by a crash; a recovered journal resumes on the next line
+                    document.delete(offset, length)
+                    document.insert(offset, inserted)
+        return meta, document.get_text()
+
+class MappedFile:
+    """Read-only memory map of a file with a line-offset index built in the background"""
+    
+    def __init__(self, file_path, encoding='utf-8'):
+        self.file_path = file_path
+        self.encoding = encoding
+        self.file = open(file_path, 'rb')
+        try:
+            self.size = os.fstat(self.file.fileno()).st_size
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self.file.close()
+            raise
+        self.line_starts = array('Q', [0])
+        self.indexed_bytes = 0
+        self.closed = False
+        self.thread = threading.Thread(target=self._build_index, daemon=True)
+        self.thread.start()
+    
+    @property
+    def index_complete(self):
+        """Whether every line start is known"""
+        return self.indexed_bytes >= self.size
+    
+    def _build_index(self):
+        """Index thread: record the offset following every newline"""
+        try:
+            pos = 0
+            while pos < self.size and not self.closed:
+                data = self.map[pos:pos + LARGE_INDEX_CHUNK]
+                # Line lengths plus one for the newline, summed from the chunk offset
+                lengths = map(operator.add, map(len, data.split(b'\n')[:-1]), itertools.repeat(1))
+                self.line_starts.extend(itertools.islice(itertools.accumulate(lengths, initial=pos), 1, None))
+                pos += len(data)
+                self.indexed_bytes = pos
+        except (ValueError, OSError):
+            pass  # Closed while indexing
+    
+    def close(self):
+        """Release the mapping"""
+        self.closed = True
+        self.thread.join()
+        self.map.close()
+        self.file.close()
+    
+    def line_start(self, offset):
+        """Offset of the start of the line containing offset"""
+        floor = max(0, offset - LARGE_VIEW_MAX_LINE)
+        newline = self.map.rfind(b'\n', floor, offset)
+        if newline >= 0:
+            return newline + 1
+        return 0 if floor == 0 else offset
+    
+    def next_line(self, offset):
+        """Offset of the line after the one starting at offset"""
+        end = min(self.size, offset + LARGE_VIEW_MAX_LINE)
+        newline = self.map.find(b'\n', offset, end)
+        return newline + 1 if newline >= 0 else end
+    
+    def previous_line(self, offset):
+        """Offset of the line before the one starting at offset"""
+        return self.line_start(max(0, offset - 1)) if offset > 0 else 0
+    
+    def read_lines(self, offset, count):
+        """Decode up to count lines from offset, returning their texts and start offsets"""
+        lines = []
+        starts = []
+        while len(lines) < count and offset < self.size:
+            end = self.next_line(offset)
+            lines.append(self.map[offset:end].rstrip(b'\r\n').decode(self.encoding, errors='replace'))
+            starts.append(offset)
+            offset = end
+        return lines, starts
+    
+    def line_number(self, offset):
+        """1-based line number of offset, or None while the index is still short of it"""
+        if offset > self.indexed_bytes and not self.index_complete:
+            return None
+        return bisect.bisect_right(self.line_starts, offset)
+    
+    def line_offset(self, line):
+        """Offset of a 1-based line, or None if it is not indexed (yet)"""
+        if 1 <= line <= len(self.line_starts):
+            return self.line_starts[line - 1]
+        return None
+    
+    def find(self, pattern, start):
+        """Find a compiled bytes pattern from start, wrapping around once"""
+        match = pattern.search(self.map, start) or pattern.search(self.map, 0, start)
+        return match.span() if match else None
+
+class LargeFileViewer:
+    """Show a window of a MappedFile in a Text widget, swapping lines in as the user scrolls"""
+    
+    def __init__(self, text, scrollbar, mapped, visible_lines=60):
+        self.text = text
+        self.scrollbar = scrollbar
+        self.mapped = mapped
+        self.window_lines = visible_lines + 2 * LARGE_VIEW_MARGIN
+        self.starts = []          # Byte offset of each line in the widget
+        self.search_text = None   # Text highlighted in the window
+        self.recenter_pending = False
+        
+        self.saved_yscroll = text['yscrollcommand']
+        self.saved_scroll = scrollbar['command']
+        text.config(yscrollcommand=self.on_text_scrolled)
+        scrollbar.config(command=self.on_scrollbar)
+        self.render(0)
+    
+    def close(self):
+        """Restore the widget and release the file"""
+        self.text.config(yscrollcommand=self.saved_yscroll, state=tk.NORMAL)
+        self.scrollbar.config(command=self.saved_scroll)
+        self.text.delete(1.0, tk.END)
+        self.mapped.close()
+    
+    def render(self, offset, top_line=0):
+        """Fill the widget with the window starting at offset and scroll to top_line within it"""
+        lines, self.starts = self.mapped.read_lines(offset, self.window_lines)
+        self.text.config(state=tk.NORMAL)
+        self.text.delete(1.0, tk.END)
+        self.text.insert(1.0, '\n'.join(lines))
+        self.highlight_window(lines)
+        self.text.config(state=tk.DISABLED)
+        self.text.yview(f"{top_line + 1}.0")
+    
+    def highlight_window(self, lines):
+        """Tag matches of the current search inside the window"""
+        if not self.search_text:
+            return
+        pattern = re.compile(re.escape(self.search_text), re.IGNORECASE)
+        for number, line in enumerate(lines, 1):
+            for match in pattern.finditer(line):
+                self.text.tag_add("found", f"{number}.{match.start()}", f"{number}.{match.end()}")
+    
+    def visible_offset(self):
+        """Byte offset of the first visible line"""
+        line = int(self.text.index('@0,0').split('.')[0])
+        return self.starts[line - 1] if self.starts else 0
+    
+    def offset_at(self, index):
+        """Byte offset of a widget index"""
+        line, col = map(int, self.text.index(index).split('.'))
+        if not self.starts:
+            return 0
+        line = min(line, len(self.starts))
+        prefix = self.text.get(f"{line}.0", f"{line}.{col}")
+        return self.starts[line - 1] + len(prefix.encode(self.mapped.encoding, errors='replace'))
+    
+    def jump_to(self, offset):
+        """Show the line containing offset at the top of the view"""
+        target = self.mapped.line_start(min(max(offset, 0), self.mapped.size))
+        start = target
+        above = 0
+        while above < LARGE_VIEW_MARGIN and start > 0:
+            start = self.mapped.previous_line(start)
+            above += 1
+        self.render(start, above)
+    
+    def on_scrollbar(self, *args):
+        """Scrollbar dragged or clicked: map it to a position in the whole file"""
+        if args[0] == 'moveto':
+            self.jump_to(int(float(args[1]) * self.mapped.size))
+        else:
+            self.text.yview(*args)
+    
+    def on_text_scrolled(self, first, last):
+        """Widget view changed: update the file-level scrollbar and refill near the edges"""
+        size = self.mapped.size or 1
+        top = self.visible_offset()
+        bottom = self.offset_at('@0,%d' % self.text.winfo_height())
+        self.scrollbar.set(top / size, max(bottom, top) / size)
+        if not self.recenter_pending:
+            self.recenter_pending = True
+            self.text.after_idle(self.recenter)
+    
+    def recenter(self):
+        """Swap in a new window once the view nears either end of the current one"""
+        self.recenter_pending = False
+        if not self.starts:
+            return
+        line = int(self.text.index('@0,0').split('.')[0]) - 1
+        near_top = line < LARGE_VIEW_MARGIN // 2 and self.starts[0] > 0
+        window_end = self.mapped.next_line(self.starts[-1])
+        near_bottom = len(self.starts) - line < self.window_lines - LARGE_VIEW_MARGIN and window_end < self.mapped.size
+        if near_top or near_bottom:
+            self.jump_to(self.starts[line])
+    
+    def find_next(self, search_text):
+        """Find the next occurrence after the cursor and jump to it"""
+        pattern = re.compile(re.escape(search_text.encode(self.mapped.encoding, errors='replace')), re.IGNORECASE)
+        if search_text != self.search_text:
+            start = self.visible_offset()
+        else:
+            start = self.offset_at(tk.INSERT) + 1
+        self.search_text = search_text
+        span = self.mapped.find(pattern, min(start, self.mapped.size))
+        if span is None:
+            self.jump_to(self.visible_offset())
+            return None
+        self.jump_to(span[0])
+        for line, line_start in enumerate(self.starts, 1):
+            if line_start <= span[0] < self.mapped.next_line(line_start):
+                col = len(self.mapped.map[line_start:span[0]].decode(self.mapped.encoding, errors='replace'))
+                self.text.mark_set(tk.INSERT, f"{line}.{col}")
+                break
+        return span
+    
+    def go_to_line(self, line):
+        """Jump to a 1-based line number, returning False if it is not indexed yet"""
+        offset = self.mapped.line_offset(line)
+        if offset is None:
+            return False
+        self.jump_to(offset)
+        self.text.mark_set(tk.INSERT, f"{self.starts.index(offset) + 1}.0" if offset in self.starts else "1.0")
+        return True
+    
+    def line_number(self, index='insert'):
+        """1-based file line number of a widget index, if known"""
+        line = int(self.text.index(index).split('.')[0])
+        if not self.starts:
+            return 1
+        return self.mapped.line_number(self.starts[min(line, len(self.starts)) - 1])
+
+class ConfigStore:
+    """Settings from config.json, cached in memory and written back atomically in the background
+    
+    Changes are coalesced: update() only restarts a timer, and the file is
+    rewritten on the timer's thread once CONFIG_SAVE_DELAY passes without
+    further changes. flush() writes pending changes immediately.
+    """
+    
+    def __init__(self, file_path):
+        self.file_path = Path(file_path)
+        self.data = self._read()
+        self.lock = threading.Lock()        # Guards data, dirty and timer
+        self.write_lock = threading.Lock()  # Keeps writes in order
+        self.dirty = False
+        self.timer = None
+        self.error = None
+    
+    def _read(self):
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+    
+    def get(self, key, default=None):
+        with self.lock:
+            return self.data.get(key, default)
+    
+    def update(self, values):
+        """Change settings and schedule a write"""
+        with self.lock:
+            self.data.update(values)
+            self.dirty = True
+            if self.timer is not None:
+                self.timer.cancel()
+            self.timer = threading.Timer(CONFIG_SAVE_DELAY, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+    
+    def flush(self):
+        """Write pending changes now; returns False if the write failed"""
+        with self.write_lock:
+            with self.lock:
+                if self.timer is not None and self.timer is not threading.current_thread():
+                    self.timer.cancel()
+                self.timer = None
+                if not self.dirty:
+                    return self.error is None
+                text = json.dumps(self.data, indent=2)
+                self.dirty = False
+            try:
+                atomic_write(self.file_path, [text])
+                self.error = None
+                return True
+            except OSError as e:
+                with self.lock:
+                    self.dirty = True  # Retried by the next update or flush
+                self.error = e
+                return False
+
+class StatCache:
+    """File metadata looked up on daemon threads and cached, so dead mounts never block the UI
+    
+    refresh() queues paths whose results are missing or stale; the owner
+    calls collect() from its event loop to pick up the results. A check
+    still outstanding after STAT_TIMEOUT reports the path as unavailable
+    until it returns; its thread may be stuck, which is why they are
+    daemons.
+    """
+    
+    def __init__(self, workers=STAT_WORKERS):
+        self.entries = {}         # path -> (os.stat result, None if missing or an OSError, time checked)
+        self.pending = {}         # path -> time the check was queued
+        self.timed_out = set()
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.workers = workers
+        self.threads = []
+    
+    def state(self, path):
+        """'exists', 'missing', 'unavailable', or 'unknown' before the first result"""
+        entry = self.entries.get(path)
+        if path in self.timed_out or (entry and isinstance(entry[0], OSError)):
+            return 'unavailable'
+        if entry is None:
+            return 'unknown'
+        return 'missing' if entry[0] is None else 'exists'
+    
+    def refresh(self, paths, ttl=STAT_TTL):
+        """Queue checks for paths not checked within ttl seconds"""
+        now = time.monotonic()
+        for path in paths:
+            entry = self.entries.get(path)
+            if path in self.pending or (entry and now - entry[1] < ttl):
+                continue
+            self.pending[path] = now
+            self.requests.put(path)
+        while len(self.threads) < self.workers and self.pending:
+            thread = threading.Thread(target=self._work, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+    
+    @property
+    def busy(self):
+        return bool(self.pending)
+    
+    def _work(self):
+        while True:
+            path = self.requests.get()
+            try:
+                result = os.stat(path)
+            except (FileNotFoundError, NotADirectoryError):
+                result = None
+            except OSError as e:
+                result = e
+            self.results.put((path, result))
+    
+    def collect(self):
+        """Take in finished checks and expire slow ones; True if any state changed"""
+        changed = False
+        while True:
+            try:
+                path, result = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.pending.pop(path, None)
+            self.timed_out.discard(path)
+            self.entries[path] = (result, time.monotonic())
+            changed = True
+        now = time.monotonic()
+        for path, queued in self.pending.items():
+            if path not in self.timed_out and now - queued > STAT_TIMEOUT:
+                self.timed_out.add(path)
+                changed = True
+        return changed
+
+def file_signature(path):
+    """What identifies a file's contents on disk without reading them: None if it is missing"""
+    try:
+        info = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return info.st_mtime_ns, info.st_size, info.st_ino
+
+class FileWatcher:
+    """Report files that change on disk, through inotify on Linux and by polling elsewhere
+    
+    set_paths() replaces the watched paths, which should be real paths.
+    Each change is put on the changes queue as (path, file_signature) for
+    the owner to drain from its event loop; a report only means the file
+    may have changed, so the owner compares signatures. inotify watches the
+    parent directories, so files replaced by a rename, as atomic_write and
+    most editors save them, are still seen. Paths inotify can't watch are
+    polled every WATCH_POLL_INTERVAL seconds instead.
+    """
+    
     def __init__(self):
+        self.changes = queue.Queue()
+        self.lock = threading.Lock()  # Guards everything below
+        self.paths = set()
+        self.dirs = {}            # Directory -> inotify watch descriptor
+        self.wds = {}             # Watch descriptor -> directory
+        self.polled = {}          # Path -> signature last seen, False until the first poll
+        self.poll_thread = None
+        self.fd = -1
+        if sys.platform.startswith('linux'):
+            try:
+                self.libc = ctypes.CDLL(None, use_errno=True)
+                self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+            except (OSError, AttributeError):
+                pass              # No inotify in this libc; everything is polled
+            if self.fd >= 0:
+                threading.Thread(target=self._read_events, daemon=True).start()
+    
+    def set_paths(self, paths):
+        """Watch exactly these paths"""
+        paths = set(paths)
+        with self.lock:
+            self.paths = paths
+            for path in list(self.polled):
+                if path not in paths:
+                    del self.polled[path]
+            wanted = {os.path.dirname(path) for path in paths if path not in self.polled}
+            for directory in set(self.dirs) - wanted:
+                wd = self.dirs.pop(directory)
+                del self.wds[wd]
+                self.libc.inotify_rm_watch(self.fd, wd)
+            for directory in wanted - set(self.dirs):
+                wd = -1
+                if self.fd >= 0:
+                    wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_EVENTS)
+                if wd >= 0:
+                    self.dirs[directory] = wd
+                    self.wds[wd] = directory
+                else:
+                    # Out of watches, or the directory is gone: fall back to polling
+                    self._poll_paths(path for path in paths if os.path.dirname(path) == directory)
+    
+    def _poll_paths(self, paths):
+        for path in paths:
+            self.polled[path] = False
+        if self.poll_thread is None and self.polled:
+            self.poll_thread = threading.Thread(target=self._poll, daemon=True)
+            self.poll_thread.start()
+    
+    def _read_events(self):
+        """inotify thread: report the watched paths named by each batch of events"""
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except InterruptedError:
+                continue
+            except OSError:
+                return
+            changed = set()
+            with self.lock:
+                offset = 0
+                while offset < len(data):
+                    wd, mask, cookie, length = struct.unpack_from('iIII', data, offset)
+                    name = os.fsdecode(data[offset + 16:offset + 16 + length].rstrip(b'\0'))
+                    offset += 16 + length
+                    if mask & IN_Q_OVERFLOW:
+                        changed.update(self.paths)  # Events were lost
+                        continue
+                    directory = self.wds.get(wd)
+                    if directory is None:
+                        continue
+                    if mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+                        # The directory itself went away: report its files and poll for them to return
+                        in_directory = [path for path in self.paths if os.path.dirname(path) == directory]
+                        changed.update(in_directory)
+                        if mask & IN_IGNORED:
+                            del self.wds[wd]
+                            del self.dirs[directory]
+                            self._poll_paths(in_directory)
+                        continue
+                    path = os.path.join(directory, name)
+                    if path in self.paths:
+                        changed.add(path)
+            for path in changed:
+                self.changes.put((path, file_signature(path)))
+    
+    def _poll(self):
+        """Polling thread: report the polled paths whose signature changed"""
+        while True:
+            time.sleep(WATCH_POLL_INTERVAL)
+            with self.lock:
+                polled = list(self.polled.items())
+            for path, previous in polled:
+                signature = file_signature(path)
+                with self.lock:
+                    if path not in self.polled:
+                        continue
+                    self.polled[path] = signature
+                if previous is not False and signature != previous:
+                    self.changes.put((path, signature))
+
+class FileFollower:
+    """Read what is appended to a file, like tail -F
+    
+    Each read() decodes the bytes appended since the last one, up to a
+    batch. A file truncated below the offset read so far is read again from
+    the start; one replaced at the same path (rotated) is read to its end
+    and then the new file is read from the start. partial records that the
+    reader no longer holds the whole file from its start.
+    """
+    
+    def __init__(self, file_path, encoding='utf-8', offset=0, align=False):
+        self.file_path = file_path
+        self.encoding = encoding
+        self.offset = offset
+        self.align = align        # Skip to the next line first, when starting part way into a file
+        self.partial = align
+        self.more = False         # The last read stopped at the batch size
+        self.file = None
+        self._open()
+    
+    def _open(self):
+        if self.file is not None:
+            self.file.close()
+        self.file = open(self.file_path, 'rb')
+        self.inode = os.fstat(self.file.fileno()).st_ino
+        self.decoder = io.IncrementalNewlineDecoder(
+            codecs.getincrementaldecoder(self.encoding)(errors='replace'), translate=True)
+    
+    def close(self):
+        self.file.close()
+    
+    def read(self, limit=FOLLOW_BATCH_BYTES):
+        """The text appended since the last read, and whether the file was truncated or rotated first"""
+        try:
+            info = os.stat(self.file_path)
+        except FileNotFoundError:
+            info = None           # Rotated away and not recreated yet; the open file may still grow
+        reset = False
+        self.file.seek(self.offset)
+        data = self.file.read(limit)
+        if not data and info is not None and (info.st_ino != self.inode or info.st_size < self.offset):
+            self._open()
+            self.offset = 0
+            self.partial = reset = True
+            data = self.file.read(limit)
+        self.offset += len(data)
+        self.more = len(data) == limit
+        if self.align and data:
+            newline = data.find(b'\n')
+            if newline < 0:
+                return '', reset  # Still inside the first, partial line
+            data = data[newline + 1:]
+            self.align = False
+        return self.decoder.decode(data), reset
+
+def common_prefix_length(a, b):
+    """Length of the longest common prefix of two strings, compared a block at a time"""
+    limit = min(len(a), len(b))
+    i = 0
+    block = 64 * 1024
+    while i < limit:
+        step = min(block, limit - i)
+        if a[i:i + step] == b[i:i + step]:
+            i += step
+        elif step > 1:
+            block = step // 2   # Narrow in on the first difference
+        else:
+            break
+    return i
+
+def text_changes(old, new):
+    """Replacements that turn old into new, as ascending (start, end, text) ranges of old
+    
+    Common leading and trailing text is skipped, then the remaining lines
+    are diffed unless there are more than RELOAD_DIFF_LINES of them, when
+    they are replaced as one range.
+    """
+    prefix = common_prefix_length(old, new)
+    suffix = common_prefix_length(old[prefix:][::-1], new[prefix:][::-1])
+    if prefix == len(old) == len(new):
+        return []
+    # Widen the differing middle to whole lines
+    prefix = old.rfind('\n', 0, prefix) + 1
+    end = old.find('\n', len(old) - suffix)
+    suffix = len(old) - end - 1 if end >= 0 else 0
+    old_lines = old[prefix:len(old) - suffix].splitlines(keepends=True)
+    new_lines = new[prefix:len(new) - suffix].splitlines(keepends=True)
+    if len(old_lines) > RELOAD_DIFF_LINES or len(new_lines) > RELOAD_DIFF_LINES:
+        return [(prefix, len(old) - suffix, ''.join(new_lines))]
+    
+    starts = list(itertools.accumulate(map(len, old_lines), initial=prefix))
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    return [(starts[i1], starts[i2], ''.join(new_lines[j1:j2]))
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+
+class LineDiff:
+    """Alignment of a saved text's lines with a buffer's, kept up to date as the buffer is edited
+    
+    Lines are hashed to integers and aligned by patience diff: unique lines
+    common to both sides anchor the alignment, the stretches between them
+    are aligned the same way, and stretches without anchors fall back to
+    difflib when they are small enough. The result is kept as runs of equal
+    lines, (old_start, new_start, length); after an edit only the stretch
+    between the nearest runs it left untouched is aligned again.
+    """
+    
+    def __init__(self, old_lines, new_lines):
+        self.ids = {}             # Line text -> integer, shared by both sides
+        self.old_lines = old_lines
+        self.new_lines = new_lines
+        self.old = [self.ids.setdefault(line, len(self.ids)) for line in old_lines]
+        self.new = [self.ids.setdefault(line, len(self.ids)) for line in new_lines]
+        self.runs = self._align(0, len(self.old), 0, len(self.new))
+    
+    def hunks(self):
+        """Changed stretches as (old_start, old_end, new_start, new_end)"""
+        old = new = 0
+        for old_start, new_start, length in self.runs + [(len(self.old), len(self.new), 0)]:
+            if old_start > old or new_start > new:
+                yield old, old_start, new, new_start
+            old, new = old_start + length, new_start + length
+    
+    def edit(self, first, removed, inserted_lines):
+        """Replace removed buffer lines from line first (0-based) with inserted_lines and realign around them"""
+        end = first + removed
+        delta = len(inserted_lines) - removed
+        self.new_lines[first:end] = inserted_lines
+        self.new[first:end] = [self.ids.setdefault(line, len(self.ids)) for line in inserted_lines]
+        
+        before, after = [], []
+        for old_start, new_start, length in self.runs:
+            if new_start + length <= first:
+                before.append((old_start, new_start, length))
+            elif new_start >= end:
+                after.append((old_start, new_start + delta, length))
+            else:
+                # Keep the parts of a run on either side of the edit
+                if new_start < first:
+                    before.append((old_start, new_start, first - new_start))
+                if new_start + length > end:
+                    cut = end - new_start
+                    after.append((old_start + cut, end + delta, length - cut))
+        old_lo, new_lo = (before[-1][0] + before[-1][2], before[-1][1] + before[-1][2]) if before else (0, 0)
+        old_hi, new_hi = after[0][:2] if after else (len(self.old), len(self.new))
+        self.runs = before + self._align(old_lo, old_hi, new_lo, new_hi) + after
+    
+    def _align(self, old_lo, old_hi, new_lo, new_hi):
+        """Runs of equal lines within a stretch of each side, in order"""
+        old, new = self.old, self.new
+        runs = []
+        stretches = [(old_lo, old_hi, new_lo, new_hi)]
+        while stretches:
+            old_lo, old_hi, new_lo, new_hi = stretches.pop()
+            start = old_lo
+            while old_lo < old_hi and new_lo < new_hi and old[old_lo] == new[new_lo]:
+                old_lo += 1
+                new_lo += 1
+            if old_lo > start:
+                runs.append((start, new_lo - (old_lo - start), old_lo - start))
+            end = old_hi
+            while old_hi > old_lo and new_hi > new_lo and old[old_hi - 1] == new[new_hi - 1]:
+                old_hi -= 1
+                new_hi -= 1
+            if end > old_hi:
+                runs.append((old_hi, new_hi, end - old_hi))
+            if old_lo == old_hi or new_lo == new_hi:
+                continue
+            
+            anchors = self._anchors(old_lo, old_hi, new_lo, new_hi)
+            if anchors:
+                for old_line, new_line in anchors:
+                    runs.append((old_line, new_line, 1))
+                    stretches.append((old_lo, old_line, new_lo, new_line))
+                    old_lo, new_lo = old_line + 1, new_line + 1
+                stretches.append((old_lo, old_hi, new_lo, new_hi))
+            elif (old_hi - old_lo) * (new_hi - new_lo) <= DIFF_FALLBACK_CELLS:
+                matcher = difflib.SequenceMatcher(None, old[old_lo:old_hi], new[new_lo:new_hi], autojunk=False)
+                runs.extend((old_lo + i, new_lo + j, n) for i, j, n in matcher.get_matching_blocks() if n)
+            # Otherwise the stretch is left as one change
+        
+        # Join runs that touch, so hunks() sees each change once
+        runs.sort()
+        joined = []
+        for run in runs:
+            if joined and joined[-1][0] + joined[-1][2] == run[0] and joined[-1][1] + joined[-1][2] == run[1]:
+                joined[-1] = (joined[-1][0], joined[-1][1], joined[-1][2] + run[2])
+            else:
+                joined.append(run)
+        return joined
+    
+    def _anchors(self, old_lo, old_hi, new_lo, new_hi):
+        """Lines unique to a stretch on both sides, the longest in-order sequence of them"""
+        old_counts = collections.Counter(self.old[old_lo:old_hi])
+        new_counts = collections.Counter(self.new[new_lo:new_hi])
+        new_unique = {line: j for j, line in enumerate(self.new[new_lo:new_hi], new_lo) if new_counts[line] == 1}
+        pairs = [(i, new_unique[line]) for i, line in enumerate(self.old[old_lo:old_hi], old_lo)
+                 if old_counts[line] == 1 and line in new_unique]
+        
+        # Longest increasing subsequence of the new-side positions, by patience sorting
+        tops = []                 # New-side position at the top of each pile
+        piles = []                # Index into pairs at the top of each pile
+        previous = [-1] * len(pairs)
+        for k, (i, j) in enumerate(pairs):
+            pile = bisect.bisect_left(tops, j)
+            if pile:
+                previous[k] = piles[pile - 1]
+            if pile == len(tops):
+                tops.append(j)
+                piles.append(k)
+            else:
+                tops[pile] = j
+                piles[pile] = k
+        anchors = []
+        k = piles[-1] if piles else -1
+        while k >= 0:
+            anchors.append(pairs[k])
+            k = previous[k]
+        return anchors[::-1]
+
+class DiffJob:
+    """Read a file and align it with a buffer snapshot on a worker thread"""
+    
+    def __init__(self, file_path, chunks, version):
+        self.file_path = file_path
+        self.chunks = chunks
+        self.version = version    # Buffer's edit version when the snapshot was taken
+        self.diff = None
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+    
+    @property
+    def done(self):
+        return not self.thread.is_alive()
+    
+    def start(self):
+        self.thread.start()
+    
+    def run(self):
+        try:
+            saved = read_document(self.file_path)[0]
+            self.diff = LineDiff(saved.split('\n'), ''.join(self.chunks).split('\n'))
+        except Exception as e:
+            self.error = e
+
+def walk_files(root_dir, ignore=()):
+    """Paths and sizes of the files under a directory, depth first with os.scandir
+    
+    Hidden entries, IGNORED_DIRS and names matching an ignore pattern are
+    skipped, and symbolic links to directories aren't followed.
+    """
+    stack = [root_dir]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                entries = sorted(entries, key=operator.attrgetter('name'), reverse=True)
+        except OSError:
+            continue  # Unreadable; the rest of the tree is still searched
+        for entry in entries:
+            name = entry.name
+            if name.startswith('.') or any(fnmatch.fnmatch(name, pattern) for pattern in ignore):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if name not in IGNORED_DIRS:
+                        stack.append(entry.path)
+                elif entry.is_file():
+                    yield entry.path, entry.stat().st_size
+            except OSError:
+                pass
+
+def search_files(file_paths, query, regex=False, match_case=False):
+    """Worker: search files through mmap, so their contents never become Python strings
+    
+    Returns (file_path, hits, count) for each file with matches, where hits
+    holds up to FIND_FILES_MAX_HITS (line, col, preview) tuples and count is
+    the number of matches. Binary files, and UTF-16 or UTF-32 ones whose
+    line breaks aren't newline bytes, are skipped.
+    """
+    found = []
+    for file_path in file_paths:
+        try:
+            with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                head = data[:SNIFF_BYTES]
+                encoding = sniff_encoding(head)[0]
+                if b'\0' in head or encoding.startswith(('utf-16', 'utf-32')):
+                    continue
+                # Bytes patterns: case folding and \w only cover ASCII
+                flags = 0 if match_case else re.IGNORECASE
+                pattern = query.encode(encoding, errors='replace')
+                pattern = re.compile(pattern if regex else re.escape(pattern), flags | re.MULTILINE)
+                hits = []
+                count = 0
+                line = 1
+                line_start = 0
+                col = 0
+                counted = 0       # Offset up to which line and col are counted, so each byte is read once
+                for match in pattern.finditer(data):
+                    start = match.start()
+                    if match.end() == start:
+                        continue
+                    count += 1
+                    if len(hits) < FIND_FILES_MAX_HITS:
+                        skipped = data[counted:start]
+                        newline = skipped.rfind(b'\n')
+                        if newline >= 0:
+                            line += skipped.count(b'\n')
+                            line_start = counted + newline + 1
+                            col = len(data[line_start:start].decode(encoding, errors='replace'))
+                        else:
+                            col += len(skipped.decode(encoding, errors='replace'))
+                        counted = start
+                        # Long lines are cut around the match
+                        preview_start = max(line_start, start - FIND_FILES_PREVIEW // 2)
+                        preview_end = data.find(b'\n', start, preview_start + FIND_FILES_PREVIEW)
+                        if preview_end < 0:
+                            preview_end = min(preview_start + FIND_FILES_PREVIEW, len(data))
+                        preview = data[preview_start:preview_end].decode(encoding, errors='replace').rstrip('\r')
+                        hits.append((line, col, preview))
+                if count:
+                    found.append((file_path, hits, count))
+        except (OSError, ValueError, re.error):
+            continue  # Empty (mmap refuses those), unreadable or vanished
+    return found
+
+class FileSearch:
+    """Find in Files: walk a tree on a thread and search it on worker processes
+    
+    Batches of files go to the executor as the walk finds them, growing from
+    one file to FIND_FILES_BATCH so the first results come back quickly.
+    Each finished batch's (file_path, hits, count) results are put on the
+    results queue for the UI to drain.
+    """
+    
+    def __init__(self, root_dir, query, executor, regex=False, match_case=False, ignore=()):
+        self.root_dir = root_dir
+        self.query = query
+        self.regex = regex
+        self.match_case = match_case
+        self.ignore = ignore
+        self.executor = executor
+        self.results = queue.Queue()
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()  # Guards pending
+        self.pending = set()
+        self.walking = True
+        self.files = 0
+        self.error = None
+        self.thread = threading.Thread(target=self._walk, daemon=True)
+    
+    def start(self):
+        self.thread.start()
+    
+    @property
+    def done(self):
+        with self.lock:
+            return not self.walking and not self.pending
+    
+    def cancel(self):
+        """Stop walking and drop the batches no worker has started"""
+        self.cancelled.set()
+        with self.lock:
+            for future in self.pending:
+                future.cancel()
+    
+    def _walk(self):
+        try:
+            batch = []
+            batch_bytes = 0
+            limit = 1
+            for file_path, size in walk_files(self.root_dir, self.ignore):
+                if self.cancelled.is_set():
+                    return
+                self.files += 1
+                batch.append(file_path)
+                batch_bytes += size
+                if len(batch) >= limit or batch_bytes >= FIND_FILES_BATCH_BYTES:
+                    self._submit(batch)
+                    batch = []
+                    batch_bytes = 0
+                    limit = min(limit * 2, FIND_FILES_BATCH)
+            if batch:
+                self._submit(batch)
+        except Exception as e:
+            self.error = e
+        finally:
+            with self.lock:
+                self.walking = False
+    
+    def _submit(self, batch):
+        future = self.executor.submit(search_files, batch, self.query, self.regex, self.match_case)
+        with self.lock:
+            self.pending.add(future)
+        future.add_done_callback(self._finished)
+    
+    def _finished(self, future):
+        if not future.cancelled() and not self.cancelled.is_set():
+            try:
+                for result in future.result():
+                    self.results.put(result)
+            except Exception as e:  # A worker died; report it rather than hang
+                self.error = e
+        with self.lock:
+            self.pending.discard(future)
+
+def instance_socket_path():
+    """Per-user socket of the running TextEdit, in a directory only this user can enter"""
+    if not hasattr(socket, 'AF_UNIX'):
+        raise OSError("Unix domain sockets are not available")
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if not runtime_dir or not os.path.isdir(runtime_dir):
+        runtime_dir = os.path.join(os.environ.get('TMPDIR', '/tmp'), f'textedit-{os.getuid()}')
+        try:
+            os.mkdir(runtime_dir, 0o700)
+        except FileExistsError:
+            pass
+        info = os.lstat(runtime_dir)
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+            raise OSError(f"{runtime_dir} is not a private directory")
+    return os.path.join(runtime_dir, 'textedit.sock')
+
+def forward_to_instance(file_paths):
+    """Ask a running TextEdit to open files; False if there is none to ask"""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(INSTANCE_TIMEOUT)
+            client.connect(instance_socket_path())
+            message = json.dumps({'files': [os.path.abspath(path) for path in file_paths]})
+            client.sendall(message.encode('utf-8') + b'\n')
+            with client.makefile('rb') as reply:
+                return reply.readline().strip() == b'ok'
+    except OSError:
+        return False
+
+class InstanceServer:
+    """Accept file lists from later invocations on a thread; the app drains requests"""
+    
+    def __init__(self, path):
+        self.path = path
+        self.requests = queue.Queue()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._bind()
+        except OSError:
+            self.sock.close()
+            raise
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+    
+    def _bind(self):
+        try:
+            self.sock.bind(self.path)
+        except OSError as e:
+            if e.errno != errno.EADDRINUSE:
+                raise
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                try:
+                    probe.connect(self.path)
+                except ConnectionRefusedError:
+                    pass
+                else:
+                    raise  # Another instance is listening
+            # Left behind by an instance that crashed
+            os.unlink(self.path)
+            self.sock.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self.inode = os.stat(self.path).st_ino
+        self.sock.listen(8)
+    
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return  # Closed
+            with conn:
+                try:
+                    conn.settimeout(INSTANCE_TIMEOUT)
+                    with conn.makefile('rb') as f:
+                        file_paths = json.loads(f.readline(INSTANCE_MAX_MESSAGE))['files']
+                    if isinstance(file_paths, list) and all(isinstance(path, str) for path in file_paths):
+                        self.requests.put(file_paths)
+                        conn.sendall(b'ok\n')
+                except (OSError, ValueError, KeyError, TypeError):
+                    pass
+    
+    def close(self):
+        """Stop listening and remove the socket, unless another instance has replaced it"""
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        try:
+            if os.stat(self.path).st_ino == self.inode:
+                os.unlink(self.path)
+        except OSError:
+            pass
+    
+    @staticmethod
+    def start():
+        """Listen on the per-user socket; None if another instance already is"""
+        try:
+            return InstanceServer(instance_socket_path())
+        except OSError:
+            return None
+
+class StartupProfiler:
+    """Wall-clock time of each startup phase, printed by --profile-startup"""
+    
+    def __init__(self):
+        now = time.perf_counter()
+        self.phases = [("interpreter (CPU)", STARTUP_CPU), ("imports", now - STARTUP_TIME)]
+        self.last = now
+        self.reported = False
+    
+    def mark(self, phase):
+        """End the current phase"""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+    
+    def report(self, file=None):
+        """Print the phases once, with the total since the script started"""
+        if self.reported:
+            return
+        self.reported = True
+        file = file or sys.stderr
+        for phase, seconds in self.phases:
+            print(f"{phase:<28}{seconds * 1000:9.1f} ms", file=file)
+        print(f"{'total (wall)':<28}{(time.perf_counter() - STARTUP_TIME) * 1000:9.1f} ms", file=file)
+
+class EditorTab:
+    """An open document: its widget and state once hydrated, or just enough to load it again"""
+    
+    def __init__(self, file_path=None):
+        self.current_file = file_path
+        self.modified = False
+        self.has_default_text = False
+        self.text_editor = None   # Created on first activation, destroyed on eviction
+        self.text_command = None
+        self.document = None
+        self.stats = None
+        self.journal = None
+        self.history = None       # UndoHistory, created with the widget
+        self.edit_version = 0     # Bumped on every edit, to tell whether a save is still current
+        self.encoding = 'utf-8'   # How the file is written back: as it was read, by default
+        self.bom = False
+        self.newline = None       # Line ending, None for the platform's
+        self.disk_signature = None  # file_signature of the file as last loaded, saved or seen
+        self.disk_changed = False  # Reported changed on disk, not yet checked
+        self.disk_newer = False   # Changed on disk and not reloaded, so saving asks first
+        self.disk_size = None     # Bytes of the file the buffer holds, when known
+        self.follower = None      # FileFollower appending to the buffer, in Follow mode
+        self.follow_pending = False  # Start following once loaded
+        self.loader = None
+        self.loader_first_screen = False
+        self.loader_poll = None   # Pending poll_loader call, paused while the tab is hidden
+        self.viewer = None
+        self.save_job = None
+        self.highlighter = None   # Syntax states, for file types with a lexer
+        self.label = None
+        self.cursor = "1.0"       # Restored when an evicted tab is loaded again
+        self.scroll = 0.0
+        self.last_used = 0.0
+    
+    @property
+    def hydrated(self):
+        return self.text_editor is not None
+    
+    @property
+    def blank(self):
+        """Untitled and untouched, so opening a file can reuse the tab"""
+        return not (self.current_file or self.modified or self.loader or self.viewer)
+    
+    @property
+    def title(self):
+        title = Path(self.current_file).name if self.current_file else "Untitled"
+        return "• " + title if self.modified else title
+    
+    def memory(self):
+        """Rough bytes held by the hydrated tab"""
+        if self.viewer:
+            starts = self.viewer.mapped.line_starts
+            return len(starts) * starts.itemsize
+        return (len(self.document) * TAB_BYTES_PER_CHAR + self.document.newlines * TAB_BYTES_PER_LINE
+                + self.history.memory)
+
+class TabState:
+    """TextEditApp attribute that lives on the active tab"""
+    
+    def __set_name__(self, owner, name):
+        self.name = name
+    
+    def __get__(self, app, owner=None):
+        if app is None:
+            return self
+        return getattr(app.tab, self.name)
+    
+    def __set__(self, app, value):
+        setattr(app.tab, self.name, value)
+
+class TextEditApp:
+    # Per-document state, kept on the active tab
+    current_file = TabState()
+    modified = TabState()
+    has_default_text = TabState()
+    text_editor = TabState()
+    text_command = TabState()
+    document = TabState()
+    stats = TabState()
+    journal = TabState()
+    history = TabState()
+    edit_version = TabState()
+    encoding = TabState()
+    bom = TabState()
+    newline = TabState()
+    loader = TabState()
+    loader_first_screen = TabState()
+    loader_poll = TabState()
+    viewer = TabState()
+    save_job = TabState()
+    highlighter = TabState()
+    disk_signature = TabState()
+    disk_changed = TabState()
+    disk_newer = TabState()
+    disk_size = TabState()
+    follower = TabState()
+    follow_pending = TabState()
+    
+    def __init__(self, file_paths=(), profiler=None, instance_server=None):
+        self.profiler = profiler
+        self.instance_server = instance_server
+        self.file_paths = list(file_paths)
         self.root = tk.Tk()
         self.root.title("TextEdit")
         self.root.geometry("1200x800")
+        self.mark_startup("tk")
         
         # Dark theme colors
         self.colors = {
@@ -37,49 +2621,662 @@ class TextEditApp:
             'menu_bg': '#2d2d2d',
             'menu_fg': '#ffffff',
             'cursor': '#ffffff',
-            'highlight': '#0078d4'
+            'highlight': '#0078d4',
+            'diff_removed': '#4b1818',
+            'diff_added': '#1e3a1e',
+            'diff_filler': '#252526'
+        }
+        self.syntax_colors = {
+            'keyword': '#569cd6',
+            'builtin': '#4ec9b0',
+            'definition': '#dcdcaa',
+            'decorator': '#c586c0',
+            'string': '#ce9178',
+            'number': '#b5cea8',
+            'comment': '#6a9955',
+            'heading': '#569cd6',
+            'quote': '#6a9955',
+            'list': '#d7ba7d',
+            'code': '#ce9178',
+            'link': '#4fc1ff',
+            'emphasis': '#c586c0'
         }
         
         # File management
-        self.current_file = None
-        self.files = []  # Tab support
-        self.modified = False
+        self.tabs = []
+        self.tab = None
+        self.search = None
+        self.search_tag_pending = False
+        self.search_job = None
+        self.search_cache = {}
+        self.find_bar = None      # Built after the first paint
+        self.find_files_window = None  # Built when Find in Files is first used
+        self.file_search = None
+        self.file_search_poll = None
+        self.search_pool = None   # Worker processes for Find in Files, started on first use
+        
+        # Edit pipeline: widget changes are folded together and handled once per frame
+        self.edit_listeners = []  # Called with the (start, end) offsets changed since the last frame
+        self.pending_edit = None
+        self.frame_pending = False
+        self.window_title = None
+        self.highlight_job = None
+        self.follow_job = None
+        self.follow_var = tk.BooleanVar(value=False)  # The View menu's Follow check mark
+        self.diff_window = None   # Compare with Saved, built on first use
+        self.diff_job = None
+        self.diff_tab = None      # The tab being compared
+        self.line_diff = None
+        self.diff_refresh = None
+        self.edit_listeners.append(self.highlight_edit)
+        self.edit_listeners.append(self.diff_edit)
         
         # Recent files
         self.config_dir = Path.home() / '.textedit'
         self.config_dir.mkdir(exist_ok=True)
-        self.config_file = self.config_dir / 'config.json'
-        self.recent_files = self.load_config().get('recent_files', [])
+        self.config = ConfigStore(self.config_dir / 'config.json')
+        self.recent_files = self.config.get('recent_files', [])
+        self.stat_cache = StatCache()
+        self.stat_poll = None
+        self.large_file_threshold = self.config.get('large_file_threshold', LARGE_FILE_THRESHOLD)
+        self.tab_memory_budget = self.config.get('tab_memory_budget', TAB_MEMORY_BUDGET)
+        self.auto_reload = self.config.get('auto_reload', True)  # Reload clean buffers changed on disk
+        self.file_watcher = None  # Started after the first paint
+        self.watched = {}         # Open file path -> the real path being watched
+        self.follow_max_lines = self.config.get('follow_max_lines', 0)  # History kept while following; 0 keeps all
+        self.undo_budget = self.config.get('undo_memory_budget', UNDO_MEMORY_BUDGET)
+        self.undo_max_steps = self.config.get('undo_max_steps', UNDO_MAX_STEPS)
+        self.find_files_ignore = self.config.get('find_in_files_ignore', [])  # fnmatch patterns
+        
+        # Crash recovery: unsaved edits are journaled until the buffer is clean again
+        self.journal_dir = self.config_dir / 'journal'
+        self.journal_paused = False
         
+        # The window is painted first; menus, the find bar and files follow
+        self.mark_startup("config")
         self.setup_ui()
-        self.setup_bindings()
+        self.mark_startup("setup_ui")
         self.apply_dark_theme()
+        self.mark_startup("apply_dark_theme")
+        self.root.after_idle(self.finish_startup)
+    
+    def finish_startup(self):
+        """Build what the first paint didn't need, then open files and offer recovery"""
+        self.mark_startup("first idle")
+        self.setup_menus()
+        self.setup_find_bar()
+        self.setup_bindings()
+        self.mark_startup("menus and bindings")
         
-    def load_config(self):
-        """Load configuration from file"""
+        if self.file_paths:
+            self.open_files(self.file_paths)
+        else:
+            self.offer_recovery()
+        self.root.after(JOURNAL_FLUSH_MS, self.flush_journal)
+        self.file_watcher = FileWatcher()
+        self.root.after(WATCH_POLL_MS, self.poll_file_watcher)
+        if self.instance_server:
+            self.root.after(INSTANCE_POLL_MS, self.poll_instance_server)
+        if self.loader is None and self.profiler:
+            self.mark_startup("open files")
+            self.profiler.report()
+    
+    def open_files(self, file_paths):
+        """Open files from the command line, each in its own tab; only the first is loaded now"""
+        for i, file_path in enumerate(file_paths):
+            if not self.offer_recovery(file_path) and Path(file_path).exists():
+                self.open_path(file_path, activate=(i == 0))
+    
+    def poll_instance_server(self):
+        """Open files passed to later invocations of textedit, and bring the window forward"""
+        while True:
+            try:
+                file_paths = self.instance_server.requests.get_nowait()
+            except queue.Empty:
+                break
+            if file_paths:
+                self.open_files(file_paths)
+            else:
+                self.new_file()
+            self.root.deiconify()
+            self.root.lift()
+            self.root.focus_force()
+        self.root.after(INSTANCE_POLL_MS, self.poll_instance_server)
+    
+    def poll_file_watcher(self):
+        """Keep the open files watched, and act on the ones changed by other programs"""
+        open_files = {tab.current_file for tab in self.tabs if tab.hydrated and tab.current_file}
+        if open_files != set(self.watched):
+            self.watched = {file_path: os.path.realpath(file_path) for file_path in open_files}
+            self.file_watcher.set_paths(self.watched.values())
+        
+        while True:
+            try:
+                path, signature = self.file_watcher.changes.get_nowait()
+            except queue.Empty:
+                break
+            for tab in self.tabs:
+                if self.watched.get(tab.current_file) != path:
+                    continue
+                if tab.follower:
+                    if tab is self.tab and self.follow_job is None:
+                        self.follow_job = self.root.after_idle(self.poll_follow)
+                # A save in progress changes the file itself; finish_save records the result
+                elif not tab.save_job and signature != tab.disk_signature:
+                    tab.disk_changed = True
+        self.check_disk_change()
+        self.root.after(WATCH_POLL_MS, self.poll_file_watcher)
+    
+    def check_disk_change(self):
+        """Reload the active tab if its file changed on disk, asking first if that loses edits"""
+        tab = self.tab
+        if not tab.disk_changed or tab.loader or tab.save_job or not tab.hydrated:
+            return  # Other tabs are checked when activated, loading ones once loaded
+        tab.disk_changed = False
+        name = Path(tab.current_file).name
+        signature = file_signature(tab.current_file)
+        if signature == tab.disk_signature:
+            return  # Changed and changed back, or only touched
+        if signature is None:
+            tab.disk_signature = None
+            self.update_status(f"{name} was deleted or moved on disk")
+            return
+        if tab.viewer:
+            self.load_file(tab.current_file)  # The mapping may be past the file's new end
+            return
+        if tab.modified and not messagebox.askyesno(
+                "File Changed", f"{name} has been changed by another program.\n\n"
+                "Reload it? Your unsaved changes can be brought back with Undo."):
+            tab.disk_newer = True  # Saving asks before overwriting
+            tab.disk_signature = signature
+            return
+        if tab.modified or self.auto_reload:
+            self.reload_file()
+        else:
+            tab.disk_newer = True
+            tab.disk_signature = signature
+            self.update_status(f"{name} has been changed by another program")
+    
+    def reload_file(self):
+        """Bring the active tab up to date with its file, editing only the ranges that changed
+        
+        The changes go through the widget like any edit, so the cursor,
+        scroll position and undo history survive and one Undo goes back to
+        the text from before the reload.
+        """
+        file_path = self.current_file
         try:
-            if self.config_file.exists():
-                with open(self.config_file, 'r') as f:
-                    return json.load(f)
-        except Exception:
+            if os.path.getsize(file_path) >= self.large_file_threshold:
+                self.load_file(file_path)
+                return
+            signature = file_signature(file_path)
+            text, encoding, bom, newline = read_document(file_path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", f"Could not reload file:\n{e}")
+            return
+        
+        changes = text_changes(''.join(self.document.snapshot()), text)
+        widget = self.text_editor
+        widget.mark_set("reload_top", "@0,0")
+        widget.mark_gravity("reload_top", tk.LEFT)
+        self.history.close()
+        self.journal_paused = True
+        try:
+            for start, end, replacement in reversed(changes):
+                start_index = "%d.%d" % self.document.position(start)
+                if end > start:
+                    widget.delete(start_index, "%d.%d" % self.document.position(end))
+                if replacement:
+                    widget.insert(start_index, replacement)
+        finally:
+            self.journal_paused = False
+            self.history.close()
+        widget.yview("reload_top")
+        widget.mark_unset("reload_top")
+        widget.edit_modified(False)
+        
+        self.disk_signature = signature
+        self.disk_size = signature[1] if file_signature(file_path) == signature else None
+        self.disk_newer = False
+        self.encoding, self.bom, self.newline = encoding, bom, newline
+        self.modified = False
+        try:
+            self.journal.reset(file_path, encoding, bom, newline)
+        except OSError:
             pass
-        return {}
+        self.update_title()
+        self.update_tab_label(self.tab)
+        self.update_encoding_label()
+        self.update_status(f"Reloaded: {Path(file_path).name} ({len(changes):,} changed ranges)")
+        if self.diff_tab is self.tab:
+            self.compare_with_saved()
+    
+    def compare_with_saved(self):
+        """Show how the active document differs from its file, aligning them on a worker thread"""
+        if not self.current_file or self.viewer:
+            self.update_status("Compare with Saved needs a file opened in the editor")
+            return
+        if self.loader:
+            self.update_status("Still loading; the document can be compared once it is complete")
+            return
+        if self.diff_window is None:
+            self.setup_diff_window()
+        self.diff_window.title(f"Compare with Saved: {Path(self.current_file).name}")
+        self.diff_window.deiconify()
+        self.diff_window.lift()
+        
+        job = DiffJob(self.current_file, self.document.snapshot(), self.edit_version)
+        self.diff_job = job
+        self.diff_tab = self.tab
+        self.line_diff = None
+        self.diff_summary.config(text="Comparing...")
+        job.start()
+        self.root.after(DIFF_POLL_MS, self.poll_diff_job, job)
+    
+    def poll_diff_job(self, job):
+        """Show a finished comparison, or start again if the document changed while it ran"""
+        if job is not self.diff_job:
+            return
+        if not job.done:
+            self.root.after(DIFF_POLL_MS, self.poll_diff_job, job)
+            return
+        self.diff_job = None
+        if job.error:
+            self.diff_summary.config(text=f"Could not compare: {job.error}")
+            return
+        tab = self.diff_tab
+        if tab.edit_version != job.version:
+            if tab is self.tab:
+                self.compare_with_saved()
+            return
+        self.line_diff = job.diff
+        self.render_diff()
+    
+    def diff_edit(self, start, end):
+        """Realign the lines an edit touched with the saved file, then redraw the comparison shortly"""
+        diff = self.line_diff
+        if diff is None or self.tab is not self.diff_tab:
+            return
+        document = self.document
+        count = document.newlines + 1
+        first = document.position(start)[0] - 1
+        last = document.position(end)[0] - 1
+        text_end = document.line_offset(last + 1) - (last + 1 < count)  # Without the line's newline
+        lines = document.get_text(document.line_offset(first), text_end).split('\n')
+        diff.edit(first, len(lines) - (count - len(diff.new)), lines)
+        if self.diff_refresh is not None:
+            self.root.after_cancel(self.diff_refresh)
+        self.diff_refresh = self.root.after(DIFF_REFRESH_MS, self.render_diff)
+    
+    def setup_diff_window(self):
+        """Build the Compare with Saved window: a summary, a layout switch and the diff panes"""
+        window = tk.Toplevel(self.root)
+        window.geometry("1000x600")
+        window.protocol("WM_DELETE_WINDOW", self.hide_diff_window)
+        window.bind('<Escape>', lambda e: self.hide_diff_window())
+        self.diff_window = window
+        
+        top = tk.Frame(window)
+        top.pack(side=tk.TOP, fill=tk.X)
+        self.diff_summary = tk.Label(top, text="", anchor=tk.W)
+        self.diff_summary.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+        self.diff_side_by_side = tk.BooleanVar(value=True)
+        layout = tk.Checkbutton(top, text="Side by side", variable=self.diff_side_by_side,
+                                command=self.render_diff)
+        layout.pack(side=tk.RIGHT, padx=5)
+        refresh = tk.Button(top, text="Refresh", command=self.compare_with_saved, relief=tk.FLAT)
+        refresh.pack(side=tk.RIGHT, padx=5)
+        
+        # The inline view, or the saved file on the left and the buffer on the right, sharing a scrollbar
+        body = tk.Frame(window)
+        body.pack(fill=tk.BOTH, expand=True)
+        scrollbar = tk.Scrollbar(body, command=self.scroll_diff)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.diff_scrollbar = scrollbar
+        self.diff_inline = tk.Text(body, wrap=tk.NONE, font=self.editor_font)
+        self.diff_left = tk.Text(body, wrap=tk.NONE, font=self.editor_font, width=1)
+        self.diff_right = tk.Text(body, wrap=tk.NONE, font=self.editor_font, width=1)
+        self.diff_panes = []
+        self.diff_rows = []
+        for pane in (self.diff_inline, self.diff_left, self.diff_right):
+            pane.config(yscrollcommand=lambda first, last, pane=pane: self.on_diff_scrolled(pane, first, last))
+            pane.bind('<Double-Button-1>', lambda e, pane=pane: self.open_diff_row(pane))
+            pane.configure(
+                bg=self.colors['bg'],
+                fg=self.colors['fg'],
+                insertbackground=self.colors['cursor'],
+                selectbackground=self.colors['select_bg'],
+                highlightthickness=0
+            )
+            pane.tag_config("diff_header", foreground=self.syntax_colors['keyword'])
+            pane.tag_config("diff_removed", background=self.colors['diff_removed'])
+            pane.tag_config("diff_added", background=self.colors['diff_added'])
+            pane.tag_config("diff_filler", background=self.colors['diff_filler'])
+            pane.tag_raise("sel")
+        
+        # Colors
+        for widget in (window, top, body):
+            widget.configure(bg=self.colors['menu_bg'])
+        self.diff_summary.configure(bg=self.colors['menu_bg'], fg=self.colors['menu_fg'])
+        layout.configure(
+            bg=self.colors['menu_bg'],
+            fg=self.colors['menu_fg'],
+            selectcolor=self.colors['bg'],
+            activebackground=self.colors['menu_bg'],
+            activeforeground=self.colors['fg']
+        )
+        refresh.configure(
+            bg=self.colors['menu_bg'],
+            fg=self.colors['menu_fg'],
+            activebackground=self.colors['highlight'],
+            activeforeground=self.colors['fg']
+        )
+        scrollbar.config(
+            bg=self.colors['menu_bg'],
+            troughcolor=self.colors['bg'],
+            activebackground=self.colors['highlight']
+        )
+    
+    def hide_diff_window(self):
+        """Close the Compare with Saved window and stop following edits"""
+        if self.diff_refresh is not None:
+            self.root.after_cancel(self.diff_refresh)
+            self.diff_refresh = None
+        self.diff_job = self.line_diff = self.diff_tab = None
+        self.diff_window.withdraw()
+    
+    def scroll_diff(self, *args):
+        """Scrollbar command: move every visible pane"""
+        for pane in self.diff_panes:
+            pane.yview(*args)
+    
+    def on_diff_scrolled(self, pane, first, last):
+        """Keep the side-by-side panes at the same position as either one scrolls"""
+        self.diff_scrollbar.set(first, last)
+        for other in self.diff_panes:
+            if other is not pane and other.yview()[0] != float(first):
+                other.yview_moveto(first)
     
+    def diff_row_list(self, diff, side_by_side):
+        """Rows of the comparison: (kind, saved line, buffer line), 0-based, for each change with context
+        
+        Kinds are header, same, removed and added, and changed for a saved
+        line shown beside the buffer line that replaced it.
+        """
+        rows = []
+        blocks = []               # Changes close enough to share their context
+        for hunk in diff.hunks():
+            if blocks and hunk[0] - blocks[-1][-1][1] <= 2 * DIFF_CONTEXT_LINES:
+                blocks[-1].append(hunk)
+            else:
+                blocks.append([hunk])
+        for block in blocks:
+            old_start = max(block[0][0] - DIFF_CONTEXT_LINES, 0)
+            new_start = block[0][2] - (block[0][0] - old_start)
+            old_end = min(block[-1][1] + DIFF_CONTEXT_LINES, len(diff.old))
+            new_end = block[-1][3] + (old_end - block[-1][1])
+            rows.append(('header', old_start, new_start, old_end, new_end))
+            old, new = old_start, new_start
+            for old_lo, old_hi, new_lo, new_hi in block + [(old_end, old_end, new_end, new_end)]:
+                rows.extend(('same', old + k, new + k) for k in range(old_lo - old))
+                if side_by_side:
+                    paired = min(old_hi - old_lo, new_hi - new_lo)
+                    rows.extend(('changed', old_lo + k, new_lo + k) for k in range(paired))
+                    old_lo, new_lo = old_lo + paired, new_lo + paired
+                rows.extend(('removed', i, new_lo) for i in range(old_lo, old_hi))
+                rows.extend(('added', old_hi, j) for j in range(new_lo, new_hi))
+                old, new = old_hi, new_hi
+            if len(rows) >= DIFF_MAX_ROWS:
+                break
+        return rows, len(blocks)
+    
+    def render_diff(self):
+        """Draw the comparison into the inline or side-by-side panes, tagging each kind of row at once"""
+        self.diff_refresh = None
+        diff = self.line_diff
+        if diff is None:
+            return
+        side_by_side = self.diff_side_by_side.get()
+        rows, changes = self.diff_row_list(diff, side_by_side)
+        removed = sum(old_hi - old_lo for old_lo, old_hi, new_lo, new_hi in diff.hunks())
+        added = sum(new_hi - new_lo for old_lo, old_hi, new_lo, new_hi in diff.hunks())
+        
+        panes = [self.diff_left, self.diff_right] if side_by_side else [self.diff_inline]
+        for pane in (self.diff_inline, self.diff_left, self.diff_right):
+            pane.pack_forget()
+        for pane in panes:
+            pane.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.diff_panes = panes
+        
+        # Each pane's text and the rows of each tag in it
+        texts = [[] for pane in panes]
+        tagged = [{"diff_header": [], "diff_removed": [], "diff_added": [], "diff_filler": []} for pane in panes]
+        self.diff_rows = []
+        for row, (kind, old, new, *span) in enumerate(rows, 1):
+            if kind == 'header':
+                old_end, new_end = span
+                line = f"@@ -{old + 1},{old_end - old} +{new + 1},{new_end - new} @@"
+                cells = [(line, "diff_header")] * len(panes)
+            elif side_by_side:
+                left = (diff.old_lines[old], "diff_removed" if kind != 'same' else None) \
+                    if kind != 'added' else ("", "diff_filler")
+                right = (diff.new_lines[new], "diff_added" if kind != 'same' else None) \
+                    if kind != 'removed' else ("", "diff_filler")
+                cells = [left, right]
+            elif kind == 'removed':
+                cells = [("- " + diff.old_lines[old], "diff_removed")]
+            else:
+                cells = [(("+ " if kind == 'added' else "  ") + diff.new_lines[new],
+                          "diff_added" if kind == 'added' else None)]
+            for text, tags, (line, tag) in zip(texts, tagged, cells):
+                text.append(line)
+                if tag:
+                    tags[tag].extend((f"{row}.0", f"{row + 1}.0"))
+            self.diff_rows.append(new + 1)
+        if len(rows) >= DIFF_MAX_ROWS:
+            for text in texts:
+                text.append("... more changes are not shown")
+        
+        for pane, text, tags in zip(panes, texts, tagged):
+            pane.config(state=tk.NORMAL)
+            pane.delete("1.0", tk.END)
+            pane.insert("1.0", '\n'.join(text))
+            for tag, indices in tags.items():
+                if indices:
+                    pane.tag_add(tag, *indices)
+            pane.config(state=tk.DISABLED)
+        if not rows:
+            self.diff_summary.config(text="No differences from the saved file")
+        else:
+            self.diff_summary.config(text=f"{changes:,} {'change' if changes == 1 else 'changes'}: "
+                                          f"{removed:,} lines removed, {added:,} added")
+    
+    def open_diff_row(self, pane):
+        """Show the buffer line of a double-clicked row in the editor"""
+        row = int(pane.index(tk.CURRENT).split('.')[0]) - 1
+        if self.diff_tab is None or not 0 <= row < len(self.diff_rows):
+            return
+        if self.tab is not self.diff_tab:
+            self.activate_tab(self.diff_tab)
+        self.text_editor.mark_set(tk.INSERT, f"{self.diff_rows[row]}.0")
+        self.text_editor.see(tk.INSERT)
+        self.update_cursor_position()
+        self.root.lift()
+        self.text_editor.focus_set()
+    
+    def toggle_follow(self):
+        """Start or stop following the active tab's file as it grows"""
+        if self.follower or self.follow_pending:
+            self.stop_follow()
+        else:
+            self.start_follow()
+        self.follow_var.set(bool(self.follower or self.follow_pending))
+    
+    def start_follow(self):
+        """Append what is written to the file from now on, read-only, scrolling along at the bottom"""
+        file_path = self.current_file
+        if not file_path:
+            self.update_status("Follow needs a file that has been saved")
+            return
+        if self.loader:
+            self.follow_pending = True
+            return
+        if self.modified:
+            self.update_status("Save or undo your changes before following the file")
+            return
+        try:
+            if self.viewer:
+                # Only the end of a large file is shown
+                size = os.path.getsize(file_path)
+                follower = FileFollower(file_path, self.encoding, max(size - FOLLOW_TAIL_BYTES, 0), align=True)
+                self.close_viewer()  # Empties the widget
+                self.current_file = file_path
+            else:
+                signature = file_signature(file_path)
+                if self.disk_size is None or signature is None or self.disk_signature is None \
+                        or signature[2] != self.disk_signature[2] or signature[1] < self.disk_size:
+                    # Rotated or rewritten since it was read: read it again, then follow
+                    self.load_file(file_path)
+                    self.follow_pending = True
+                    return
+                follower = FileFollower(file_path, self.encoding, self.disk_size)
+        except (OSError, LookupError) as e:
+            messagebox.showerror("Error", f"Could not follow file:\n{e}")
+            return
+        
+        self.follower = follower
+        self.text_editor.config(state=tk.DISABLED)
+        self.history.reset()
+        self.update_status(f"Following: {Path(file_path).name}")
+        self.poll_follow()
+        self.text_editor.see(tk.END)
+    
+    def poll_follow(self):
+        """Append the text written to the followed file since the last poll"""
+        self.follow_job = None
+        follower = self.follower
+        if follower is None:
+            return
+        name = Path(follower.file_path).name
+        try:
+            text, reset = follower.read()
+        except OSError as e:
+            self.stop_follow()
+            self.update_status(f"Stopped following {name}: {e}")
+            return
+        if reset:
+            self.update_status(f"Following: {name} was truncated or rotated, reading it from the start")
+        
+        if text:
+            widget = self.text_editor
+            at_bottom = widget.yview()[1] >= 1.0
+            widget.config(state=tk.NORMAL)
+            widget.insert(tk.END + '-1c', text)
+            if self.follow_max_lines:
+                excess = int(widget.index(tk.END + '-1c').split('.')[0]) - self.follow_max_lines
+                if excess > 0:
+                    widget.delete("1.0", f"{excess + 1}.0")
+                    follower.partial = True
+            widget.config(state=tk.DISABLED)
+            widget.edit_modified(False)
+            if at_bottom:
+                widget.see(tk.END)
+        if follower.more:
+            self.follow_job = self.root.after(1, self.poll_follow)  # Catching up, a batch per tick
+    
+    def cancel_follow(self):
+        """Stop polling the followed file, for instance before switching tabs"""
+        if self.follow_job is not None:
+            self.root.after_cancel(self.follow_job)
+            self.follow_job = None
+    
+    def end_follow(self):
+        """Close the active tab's follower, leaving the buffer editable as it is"""
+        self.follow_pending = False
+        follower = self.follower
+        if follower is None:
+            return None
+        self.cancel_follow()
+        follower.close()
+        self.follower = None
+        self.text_editor.config(state=tk.NORMAL)
+        self.history.reset()
+        self.text_editor.edit_modified(False)
+        self.follow_var.set(False)
+        return follower
+    
+    def stop_follow(self):
+        """Leave Follow mode; a buffer missing part of the file is loaded again in full"""
+        follower = self.end_follow()
+        if follower is None:
+            return
+        if follower.partial:
+            self.load_file(self.current_file)
+            return
+        self.disk_size = follower.offset
+        self.disk_signature = file_signature(self.current_file)
+        if self.disk_signature is None or self.disk_signature[1] != follower.offset:
+            self.disk_changed = True  # Written since the last poll
+            self.check_disk_change()
+        self.update_status(f"Stopped following: {Path(self.current_file).name}")
+    
+    def mark_startup(self, phase):
+        """Record the end of a startup phase when profiling"""
+        if self.profiler and not self.profiler.reported:
+            self.profiler.mark(phase)
+        
     def save_config(self):
-        """Save configuration to file"""
-        config = {
+        """Queue the settings to be written to the config file"""
+        if self.config.error:
+            self.update_status(f"Could not save settings: {self.config.error}")
+        # Keep settings that are only edited by hand, like large_file_threshold
+        self.config.update({
             'recent_files': self.recent_files[:10],  # Keep last 10
             'window_geometry': self.root.geometry(),
             'last_directory': str(Path.cwd())
-        }
-        try:
-            with open(self.config_file, 'w') as f:
-                json.dump(config, f, indent=2)
-        except Exception:
-            pass
+        })
     
     def setup_ui(self):
-        """Setup the user interface"""
+        """Setup the window shown at startup: tab bar, status bar and the first tab"""
+        # Main frame
+        self.main_frame = tk.Frame(self.root)
+        self.main_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.tab_bar = tk.Frame(self.main_frame)
+        self.tab_bar.pack(side=tk.TOP, fill=tk.X)
+        
+        # Status bar
+        self.status_bar = tk.Frame(self.root, relief=tk.SUNKEN, bd=1)
+        self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        
+        self.status_label = tk.Label(self.status_bar, text="Ready", anchor=tk.W)
+        self.status_label.pack(side=tk.LEFT, padx=5)
+        
+        self.cursor_label = tk.Label(self.status_bar, text="Line 1, Col 1", anchor=tk.E)
+        self.cursor_label.pack(side=tk.RIGHT, padx=5)
+        
+        self.encoding_label = tk.Label(self.status_bar, text="UTF-8", anchor=tk.E)
+        self.encoding_label.pack(side=tk.RIGHT, padx=5)
+        
+        self.stats_label = tk.Label(self.status_bar, text="", anchor=tk.E)
+        self.stats_label.pack(side=tk.RIGHT, padx=5)
+        
+        self.undo_label = tk.Label(self.status_bar, text="", anchor=tk.E)
+        self.undo_label.pack(side=tk.RIGHT, padx=5)
+        
+        # Text editors, one per tab, share a font so zooming applies to all of them
+        self.editor_font = tkfont.Font(
+            family='Monaco' if platform.system() == 'Darwin' else 'Consolas',
+            size=14 if platform.system() == 'Darwin' else 11
+        )
+        
+        # First tab: the default TextEdit ASCII banner, or a blank one for files to open
+        if self.file_paths:
+            self.activate_tab(self.add_tab(EditorTab()))
+        else:
+            self.new_file()
+    
+    def setup_menus(self):
+        """Setup the menu bar"""
         # Menu bar
         self.menubar = tk.Menu(self.root)
         self.root.config(menu=self.menubar)
@@ -92,10 +3289,13 @@ class TextEditApp:
         file_menu.add_separator()
         file_menu.add_command(label="Save", command=self.save_file, accelerator="Cmd+S")
         file_menu.add_command(label="Save As", command=self.save_as_file, accelerator="Cmd+Shift+S")
+        file_menu.add_command(label="Compare with Saved", command=self.compare_with_saved)
+        file_menu.add_command(label="Close Tab", command=self.close_tab, accelerator="Cmd+W")
+        file_menu.add_command(label="Cancel Loading", command=self.cancel_loading, accelerator="Esc")
         file_menu.add_separator()
         
         # Recent files submenu
-        self.recent_menu = tk.Menu(file_menu, tearoff=0)
+        self.recent_menu = tk.Menu(file_menu, tearoff=0, postcommand=self.refresh_recent_files)
         file_menu.add_cascade(label="Recent Files", menu=self.recent_menu)
         self.update_recent_menu()
         
@@ -114,7 +3314,11 @@ class TextEditApp:
         edit_menu.add_separator()
         edit_menu.add_command(label="Select All", command=self.select_all, accelerator="Cmd+A")
         edit_menu.add_command(label="Find", command=self.find, accelerator="Cmd+F")
+        edit_menu.add_command(label="Find Next", command=self.find_next, accelerator="F3")
+        edit_menu.add_command(label="Find Previous", command=self.find_previous, accelerator="Shift+F3")
         edit_menu.add_command(label="Replace", command=self.replace, accelerator="Cmd+R")
+        edit_menu.add_command(label="Find in Files", command=self.find_in_files, accelerator="Cmd+Shift+F")
+        edit_menu.add_command(label="Go to Line", command=self.go_to_line, accelerator="Cmd+G")
         
         # View menu
         view_menu = tk.Menu(self.menubar, tearoff=0)
@@ -123,83 +3327,163 @@ class TextEditApp:
         view_menu.add_command(label="Zoom Out", command=self.zoom_out, accelerator="Cmd+-")
         view_menu.add_command(label="Reset Zoom", command=self.reset_zoom, accelerator="Cmd+0")
         view_menu.add_separator()
+        view_menu.add_checkbutton(label="Follow", command=self.toggle_follow, variable=self.follow_var)
         view_menu.add_command(label="Word Count", command=self.show_word_count)
         
-        # Main frame
-        self.main_frame = tk.Frame(self.root)
-        self.main_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        # Window menu, listing every tab since the tab bar may not fit them all
+        self.window_menu = tk.Menu(self.menubar, tearoff=0, postcommand=self.update_window_menu)
+        self.menubar.add_cascade(label="Window", menu=self.window_menu)
         
-        # Status bar
-        self.status_bar = tk.Frame(self.root, relief=tk.SUNKEN, bd=1)
-        self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        # Configure menu colors
+        self.menubar.configure(
+            bg=self.colors['menu_bg'],
+            fg=self.colors['menu_fg'],
+            activebackground=self.colors['highlight'],
+            activeforeground=self.colors['fg']
+        )
+    
+    def setup_find_bar(self):
+        """Setup the find bar, shown above the status bar by find() and replace()"""
+        self.find_bar = tk.Frame(self.root)
+        self.find_row = tk.Frame(self.find_bar)
+        self.find_row.pack(side=tk.TOP, fill=tk.X)
+        self.replace_row = tk.Frame(self.find_bar)
+        self.find_bar_label = tk.Label(self.find_row, text="Find:", width=8, anchor=tk.W)
+        self.find_bar_label.pack(side=tk.LEFT, padx=5)
+        self.find_var = tk.StringVar()
+        self.find_entry = tk.Entry(self.find_row, textvariable=self.find_var, width=40)
+        self.find_entry.pack(side=tk.LEFT, pady=2)
+        self.find_buttons = [
+            tk.Button(self.find_row, text="▲", command=self.find_previous, relief=tk.FLAT),
+            tk.Button(self.find_row, text="▼", command=self.find_next, relief=tk.FLAT),
+        ]
+        for button in self.find_buttons:
+            button.pack(side=tk.LEFT, padx=2)
         
-        self.status_label = tk.Label(self.status_bar, text="Ready", anchor=tk.W)
-        self.status_label.pack(side=tk.LEFT, padx=5)
+        # Search options
+        self.find_regex = tk.BooleanVar(value=False)
+        self.find_match_case = tk.BooleanVar(value=False)
+        self.find_in_selection = tk.BooleanVar(value=False)
+        self.find_options = [
+            tk.Checkbutton(self.find_row, text="Regex", variable=self.find_regex),
+            tk.Checkbutton(self.find_row, text="Match case", variable=self.find_match_case),
+        ]
+        for option in self.find_options:
+            option.pack(side=tk.LEFT, padx=2)
+        self.find_count_label = tk.Label(self.find_row, text="")
+        self.find_count_label.pack(side=tk.LEFT, padx=5)
+        close_button = tk.Button(self.find_row, text="✕", command=self.hide_find_bar, relief=tk.FLAT)
+        close_button.pack(side=tk.RIGHT, padx=5)
+        self.find_buttons.append(close_button)
         
-        self.cursor_label = tk.Label(self.status_bar, text="Line 1, Col 1", anchor=tk.E)
-        self.cursor_label.pack(side=tk.RIGHT, padx=5)
+        # Replace row
+        self.replace_label = tk.Label(self.replace_row, text="Replace:", width=8, anchor=tk.W)
+        self.replace_label.pack(side=tk.LEFT, padx=5)
+        self.replace_var = tk.StringVar()
+        self.replace_entry = tk.Entry(self.replace_row, textvariable=self.replace_var, width=40)
+        self.replace_entry.pack(side=tk.LEFT, pady=2)
+        for text, command in (("Replace", self.replace_current), ("Replace All", self.replace_all)):
+            button = tk.Button(self.replace_row, text=text, command=command, relief=tk.FLAT)
+            button.pack(side=tk.LEFT, padx=2)
+            self.find_buttons.append(button)
+        option = tk.Checkbutton(self.replace_row, text="In selection", variable=self.find_in_selection)
+        option.pack(side=tk.LEFT, padx=2)
+        self.find_options.append(option)
+        
+        restart = lambda *args: self.start_search(self.find_var.get())
+        self.find_var.trace_add('write', restart)
+        self.find_regex.trace_add('write', restart)
+        self.find_match_case.trace_add('write', restart)
+        self.find_entry.bind('<Return>', lambda e: self.find_next())
+        self.find_entry.bind('<Shift-Return>', lambda e: self.find_previous())
+        self.replace_entry.bind('<Return>', lambda e: self.replace_current())
+        for entry in (self.find_entry, self.replace_entry):
+            entry.bind('<Escape>', lambda e: self.hide_find_bar())
         
-        # Text editor
-        self.text_editor = ScrolledText(
+        # Colors
+        for frame in (self.find_bar, self.find_row, self.replace_row):
+            frame.configure(bg=self.colors['menu_bg'])
+        for label in (self.find_bar_label, self.find_count_label, self.replace_label):
+            label.configure(bg=self.colors['menu_bg'], fg=self.colors['menu_fg'])
+        for entry in (self.find_entry, self.replace_entry):
+            entry.configure(
+                bg=self.colors['bg'],
+                fg=self.colors['fg'],
+                insertbackground=self.colors['cursor'],
+                selectbackground=self.colors['select_bg']
+            )
+        for option in self.find_options:
+            option.configure(
+                bg=self.colors['menu_bg'],
+                fg=self.colors['menu_fg'],
+                selectcolor=self.colors['bg'],
+                activebackground=self.colors['menu_bg'],
+                activeforeground=self.colors['fg']
+            )
+        for button in self.find_buttons:
+            button.configure(
+                bg=self.colors['menu_bg'],
+                fg=self.colors['menu_fg'],
+                activebackground=self.colors['highlight'],
+                activeforeground=self.colors['fg']
+            )
+    
+    def create_editor(self, tab):
+        """Create a tab's text widget and the document mirroring it"""
+        text_editor = ScrolledText(
             self.main_frame,
             wrap=tk.WORD,
-            undo=True,
-            font=('Monaco', 14) if platform.system() == 'Darwin' else ('Consolas', 11),
-            insertwidth=2,
-            selectbackground=self.colors['select_bg'],
-            selectforeground=self.colors['select_fg'],
-            insertbackground=self.colors['cursor'],
-            bg=self.colors['bg'],
-            fg=self.colors['fg']
-        )
-        self.text_editor.pack(fill=tk.BOTH, expand=True)
-        
-        # Add default TextEdit ASCII banner
-        default_text = """                                                                      
-                                                     ,,    ,,         
-MMP""MM""YMM                 mm   `7MM"""YMM       `7MM    db   mm    
-P'   MM   `7                 MM     MM    `7         MM         MM    
-     MM  .gP"Ya `7M'   `MF'mmMMmm   MM   d      ,M""bMM  `7MM mmMMmm  
-     MM ,M'   Yb  `VA ,V'    MM     MMmmMM    ,AP    MM    MM   MM    
-     MM 8M""""""    XMX      MM     MM   Y  , 8MI    MM    MM   MM    
-     MM YM.    ,  ,V' VA.    MM     MM     ,M `Mb    MM    MM   MM    
-   .JMML.`Mbmmd'.AM.   .MA.  `Mbmo.JMMmmmmMMM  `Wbmd"MML..JMML. `Mbmo 
-                                                                      
-                                                                      
-
-
-Welcome to TextEdit - The permanent dark mode text editor!
-
-Click anywhere to start editing...
-"""
-        self.text_editor.insert(1.0, default_text)
-        self.has_default_text = True
+            font=self.editor_font,
+            insertwidth=2,
+            selectbackground=self.colors['select_bg'],
+            selectforeground=self.colors['select_fg'],
+            insertbackground=self.colors['cursor'],
+            bg=self.colors['bg'],
+            fg=self.colors['fg']
+        )
         
         # Configure scrollbar colors
-        self.text_editor.vbar.config(
+        text_editor.vbar.config(
             bg=self.colors['menu_bg'],
             troughcolor=self.colors['bg'],
             activebackground=self.colors['highlight']
         )
         
-        # Bind text change events
-        self.text_editor.bind('<KeyPress>', self.on_text_change)
-        self.text_editor.bind('<Button-1>', self.on_click)
-        self.text_editor.bind('<KeyRelease>', self.on_cursor_move)
+        # Syntax colors, below the selection and search highlights
+        for kind, color in self.syntax_colors.items():
+            text_editor.tag_config("syn_" + kind, foreground=color)
+        text_editor.tag_raise("sel")
+        
+        # Search highlights, tagged lazily as the view scrolls
+        text_editor.config(yscrollcommand=lambda first, last: self.on_editor_scrolled(tab, first, last))
+        text_editor.tag_config("found",
+                             background=self.colors['highlight'],
+                             foreground=self.colors['fg'])
+        text_editor.tag_config("current_match",
+                             background=self.colors['fg'],
+                             foreground=self.colors['bg'])
+        text_editor.tag_raise("current_match")
         
+        # Edits and cursor moves are seen by text_proxy; the banner goes on the first key or click
+        text_editor.bind('<<Modified>>', lambda e: self.on_modified(tab))
+        text_editor.bind('<KeyPress>', self.on_key_press)
+        text_editor.bind('<Button-1>', self.on_click)
+        
+        # Python-side copy of the text, kept in sync with every widget edit
+        tab.text_editor = text_editor
+        tab.document = PieceTable()
+        tab.stats = DocumentStats(tab.document)
+        tab.journal = EditJournal(self.journal_dir)
+        tab.history = UndoHistory(self.undo_budget, self.undo_max_steps)  # In place of Tk's unbounded undo
+        tab.highlighter = None
+        tab.edit_version = 0
+        self.install_edit_proxy(tab)
+    
     def apply_dark_theme(self):
-        """Apply dark theme to all widgets"""
+        """Apply dark theme to the widgets shown at startup"""
         # Root window
         self.root.configure(bg=self.colors['bg'])
         
-        # Configure menu colors
-        self.menubar.configure(
-            bg=self.colors['menu_bg'],
-            fg=self.colors['menu_fg'],
-            activebackground=self.colors['highlight'],
-            activeforeground=self.colors['fg']
-        )
-        
         # Status bar
         self.status_bar.configure(bg=self.colors['menu_bg'])
         self.status_label.configure(
@@ -210,9 +3494,22 @@ Click anywhere to start editing...
             bg=self.colors['menu_bg'],
             fg=self.colors['menu_fg']
         )
+        self.encoding_label.configure(
+            bg=self.colors['menu_bg'],
+            fg=self.colors['menu_fg']
+        )
+        self.stats_label.configure(
+            bg=self.colors['menu_bg'],
+            fg=self.colors['menu_fg']
+        )
+        self.undo_label.configure(
+            bg=self.colors['menu_bg'],
+            fg=self.colors['menu_fg']
+        )
         
         # Main frame
         self.main_frame.configure(bg=self.colors['bg'])
+        self.tab_bar.configure(bg=self.colors['menu_bg'])
         
     def setup_bindings(self):
         """Setup keyboard bindings"""
@@ -222,21 +3519,214 @@ Click anywhere to start editing...
         self.root.bind('<Command-s>' if platform.system() == 'Darwin' else '<Control-s>', lambda e: self.save_file())
         self.root.bind('<Command-Shift-S>' if platform.system() == 'Darwin' else '<Control-Shift-S>', lambda e: self.save_as_file())
         self.root.bind('<Command-q>' if platform.system() == 'Darwin' else '<Control-q>', lambda e: self.quit_app())
+        self.root.bind('<Command-w>' if platform.system() == 'Darwin' else '<Control-w>', lambda e: self.close_tab())
+        
+        # Tabs
+        self.root.bind('<Control-Tab>', lambda e: self.cycle_tab(1))
+        self.root.bind('<Control-Shift-Tab>', lambda e: self.cycle_tab(-1))
+        if platform.system() != 'Darwin':
+            self.root.bind('<Control-ISO_Left_Tab>', lambda e: self.cycle_tab(-1))
         
         # Edit operations
         self.root.bind('<Command-z>' if platform.system() == 'Darwin' else '<Control-z>', lambda e: self.undo())
         self.root.bind('<Command-Shift-Z>' if platform.system() == 'Darwin' else '<Control-Shift-Z>', lambda e: self.redo())
         self.root.bind('<Command-f>' if platform.system() == 'Darwin' else '<Control-f>', lambda e: self.find())
+        self.root.bind('<Command-Shift-F>' if platform.system() == 'Darwin' else '<Control-Shift-F>', lambda e: self.find_in_files())
+        self.root.bind('<F3>', lambda e: self.find_next())
+        self.root.bind('<Shift-F3>', lambda e: self.find_previous())
         self.root.bind('<Command-r>' if platform.system() == 'Darwin' else '<Control-r>', lambda e: self.replace())
+        self.root.bind('<Command-g>' if platform.system() == 'Darwin' else '<Control-g>', lambda e: self.go_to_line())
         
         # View operations
         self.root.bind('<Command-plus>' if platform.system() == 'Darwin' else '<Control-plus>', lambda e: self.zoom_in())
         self.root.bind('<Command-minus>' if platform.system() == 'Darwin' else '<Control-minus>', lambda e: self.zoom_out())
         self.root.bind('<Command-0>' if platform.system() == 'Darwin' else '<Control-0>', lambda e: self.reset_zoom())
         
+        # Cancel a progressive load
+        self.root.bind('<Escape>', lambda e: self.cancel_loading())
+        
         # Window close
         self.root.protocol("WM_DELETE_WINDOW", self.quit_app)
     
+    def install_edit_proxy(self, tab):
+        """Route a tab's text widget Tcl command through Python to observe every edit"""
+        widget = str(tab.text_editor)
+        tab.text_command = widget + '_orig'
+        self.root.tk.call('rename', widget, tab.text_command)
+        self.root.tk.createcommand(widget, lambda *args: self.text_proxy(tab, *args))
+    
+    def text_proxy(self, tab, *args):
+        """Forward a widget command to its tab's widget, mirroring inserts and deletes into its document"""
+        # Hidden tabs' widgets are still edited, e.g. a viewer emptied on eviction, so nothing assumes the active tab
+        # Errors from the widget itself reach the caller, as Tk's own bindings rely on them
+        tk_call = self.root.tk.call
+        active = tab is self.tab
+        if args and args[0] in ('insert', 'delete', 'replace') \
+                and tk_call(tab.text_command, 'cget', '-state') == tk.NORMAL:
+            edits = self.document_edits(args, tab)
+            result = tk_call((tab.text_command,) + args)
+            try:
+                # Streamed, viewed and banner text is neither journaled nor undoable
+                recording = not (tab.loader or tab.viewer or tab.follower or tab.has_default_text)
+                journaling = recording and not (active and self.journal_paused)
+                for offset, length, text in edits:
+                    if journaling:
+                        tab.journal.record(offset, length, text)
+                    removed = tab.stats.edit(offset, length, text)
+                    if recording:
+                        tab.history.record(offset, removed, text)
+                    tab.edit_version += 1
+                    if active:
+                        self.update_search(offset, length, len(text))
+                        self.note_edit(offset, length, len(text))
+            except Exception:
+                # The widget did change; a failure here would otherwise surface as a Tcl error of the edit
+                self.root.report_callback_exception(*sys.exc_info())
+            return result
+        result = tk_call((tab.text_command,) + args)
+        if args[:3] == ('mark', 'set', tk.INSERT):
+            tab.history.close()  # Typing elsewhere is a new undo step
+            if active:
+                self.schedule_frame()  # The cursor moved
+        return result
+    
+    def text_offset(self, index, tab=None):
+        """Document offset of a widget index, in the active tab unless another is given"""
+        tab = tab or self.tab
+        line, col = self.root.tk.call(tab.text_command, 'index', index).split('.')
+        return tab.document.offset(int(line), int(col))
+    
+    def document_edits(self, args, tab):
+        """Translate an insert/delete/replace command into (offset, length, text) edits of a tab's document"""
+        command = args[0]
+        if command == 'insert':
+            # insert index chars ?tagList chars tagList ...?
+            return [(self.text_offset(args[1], tab), 0, ''.join(args[2::2]))]
+        if command == 'replace':
+            start = self.text_offset(args[1], tab)
+            return [(start, max(self.text_offset(args[2], tab) - start, 0), ''.join(args[3::2]))]
+        
+        # delete index1 ?index2 ...?, applied from the last range backwards
+        ranges = []
+        indices = args[1:]
+        for i in range(0, len(indices), 2):
+            start = self.text_offset(indices[i], tab)
+            end = self.text_offset(indices[i + 1], tab) if i + 1 < len(indices) else start + 1
+            if end > start:
+                ranges.append((start, end - start, ''))
+        return sorted(ranges, reverse=True)
+    
+    def note_edit(self, offset, removed, inserted):
+        """Fold an edit into the range changed since the last frame"""
+        if self.pending_edit is None:
+            self.pending_edit = (offset, offset + inserted)
+        else:
+            start, end = self.pending_edit
+            if end >= offset + removed:
+                end += inserted - removed
+            elif end > offset:
+                end = offset + inserted
+            self.pending_edit = (min(start, offset), max(end, offset + inserted))
+        self.schedule_frame()
+    
+    def schedule_frame(self):
+        """Refresh the title, status bar and edit listeners when Tk next goes idle"""
+        if not self.frame_pending:
+            self.frame_pending = True
+            self.root.after_idle(self.flush_frame)
+    
+    def flush_frame(self):
+        """Run everything that follows edits and cursor moves, once for all of them"""
+        self.frame_pending = False
+        changed, self.pending_edit = self.pending_edit, None
+        if changed is not None:
+            self.history.end_turn()
+            for listener in self.edit_listeners:
+                listener(*changed)
+            self.update_stats_label()
+            self.update_undo_label()
+        self.update_title()
+        self.update_cursor_position()
+    
+    def setup_highlighter(self, tab):
+        """Start highlighting a tab's syntax from scratch, if its file type has a lexer"""
+        if tab is self.tab:
+            self.cancel_highlight()
+        for kind in self.syntax_colors:
+            tab.text_editor.tag_remove("syn_" + kind, "1.0", tk.END)
+        lexer = LEXERS.get(Path(tab.current_file).suffix.lower()) if tab.current_file else None
+        if lexer is None or tab.viewer:
+            tab.highlighter = None
+            return
+        tab.highlighter = SyntaxHighlighter(tab.document, lexer())
+        if tab is self.tab:
+            self.schedule_highlight()
+    
+    def highlight_edit(self, start, end):
+        """Re-lex from an edit and retag the view in the same frame, so typing is never shown uncolored"""
+        if self.highlighter is None:
+            return
+        self.highlighter.edit(start, end)
+        self.cancel_highlight()
+        self.run_highlight()
+    
+    def schedule_highlight(self):
+        """Continue highlighting the active tab when Tk is next idle"""
+        if self.highlight_job is None and self.highlighter is not None:
+            self.highlight_job = self.root.after(1, self.run_highlight)
+    
+    def cancel_highlight(self):
+        """Stop highlighting in the background, for instance before switching tabs"""
+        if self.highlight_job is not None:
+            self.root.after_cancel(self.highlight_job)
+            self.highlight_job = None
+    
+    def run_highlight(self):
+        """Tag the visible lines first, then the rest of the document a slice at a time"""
+        self.highlight_job = None
+        highlighter = self.highlighter
+        if highlighter is None or highlighter.complete:
+            return
+        deadline = time.perf_counter() + SYNTAX_FRAME_BUDGET
+        
+        # Lines without their real state yet are tagged from a guess and fixed up later
+        first = int(self.text_editor.index('@0,0').split('.')[0]) - 1
+        last = int(self.text_editor.index('@0,%d' % self.text_editor.winfo_height()).split('.')[0]) - 1
+        highlighter.advance(first, deadline)
+        self.tag_lines(highlighter, first, last)
+        
+        if highlighter.advance(highlighter.line_count, deadline):
+            for run_first, run_last in highlighter.untagged(0, highlighter.line_count - 1):
+                while run_first <= run_last and time.perf_counter() < deadline:
+                    slice_last = min(run_last, run_first + SYNTAX_SLICE_LINES - 1)
+                    self.tag_lines(highlighter, run_first, slice_last)
+                    run_first = slice_last + 1
+                if time.perf_counter() >= deadline:
+                    break
+        if not highlighter.complete:
+            self.highlight_job = self.root.after(1, self.run_highlight)
+    
+    def tag_lines(self, highlighter, first, last):
+        """Retag the lines in a range that need it, with one tag_remove and tag_add per tag and run"""
+        text = self.text_editor
+        for run_first, run_last in highlighter.untagged(first, last):
+            ranges = {kind: [] for kind in self.syntax_colors}
+            for line, start, end, kind in highlighter.spans(run_first, run_last):
+                ranges[kind].extend((f"{line + 1}.{start}", f"{line + 1}.{end}"))
+            for kind, indices in ranges.items():
+                text.tag_remove("syn_" + kind, f"{run_first + 1}.0", f"{run_last + 2}.0")
+                if indices:
+                    text.tag_add("syn_" + kind, *indices)
+    
+    def on_modified(self, tab):
+        """The widget's modified flag changed: record a real edit as unsaved changes"""
+        if tab.text_editor.edit_modified() and not (tab.loader or tab.viewer or tab.follower or tab.has_default_text):
+            if not tab.modified:
+                tab.modified = True
+                self.update_tab_label(tab)
+                if tab is self.tab:
+                    self.schedule_frame()
+    
     def update_title(self):
         """Update window title"""
         title = "TextEdit"
@@ -244,57 +3734,102 @@ Click anywhere to start editing...
             title = f"{Path(self.current_file).name} - TextEdit"
         if self.modified:
             title = "• " + title
-        self.root.title(title)
+        if self.viewer:
+            title += " [Read Only]"
+        if title != self.window_title:
+            self.window_title = title
+            self.root.title(title)
+            self.update_tab_label(self.tab)
     
     def update_status(self, message="Ready"):
         """Update status bar"""
         self.status_label.config(text=message)
     
+    def update_stats_label(self):
+        """Show the cached document statistics in the status bar"""
+        if self.viewer:
+            # The document only mirrors the viewer's window
+            self.stats_label.config(text=f"{self.viewer.mapped.size:,} bytes")
+            return
+        stats = self.stats
+        self.stats_label.config(text=f"{stats.lines:,} lines, {stats.words:,} words, {stats.chars:,} chars")
+    
+    def update_undo_label(self):
+        """Show how many undo steps the active document keeps, and their memory, in the status bar"""
+        history = self.history
+        steps = len(history.undo_steps)
+        if not steps and not history.redo_steps:
+            self.undo_label.config(text="")
+            return
+        memory = history.memory
+        size = f"{memory / (1024 * 1024):.1f} MB" if memory >= 1024 * 1024 else f"{memory / 1024:.0f} KB"
+        self.undo_label.config(text=f"Undo: {steps:,} {'step' if steps == 1 else 'steps'}, {size}")
+    
+    def update_encoding_label(self):
+        """Show the active document's encoding and line ending in the status bar"""
+        bom = " with BOM" if self.bom else ""
+        newline = NEWLINE_NAMES.get(self.newline or os.linesep, "LF")
+        self.encoding_label.config(text=f"{self.encoding.upper()}{bom}, {newline}")
+    
     def update_cursor_position(self):
         """Update cursor position in status bar"""
         cursor_pos = self.text_editor.index(tk.INSERT)
         line, col = cursor_pos.split('.')
+        if self.viewer:
+            # Line numbers come from the file's index, which may still be building
+            line = self.viewer.line_number() or "?"
         self.cursor_label.config(text=f"Line {line}, Col {int(col)+1}")
     
-    def on_text_change(self, event=None):
-        """Handle text changes"""
-        # Clear default text on first edit
-        if hasattr(self, 'has_default_text') and self.has_default_text:
+    def on_key_press(self, event=None):
+        """Clear the banner before the first typed character goes in"""
+        if self.has_default_text and event.char and not event.state & SHORTCUT_MODIFIERS \
+                and (event.char.isprintable() or event.char in '\r\t'):
             self.clear_default_text()
-        
-        self.modified = True
-        self.update_title()
-        self.root.after_idle(self.update_cursor_position)
-    
-    def on_cursor_move(self, event=None):
-        """Handle cursor movement"""
-        self.root.after_idle(self.update_cursor_position)
     
     def on_click(self, event=None):
         """Handle mouse clicks"""
         # Clear default text on first click
-        if hasattr(self, 'has_default_text') and self.has_default_text:
+        if self.has_default_text:
             self.clear_default_text()
-        self.on_cursor_move(event)
     
     def clear_default_text(self):
         """Clear the default ASCII banner text"""
         if hasattr(self, 'has_default_text') and self.has_default_text:
             self.text_editor.delete(1.0, tk.END)
+            self.text_editor.edit_modified(False)
             self.has_default_text = False
+            self.journal.reset()
             self.modified = False
             self.update_title()
             self.update_status("Ready to edit...")
     
     def update_recent_menu(self):
-        """Update recent files menu"""
+        """Update recent files menu from the cached file checks, then refresh them"""
         self.recent_menu.delete(0, tk.END)
         for file_path in self.recent_files:
-            if Path(file_path).exists():
-                self.recent_menu.add_command(
-                    label=Path(file_path).name,
-                    command=lambda f=file_path: self.open_recent_file(f)
-                )
+            state = self.stat_cache.state(file_path)
+            if state == 'missing':
+                continue
+            self.recent_menu.add_command(
+                label=Path(file_path).name + (" (unavailable)" if state == 'unavailable' else ""),
+                command=lambda f=file_path: self.open_recent_file(f),
+                state=tk.DISABLED if state == 'unavailable' else tk.NORMAL
+            )
+        self.refresh_recent_files()
+    
+    def refresh_recent_files(self):
+        """Check recent files in the background, redrawing the menu as results arrive"""
+        self.stat_cache.refresh(self.recent_files)
+        if self.stat_cache.busy and self.stat_poll is None:
+            self.stat_poll = self.root.after(STAT_POLL_MS, self.poll_stat_cache)
+    
+    def poll_stat_cache(self):
+        """Pick up finished file checks"""
+        self.stat_poll = None
+        if self.stat_cache.collect():
+            self.update_recent_menu()
+        if self.stat_cache.busy and self.stat_poll is None:
+            self.stat_poll = self.root.after(STAT_POLL_MS, self.poll_stat_cache)
     
     def add_to_recent(self, file_path):
         """Add file to recent files list"""
@@ -307,46 +3842,19 @@ Click anywhere to start editing...
         self.save_config()
     
     def new_file(self):
-        """Create new file"""
-        if self.modified:
-            if not self.ask_save_changes():
-                return
-        
-        self.text_editor.delete(1.0, tk.END)
+        """Create new file in a new tab"""
+        self.activate_tab(self.add_tab(EditorTab()))
         
         # Add default TextEdit ASCII banner for new files
-        default_text = """                                                                      
-                                                     ,,    ,,         
-MMP""MM""YMM                 mm   `7MM"""YMM       `7MM    db   mm    
-P'   MM   `7                 MM     MM    `7         MM         MM    
-     MM  .gP"Ya `7M'   `MF'mmMMmm   MM   d      ,M""bMM  `7MM mmMMmm  
-     MM ,M'   Yb  `VA ,V'    MM     MMmmMM    ,AP    MM    MM   MM    
-     MM 8M""""""    XMX      MM     MM   Y  , 8MI    MM    MM   MM    
-     MM YM.    ,  ,V' VA.    MM     MM     ,M `Mb    MM    MM   MM    
-   .JMML.`Mbmmd'.AM.   .MA.  `Mbmo.JMMmmmmMMM  `Wbmd"MML..JMML. `Mbmo 
-                                                                      
-                                                                      
-
-
-Welcome to TextEdit - The permanent dark mode text editor!
-
-Click anywhere to start editing...
-"""
-        self.text_editor.insert(1.0, default_text)
         self.has_default_text = True
-        
-        self.current_file = None
-        self.modified = False
+        self.text_editor.insert(1.0, DEFAULT_TEXT)
+        self.text_editor.edit_modified(False)
         self.update_title()
         self.update_status("New file created")
     
     def open_file(self):
         """Open file dialog"""
-        if self.modified:
-            if not self.ask_save_changes():
-                return
-        
-        file_path = filedialog.askopenfilename(
+        file_paths = filedialog.askopenfilenames(
             title="Open File",
             filetypes=[
                 ("Text files", "*.txt"),
@@ -356,41 +3864,389 @@ Click anywhere to start editing...
             ]
         )
         
-        if file_path:
-            self.load_file(file_path)
+        # The first file is shown; the rest load when their tabs are first activated
+        for i, file_path in enumerate(file_paths):
+            self.open_path(file_path, activate=(i == 0))
     
     def open_recent_file(self, file_path):
         """Open recent file"""
+        self.open_path(file_path)
+    
+    def open_path(self, file_path, activate=True):
+        """Open a file in its existing tab, the current blank tab or a new one"""
+        resolved = Path(file_path).resolve()
+        for tab in self.tabs:
+            if tab.current_file and Path(tab.current_file).resolve() == resolved:
+                break
+        else:
+            if activate and self.tab.blank:
+                self.tab.cursor, self.tab.scroll = "1.0", 0.0
+                self.load_file(file_path)
+                return self.tab
+            tab = self.add_tab(EditorTab(file_path))
+        if activate:
+            self.activate_tab(tab)
+        return tab
+    
+    # Tabs
+    def add_tab(self, tab):
+        """Add a tab after the active one, without loading it"""
+        position = self.tabs.index(self.tab) + 1 if self.tab in self.tabs else len(self.tabs)
+        self.tabs.insert(position, tab)
+        tab.label = tk.Label(self.tab_bar, text=tab.title, padx=10, pady=3)
+        tab.label.bind('<Button-1>', lambda e: self.activate_tab(tab))
+        tab.label.bind('<Button-2>', lambda e: self.close_tab(tab))
+        self.update_tab_bar()
+        return tab
+    
+    def activate_tab(self, tab):
+        """Show a tab, loading its file first if it isn't hydrated"""
+        previous = self.tab
+        if previous is tab:
+            return
+        if previous is not None:
+            # Edit listeners, search results and a paused load belong to the outgoing document
+            if self.pending_edit is not None:
+                self.flush_frame()
+            self.cancel_search()
+            self.clear_search()
+            self.search_cache.clear()
+            if previous.loader_poll is not None:
+                self.root.after_cancel(previous.loader_poll)
+                previous.loader_poll = None
+            if previous.hydrated:
+                previous.cursor = previous.text_editor.index(tk.INSERT)
+                previous.scroll = previous.text_editor.yview()[0]
+                previous.text_editor.pack_forget()
+        self.cancel_highlight()
+        self.cancel_follow()
+        
+        self.tab = tab
+        tab.last_used = time.monotonic()
+        if tab.hydrated:
+            tab.text_editor.pack(fill=tk.BOTH, expand=True)
+            if tab.loader is not None:
+                tab.loader_poll = self.root.after(1, self.poll_loader)
+        else:
+            self.create_editor(tab)
+            tab.text_editor.pack(fill=tk.BOTH, expand=True)
+            if tab.current_file:
+                self.load_file(tab.current_file)
+        
+        tab.text_editor.focus_set()
+        self.update_tab_bar()
+        self.update_title()
+        self.update_cursor_position()
+        self.update_stats_label()
+        self.update_undo_label()
+        self.update_encoding_label()
+        if self.find_bar is not None and self.find_bar.winfo_ismapped():
+            self.start_search(self.find_var.get())
+        self.schedule_highlight()
+        self.evict_tabs()
+        self.check_disk_change()
+        self.follow_var.set(bool(tab.follower))
+        if tab.follower:
+            self.poll_follow()  # Catch up on what was appended while hidden
+    
+    def close_tab(self, tab=None):
+        """Close a tab, by default the active one, offering to save its changes"""
+        if tab is not None:
+            self.activate_tab(tab)
+        tab = self.tab
+        self.cancel_loading()
         if self.modified:
             if not self.ask_save_changes():
                 return
-        self.load_file(file_path)
+        self.wait_for_save()
+        
+        self.cancel_search()
+        self.clear_search()
+        index = self.tabs.index(tab)
+        self.tabs.remove(tab)
+        tab.label.destroy()
+        self.release_tab(tab)
+        self.tab = None
+        if self.tabs:
+            self.activate_tab(self.tabs[min(index, len(self.tabs) - 1)])
+        else:
+            self.new_file()
+    
+    def cycle_tab(self, step):
+        """Activate the next (step 1) or previous (step -1) tab"""
+        index = self.tabs.index(self.tab)
+        self.activate_tab(self.tabs[(index + step) % len(self.tabs)])
+        return "break"
+    
+    def release_tab(self, tab):
+        """Destroy a tab's widget and document; an unmodified one reloads from disk when activated"""
+        if not tab.hydrated:
+            return
+        if tab is self.diff_tab:
+            self.hide_diff_window()
+        if tab.viewer:
+            tab.viewer.close()
+            tab.viewer = None
+        if tab.follower:
+            tab.follower.close()
+            tab.follower = None
+        tab.journal.discard()
+        widget = str(tab.text_editor)
+        tab.text_editor.frame.destroy()
+        self.root.tk.deletecommand(widget)
+        tab.text_editor = tab.text_command = None
+        tab.document = tab.stats = tab.journal = tab.history = tab.highlighter = None
+    
+    def evict_tabs(self):
+        """Release least recently used clean tabs until the hydrated ones fit the memory budget"""
+        hydrated = [tab for tab in self.tabs if tab.hydrated]
+        used = sum(tab.memory() for tab in hydrated)
+        for tab in sorted(hydrated, key=operator.attrgetter('last_used')):
+            if used <= self.tab_memory_budget:
+                break
+            if tab is self.tab or tab.modified or tab.loader or tab.save_job or tab.follower or not tab.current_file:
+                continue
+            used -= tab.memory()
+            self.release_tab(tab)
+    
+    def update_tab_label(self, tab):
+        """Refresh a tab's title in the tab bar"""
+        if tab is not None and tab.label is not None:
+            tab.label.config(text=tab.title)
+    
+    def update_tab_bar(self):
+        """Lay out the tab labels in order, highlighting the active tab"""
+        for tab in self.tabs:
+            tab.label.pack_forget()
+        for tab in self.tabs:
+            active = tab is self.tab
+            tab.label.config(
+                text=tab.title,
+                bg=self.colors['bg'] if active else self.colors['menu_bg'],
+                fg=self.colors['fg'] if active else self.colors['menu_fg']
+            )
+            tab.label.pack(side=tk.LEFT)
+    
+    def update_window_menu(self):
+        """List the open tabs in the Window menu"""
+        self.window_menu.delete(0, tk.END)
+        self.window_menu.add_command(label="Next Tab", command=lambda: self.cycle_tab(1), accelerator="Ctrl+Tab")
+        self.window_menu.add_command(label="Previous Tab", command=lambda: self.cycle_tab(-1), accelerator="Ctrl+Shift+Tab")
+        self.window_menu.add_separator()
+        for tab in self.tabs:
+            label = tab.title + ("  ✓" if tab is self.tab else "")
+            self.window_menu.add_command(label=label, command=lambda t=tab: self.activate_tab(t))
     
     def load_file(self, file_path):
-        """Load file content"""
+        """Load file content progressively"""
+        self.cancel_loading()
+        self.end_follow()
+        if self.diff_tab is self.tab:
+            self.hide_diff_window()  # Comparing the old contents with the new file means nothing
+        self.close_viewer()
+        self.highlighter = None
+        self.disk_changed = self.disk_newer = False
+        self.disk_size = None
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
+            self.disk_signature = file_signature(file_path)  # Before reading, so a write during the load is seen
+            if os.path.getsize(file_path) >= self.large_file_threshold:
+                self.open_large_file(file_path)
+                return
+            loader = FileLoader(file_path)
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not open file:\n{e}")
+            return
+        
+        # The widget is read-only and outside the undo history while streaming
+        self.has_default_text = False
+        self.text_editor.config(state=tk.NORMAL)
+        self.text_editor.delete(1.0, tk.END)
+        self.text_editor.config(state=tk.DISABLED)
+        self.history.reset()
+        self.journal.reset()
+        self.loader = loader
+        self.loader_first_screen = True
+        self.current_file = file_path
+        self.encoding, self.bom, self.newline = loader.encoding, loader.bom, loader.newline
+        self.modified = False
+        self.update_title()
+        self.update_encoding_label()
+        self.update_status(f"Loading: {Path(file_path).name}...")
+        loader.start()
+        self.loader_poll = self.root.after(1, self.poll_loader)
+    
+    def poll_loader(self):
+        """Move decoded chunks from the loader thread into the widget"""
+        self.loader_poll = None
+        loader = self.loader
+        if loader is None or loader.cancelled.is_set():
+            return
+        
+        batch = []
+        batch_size = 0
+        restarted = finished = False
+        while batch_size < LOAD_BATCH_CHARS:
+            try:
+                text = loader.chunks.get_nowait()
+            except queue.Empty:
+                break
+            if text is None:
+                finished = True
+                break
+            if text is LOAD_RESTART:
+                # Decoding failed past the sniffed sample; the file is read again from the start
+                restarted = True
+                batch = []
+                batch_size = 0
+                continue
+            batch.append(text)
+            batch_size += len(text)
+            if self.loader_first_screen:
+                break  # Show the first screen as soon as it is decoded
+        
+        if restarted:
+            self.text_editor.config(state=tk.NORMAL)
             self.text_editor.delete(1.0, tk.END)
-            self.text_editor.insert(1.0, content)
-            self.current_file = file_path
+            self.text_editor.config(state=tk.DISABLED)
+            self.encoding, self.bom = loader.encoding, loader.bom
+            self.update_encoding_label()
+        if batch:
+            self.text_editor.config(state=tk.NORMAL)
+            self.text_editor.insert(tk.END + '-1c', ''.join(batch))
+            self.text_editor.config(state=tk.DISABLED)
+            if self.loader_first_screen:
+                self.loader_first_screen = False
+                self.text_editor.mark_set(tk.INSERT, "1.0")
+                self.text_editor.see(tk.INSERT)
+        
+        if finished:
+            self.finish_loading(loader)
+            return
+        
+        name = Path(loader.file_path).name
+        self.update_status(f"Loading: {name}... {loader.progress:.0%} (Esc to cancel)")
+        self.loader_poll = self.root.after(1 if batch else LOAD_POLL_MS, self.poll_loader)
+    
+    def finish_loading(self, loader):
+        """Make the loaded document editable, or report a failed load"""
+        self.loader = None
+        if self.profiler:
+            self.mark_startup("first file load")
+            self.profiler.report()
+        self.text_editor.config(state=tk.NORMAL)
+        self.history.reset()
+        self.text_editor.edit_modified(False)
+        
+        # A tab loaded again after eviction returns to where it was left
+        self.text_editor.mark_set(tk.INSERT, self.tab.cursor)
+        if self.tab.scroll is None:
+            self.text_editor.see(tk.INSERT)  # Opened at a line, by Find in Files
+        else:
+            self.text_editor.yview_moveto(self.tab.scroll)
+        self.update_cursor_position()
+        
+        if loader.error:
+            self.follow_pending = False
+            # Discarding the partial text is no edit: it is neither journaled, undoable nor unsaved
+            self.journal_paused = True
+            try:
+                self.text_editor.delete(1.0, tk.END)
+            finally:
+                self.journal_paused = False
+            self.history.reset()
+            self.text_editor.edit_modified(False)
             self.modified = False
+            self.update_tab_label(self.tab)
+            self.current_file = None
+            self.encoding, self.bom, self.newline = 'utf-8', False, None
             self.update_title()
-            self.update_status(f"Opened: {Path(file_path).name}")
-            self.add_to_recent(file_path)
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Could not open file:\n{e}")
+            self.update_encoding_label()
+            self.update_status("Ready")
+            self.journal.reset()
+            messagebox.showerror("Error", f"Could not open file:\n{loader.error}")
+            return
+        
+        try:
+            self.journal.reset(loader.file_path, loader.encoding, loader.bom, loader.newline)
+        except OSError:
+            pass  # Vanished since it was read; edits are journaled against an empty base
+        self.update_status(f"Opened: {Path(loader.file_path).name}")
+        self.add_to_recent(loader.file_path)
+        self.disk_size = loader.bytes_read
+        self.setup_highlighter(self.tab)
+        self.evict_tabs()
+        if self.follow_pending:
+            self.follow_pending = False
+            self.start_follow()
+        self.check_disk_change()
     
-    def save_file(self):
+    def cancel_loading(self):
+        """Cancel a progressive load and discard the partial document"""
+        loader = self.loader
+        if loader is None:
+            return
+        loader.cancel()
+        self.loader = None
+        self.follow_pending = False
+        if self.loader_poll is not None:
+            self.root.after_cancel(self.loader_poll)
+            self.loader_poll = None
+        
+        # A partial buffer must never be saved over the original file
+        self.text_editor.config(state=tk.NORMAL)
+        self.text_editor.delete(1.0, tk.END)
+        self.history.reset()
+        self.text_editor.edit_modified(False)
+        self.journal.reset()
+        self.current_file = None
+        self.encoding, self.bom, self.newline = 'utf-8', False, None
+        self.modified = False
+        self.update_title()
+        self.update_encoding_label()
+        self.update_status(f"Loading cancelled: {Path(loader.file_path).name}")
+    
+    def open_large_file(self, file_path):
+        """Open a file above the size threshold in the read-only viewer"""
+        encoding, bom, newline = sniff_file(file_path)
+        if encoding.startswith(('utf-16', 'utf-32')):
+            encoding = 'utf-8'  # The line index looks for newline bytes, so wide encodings can't be viewed
+        mapped = MappedFile(file_path, encoding)
+        self.has_default_text = False
+        # The previous buffer goes without a journal record or undo step; the viewer's text is never edited
+        self.journal_paused = True
+        try:
+            self.text_editor.delete(1.0, tk.END)
+        finally:
+            self.journal_paused = False
+        self.viewer = LargeFileViewer(self.text_editor, self.text_editor.vbar, mapped)
+        self.history.reset()
+        self.journal.reset()
+        self.text_editor.edit_modified(False)
+        self.current_file = file_path
+        self.encoding, self.bom, self.newline = encoding, bom, newline
+        self.modified = False
+        self.update_title()
+        self.update_encoding_label()
+        self.update_cursor_position()
+        self.update_status(f"Opened read-only: {Path(file_path).name} ({mapped.size / (1024 * 1024):.0f} MB)")
+        self.add_to_recent(file_path)
+    
+    def close_viewer(self):
+        """Leave large file viewer mode"""
+        if self.viewer:
+            self.viewer.close()
+            self.viewer = None
+            self.current_file = None
+            self.update_title()
+    
+    def save_file(self, background=True):
         """Save current file"""
         if self.current_file:
-            self.write_file(self.current_file)
+            self.write_file(self.current_file, background)
         else:
-            self.save_as_file()
+            self.save_as_file(background)
     
-    def save_as_file(self):
+    def save_as_file(self, background=True):
         """Save as dialog"""
         file_path = filedialog.asksaveasfilename(
             title="Save As",
@@ -404,23 +4260,90 @@ Click anywhere to start editing...
         )
         
         if file_path:
-            self.write_file(file_path)
-            self.current_file = file_path
-            self.add_to_recent(file_path)
+            self.write_file(file_path, background)
     
-    def write_file(self, file_path):
-        """Write content to file"""
-        try:
-            content = self.text_editor.get(1.0, tk.END + '-1c')
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(content)
-            
-            self.modified = False
-            self.update_title()
-            self.update_status(f"Saved: {Path(file_path).name}")
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Could not save file:\n{e}")
+    def write_file(self, file_path, background=True):
+        """Write content to file atomically, on a worker thread unless background is False"""
+        if self.viewer:
+            # The widget only holds a window of the file
+            messagebox.showinfo("Read Only", "Large files are opened read-only.")
+            return
+        if self.follower:
+            self.update_status("Stop following the file to save it")
+            return
+        if self.loader:
+            self.update_status("Still loading; the document can be saved once it is complete")
+            return
+        if self.disk_newer and file_path == self.current_file and not messagebox.askyesno(
+                "File Changed", f"{Path(file_path).name} has been changed by another program since it was opened.\n\n"
+                "Save anyway, replacing those changes?"):
+            return
+        self.wait_for_save()
+        
+        chunks = self.document.snapshot()
+        if self.bom:
+            chunks = itertools.chain(['\ufeff'], chunks)
+        job = SaveJob(file_path, chunks, len(self.document) + self.bom, self.encoding,
+                      version=self.edit_version, newline=self.newline)
+        job.tab = self.tab
+        self.save_job = job
+        self.update_status(f"Saving {Path(file_path).name}...")
+        if background:
+            job.start()
+            self.root.after(SAVE_POLL_MS, self.poll_save, job)
+        else:
+            job.run()
+            self.finish_save(job)
+    
+    def poll_save(self, job):
+        """Report progress of a background save until it completes"""
+        if job.tab.save_job is not job:
+            return
+        if job.done:
+            self.finish_save(job)
+        else:
+            self.update_status(f"Saving {Path(job.file_path).name}... {job.progress:.0%}")
+            self.root.after(SAVE_POLL_MS, self.poll_save, job)
+    
+    def wait_for_save(self):
+        """Block until a background save has completed"""
+        job = self.save_job
+        if job is not None:
+            job.wait()
+            self.finish_save(job)
+    
+    def finish_save(self, job):
+        """Mark the document saved, unless it was edited while the save ran"""
+        tab = job.tab
+        if tab.save_job is not job:
+            return
+        tab.save_job = None
+        if job.error:
+            messagebox.showerror("Error", f"Could not save file:\n{job.error}")
+            self.update_status("Save failed")
+            return
+        
+        if job.file_path != tab.current_file:
+            # Save As: the document now belongs to the new file
+            tab.current_file = job.file_path
+            self.add_to_recent(job.file_path)
+            self.setup_highlighter(tab)
+        tab.disk_signature = file_signature(job.file_path)
+        tab.disk_size = tab.disk_signature[1] if tab.disk_signature else None
+        tab.disk_changed = tab.disk_newer = False
+        if tab.edit_version == job.version:
+            tab.modified = False
+            tab.text_editor.edit_modified(False)
+            tab.history.mark_saved()
+            try:
+                tab.journal.reset(job.file_path, tab.encoding, tab.bom, tab.newline)
+            except OSError:
+                pass
+        self.update_title()
+        self.update_tab_label(tab)
+        self.update_status(f"Saved: {Path(job.file_path).name}")
+        if tab is self.diff_tab and tab is self.tab:
+            self.compare_with_saved()
     
     def ask_save_changes(self):
         """Ask user to save changes"""
@@ -430,7 +4353,7 @@ Click anywhere to start editing...
         )
         
         if result is True:  # Yes
-            self.save_file()
+            self.save_file(background=False)
             return not self.modified  # Return True if save succeeded
         elif result is False:  # No
             return True
@@ -440,17 +4363,48 @@ Click anywhere to start editing...
     # Edit operations
     def undo(self):
         """Undo last action"""
-        try:
-            self.text_editor.edit_undo()
-        except tk.TclError:
-            pass
+        if self.text_editor.cget('state') == tk.NORMAL:
+            self.apply_history_step(self.history.undo(), undo=True)
+        return "break"
     
     def redo(self):
         """Redo last action"""
+        if self.text_editor.cget('state') == tk.NORMAL:
+            self.apply_history_step(self.history.redo(), undo=False)
+        return "break"
+    
+    def apply_history_step(self, step, undo):
+        """Revert or repeat an undo step's edits, then put the cursor where they were"""
+        if step is None:
+            self.update_status("Nothing to undo" if undo else "Nothing to redo")
+            return
+        edits = list(step.texts())
+        widget = self.text_editor
+        position = lambda offset: "%d.%d" % self.document.position(offset)
+        self.history.applying = True
         try:
-            self.text_editor.edit_redo()
-        except tk.TclError:
-            pass
+            if undo:
+                for offset, removed, inserted in reversed(edits):
+                    widget.replace(position(offset), position(offset + len(inserted)), removed)
+            else:
+                for offset, removed, inserted in edits:
+                    widget.replace(position(offset), position(offset + len(removed)), inserted)
+        finally:
+            self.history.applying = False
+        offset, removed, inserted = min(edits)
+        widget.mark_set(tk.INSERT, position(offset + len(removed if undo else inserted)))
+        widget.see(tk.INSERT)
+        
+        # Back where the file was saved: nothing is unsaved, so nothing needs journaling
+        if self.history.at_saved:
+            widget.edit_modified(False)
+            self.modified = False
+            try:
+                self.journal.reset(self.current_file, self.encoding, self.bom, self.newline)
+            except OSError:
+                pass
+            self.update_title()
+            self.update_tab_label(self.tab)
     
     def cut(self):
         """Cut selected text"""
@@ -480,107 +4434,846 @@ Click anywhere to start editing...
         self.text_editor.see(tk.INSERT)
     
     def find(self):
-        """Find text dialog"""
-        search_text = tk.simpledialog.askstring("Find", "Enter text to find:")
-        if search_text:
-            self.find_text(search_text)
+        """Show the find bar"""
+        self.replace_row.pack_forget()
+        self.show_find_bar()
+    
+    def show_find_bar(self):
+        """Show the find bar, seeded with a single-line selection"""
+        if not self.find_bar.winfo_ismapped():
+            self.find_bar.pack(side=tk.BOTTOM, fill=tk.X, after=self.status_bar)
+        try:
+            selection = self.text_editor.get(tk.SEL_FIRST, tk.SEL_LAST)
+        except tk.TclError:
+            selection = ''
+        if selection and '\n' not in selection:
+            self.find_var.set(selection)
+        self.find_entry.focus_set()
+        self.find_entry.select_range(0, tk.END)
+    
+    def hide_find_bar(self):
+        """Hide the find bar and its highlights"""
+        self.cancel_search()
+        self.clear_search()
+        self.search_cache.clear()
+        self.find_bar.pack_forget()
+        self.find_count_label.config(text="")
+        self.text_editor.focus_set()
+    
+    def find_in_files(self):
+        """Show the Find in Files window, searching the open file's folder by default"""
+        if self.find_files_window is None:
+            self.setup_find_files_window()
+        if not self.find_files_dir.get():
+            self.find_files_dir.set(str(Path(self.current_file).parent) if self.current_file else os.getcwd())
+        self.find_files_window.deiconify()
+        self.find_files_window.lift()
+        self.find_files_entry.focus_set()
+        self.find_files_entry.select_range(0, tk.END)
+    
+    def setup_find_files_window(self):
+        """Build the Find in Files window: query, folder, options and a list of hits"""
+        window = tk.Toplevel(self.root)
+        window.title("Find in Files")
+        window.geometry("800x500")
+        window.protocol("WM_DELETE_WINDOW", self.hide_find_in_files)
+        self.find_files_window = window
+        
+        query_row = tk.Frame(window)
+        query_row.pack(side=tk.TOP, fill=tk.X)
+        folder_row = tk.Frame(window)
+        folder_row.pack(side=tk.TOP, fill=tk.X)
+        query_label = tk.Label(query_row, text="Find:", width=8, anchor=tk.W)
+        query_label.pack(side=tk.LEFT, padx=5)
+        self.find_files_query = tk.StringVar()
+        self.find_files_entry = tk.Entry(query_row, textvariable=self.find_files_query, width=40)
+        self.find_files_entry.pack(side=tk.LEFT, pady=2)
+        self.find_files_regex = tk.BooleanVar(value=False)
+        self.find_files_match_case = tk.BooleanVar(value=False)
+        options = [
+            tk.Checkbutton(query_row, text="Regex", variable=self.find_files_regex),
+            tk.Checkbutton(query_row, text="Match case", variable=self.find_files_match_case),
+        ]
+        for option in options:
+            option.pack(side=tk.LEFT, padx=2)
+        buttons = [
+            tk.Button(query_row, text="Search", command=self.start_file_search, relief=tk.FLAT),
+            tk.Button(query_row, text="Stop", command=self.stop_file_search, relief=tk.FLAT),
+        ]
+        for button in buttons:
+            button.pack(side=tk.LEFT, padx=2)
+        
+        folder_label = tk.Label(folder_row, text="In:", width=8, anchor=tk.W)
+        folder_label.pack(side=tk.LEFT, padx=5)
+        self.find_files_dir = tk.StringVar()
+        folder_entry = tk.Entry(folder_row, textvariable=self.find_files_dir, width=60)
+        folder_entry.pack(side=tk.LEFT, pady=2)
+        browse = tk.Button(folder_row, text="…", relief=tk.FLAT, command=lambda: self.find_files_dir.set(
+            filedialog.askdirectory(parent=window, initialdir=self.find_files_dir.get()) or self.find_files_dir.get()))
+        browse.pack(side=tk.LEFT, padx=2)
+        buttons.append(browse)
+        
+        # One row per file, then one per listed hit; rows maps each to what it opens
+        self.find_files_status = tk.Label(window, text="", anchor=tk.W)
+        self.find_files_status.pack(side=tk.BOTTOM, fill=tk.X, padx=5)
+        self.find_files_list = tk.Listbox(window, activestyle=tk.NONE, font=self.editor_font)
+        scrollbar = tk.Scrollbar(window, command=self.find_files_list.yview)
+        self.find_files_list.config(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.find_files_list.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.find_files_rows = []
+        
+        self.find_files_entry.bind('<Return>', lambda e: self.start_file_search())
+        folder_entry.bind('<Return>', lambda e: self.start_file_search())
+        window.bind('<Escape>', lambda e: self.hide_find_in_files())
+        self.find_files_list.bind('<Double-Button-1>', lambda e: self.open_file_search_hit())
+        self.find_files_list.bind('<Return>', lambda e: self.open_file_search_hit())
+        
+        # Colors
+        for widget in (window, query_row, folder_row):
+            widget.configure(bg=self.colors['menu_bg'])
+        for label in (query_label, folder_label, self.find_files_status):
+            label.configure(bg=self.colors['menu_bg'], fg=self.colors['menu_fg'])
+        for entry in (self.find_files_entry, folder_entry):
+            entry.configure(
+                bg=self.colors['bg'],
+                fg=self.colors['fg'],
+                insertbackground=self.colors['cursor'],
+                selectbackground=self.colors['select_bg']
+            )
+        for option in options:
+            option.configure(
+                bg=self.colors['menu_bg'],
+                fg=self.colors['menu_fg'],
+                selectcolor=self.colors['bg'],
+                activebackground=self.colors['menu_bg'],
+                activeforeground=self.colors['fg']
+            )
+        for button in buttons:
+            button.configure(
+                bg=self.colors['menu_bg'],
+                fg=self.colors['menu_fg'],
+                activebackground=self.colors['highlight'],
+                activeforeground=self.colors['fg']
+            )
+        self.find_files_list.configure(
+            bg=self.colors['bg'],
+            fg=self.colors['fg'],
+            selectbackground=self.colors['select_bg'],
+            selectforeground=self.colors['select_fg'],
+            highlightthickness=0
+        )
+    
+    def hide_find_in_files(self):
+        """Close the Find in Files window, stopping its search"""
+        self.stop_file_search()
+        self.find_files_window.withdraw()
+    
+    def start_file_search(self):
+        """Search the chosen folder, replacing the hits of any earlier search"""
+        self.stop_file_search()
+        query = self.find_files_query.get()
+        root_dir = self.find_files_dir.get()
+        if not query:
+            return
+        if not os.path.isdir(root_dir):
+            self.find_files_status.config(text=f"Not a folder: {root_dir}")
+            return
+        regex = self.find_files_regex.get()
+        try:
+            search_pattern(query, regex)
+        except re.error as e:
+            self.find_files_status.config(text=f"Invalid pattern: {e}")
+            return
+        
+        # Workers are spawned rather than forked, so they start without this process's threads and Tk state
+        if self.search_pool is None:
+            self.search_pool = futures.ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn'))
+        self.find_files_list.delete(0, tk.END)
+        self.find_files_rows = []
+        self.find_files_hits = self.find_files_matched = 0
+        search = FileSearch(root_dir, query, self.search_pool, regex, self.find_files_match_case.get(),
+                            self.find_files_ignore)
+        self.file_search = search
+        search.start()
+        self.find_files_status.config(text="Searching...")
+        self.file_search_poll = self.root.after(FIND_FILES_POLL_MS, self.poll_file_search)
+    
+    def poll_file_search(self):
+        """Add the hits that have arrived to the list, a bounded number per call"""
+        self.file_search_poll = None
+        search = self.file_search
+        rows = 0
+        while rows < FIND_FILES_ROWS_PER_POLL:
+            try:
+                file_path, hits, count = search.results.get_nowait()
+            except queue.Empty:
+                break
+            self.find_files_matched += 1
+            self.find_files_hits += count
+            shown = f", {len(hits)} shown" if len(hits) < count else ""
+            lines = [f"{file_path}  ({count} {'match' if count == 1 else 'matches'}{shown})"]
+            self.find_files_rows.append((file_path, 1, 0))
+            for line, col, preview in hits:
+                lines.append(f"    {line}: {preview}")
+                self.find_files_rows.append((file_path, line, col))
+            self.find_files_list.insert(tk.END, *lines)
+            rows += len(lines)
+        
+        summary = f"{self.find_files_hits:,} matches in {self.find_files_matched:,} files"
+        if search.error:
+            self.find_files_status.config(text=f"{summary}; search failed: {search.error}")
+            self.file_search = None
+        elif rows or not search.done:
+            self.find_files_status.config(text=f"Searching... {summary} ({search.files:,} files found)")
+            self.file_search_poll = self.root.after(FIND_FILES_POLL_MS, self.poll_file_search)
+        else:
+            self.find_files_status.config(text=f"{summary} ({search.files:,} files searched)")
+            self.file_search = None
+    
+    def stop_file_search(self):
+        """Cancel a running Find in Files search, keeping the hits listed so far"""
+        if self.file_search_poll is not None:
+            self.root.after_cancel(self.file_search_poll)
+            self.file_search_poll = None
+        if self.file_search is not None:
+            self.file_search.cancel()
+            self.file_search = None
+            self.find_files_status.config(text=f"Stopped: {self.find_files_hits:,} matches in {self.find_files_matched:,} files")
+    
+    def open_file_search_hit(self):
+        """Open the selected hit's file at its line"""
+        selection = self.find_files_list.curselection()
+        if selection:
+            self.open_at(*self.find_files_rows[selection[0]])
+    
+    def open_at(self, file_path, line, col=0):
+        """Open a file with the cursor at a 1-based line and 0-based column"""
+        tab = self.open_path(file_path)
+        if tab.viewer:
+            if not tab.viewer.go_to_line(line):
+                self.update_status(f"Line {line} is not indexed yet, try Go to Line shortly")
+        elif tab.loader:
+            # finish_loading puts the cursor here and scrolls to it
+            tab.cursor, tab.scroll = f"{line}.{col}", None
+        else:
+            self.text_editor.mark_set(tk.INSERT, f"{line}.{col}")
+            self.text_editor.see(tk.INSERT)
+            self.update_cursor_position()
+        self.root.lift()
+        self.text_editor.focus_set()
     
     def find_text(self, search_text):
         """Find and highlight text"""
         # Remove previous highlights
+        self.cancel_search()
+        self.clear_search()
         self.text_editor.tag_remove("found", "1.0", tk.END)
         
-        if search_text:
-            idx = "1.0"
-            while True:
-                idx = self.text_editor.search(search_text, idx, nocase=1, stopindex=tk.END)
-                if not idx:
-                    break
-                
-                lastidx = f"{idx}+{len(search_text)}c"
-                self.text_editor.tag_add("found", idx, lastidx)
-                idx = lastidx
-            
-            # Configure found tag
-            self.text_editor.tag_config("found", 
-                                      background=self.colors['highlight'],
-                                      foreground=self.colors['fg'])
+        if search_text and self.viewer:
+            # Search the mapped file and jump to the next occurrence
+            self.update_status(f"Searching for '{search_text}'...")
+            self.root.update_idletasks()
+            if self.viewer.find_next(search_text):
+                self.update_status(f"Found '{search_text}'")
+            else:
+                self.update_status(f"'{search_text}' not found")
+            self.update_cursor_position()
+        elif search_text:
+            job = IncrementalSearch(self.document, search_text)
+            while not job.step():
+                pass
+            self.show_search(job.results)
+    
+    def start_search(self, query):
+        """Search as the user types, narrowing or reusing earlier results where possible"""
+        self.cancel_search()
+        if self.viewer:
+            return  # The mapped file is only searched on Enter
+        if not query:
+            self.clear_search()
+            self.find_count_label.config(text="")
+            return
+        
+        regex = self.find_regex.get()
+        match_case = self.find_match_case.get()
+        cached = self.search_cache.get((query if match_case else query.lower(), regex, match_case))
+        if cached is not None:
+            self.show_search(cached)
+            return
+        try:
+            self.search_job = IncrementalSearch(self.document, query, self.search, regex, match_case)
+        except re.error as e:
+            self.clear_search()
+            self.find_count_label.config(text=f"Invalid pattern: {e}")
+            return
+        self.run_search_step()
+    
+    def run_search_step(self):
+        """Run the search for one frame's budget, then yield to the event loop"""
+        job = self.search_job
+        if job is None:
+            return
+        if job.step():
+            self.search_job = None
+            self.show_search(job.results)
+        else:
+            self.find_count_label.config(text=f"Searching... {job.progress:.0%}")
+            self.root.after(1, self.run_search_step)
+    
+    def cancel_search(self):
+        """Abandon an incremental search in progress"""
+        self.search_job = None
+    
+    def show_search(self, results):
+        """Make completed results current: highlight them and select the match at the cursor"""
+        self.clear_search()
+        self.search = results
+        results.tagged.clear()
+        self.search_cache[results.key] = results
+        while len(self.search_cache) > SEARCH_CACHE_SIZE:
+            del self.search_cache[next(iter(self.search_cache))]
+        if not results:
+            self.find_count_label.config(text="No matches")
+            self.update_status(f"'{results.query}' not found")
+            return
+        self.tag_visible_matches()
+        self.select_match(results.next_match(self.text_offset(tk.INSERT)))
+    
+    def update_search(self, offset, removed, inserted):
+        """Keep search results valid across an edit, rescanning only the changed lines"""
+        self.search_cache.clear()
+        results = self.search
+        if results is not None:
+            self.search_cache[results.key] = results
+            changed, renumbered = results.apply_edit(self.document, offset, removed, inserted)
+        if self.search_job is not None:
+            # Restart a search in progress; narrowing still works from the patched results
+            self.start_search(self.find_var.get())
+        if results is None:
+            return
+        self.text_editor.tag_remove("current_match", "1.0", tk.END)
+        if renumbered:
+            # Blocks no longer line up with what is tagged; retag from scratch
+            results.tagged.clear()
+            self.text_editor.tag_remove("found", "1.0", tk.END)
+            self.tag_visible_matches()
+        else:
+            lo = "%d.0" % self.document.position(offset)[0]
+            hi = "%d.0 lineend" % self.document.position(offset + inserted)[0]
+            self.text_editor.tag_remove("found", lo, hi)
+            self.tag_matches(changed)
+        self.find_count_label.config(text=f"{len(results)} matches")
+    
+    def find_next(self):
+        """Move to the next match of the last search"""
+        if self.viewer:
+            query = self.find_var.get() or self.viewer.search_text
+            if query:
+                self.find_text(query)
+            else:
+                self.find()
+            return
+        if not self.search:
+            self.find()
+            return
+        self.select_match(self.search.next_match(self.text_offset(tk.INSERT) + 1))
+    
+    def find_previous(self):
+        """Move to the previous match of the last search"""
+        if not self.search:
+            self.find()
+            return
+        self.select_match(self.search.previous_match(self.text_offset(tk.INSERT)))
+    
+    def select_match(self, number):
+        """Make a match current: highlight it, move the cursor to it and show n of N"""
+        results = self.search
+        results.current = number
+        start = "%d.%d" % self.document.position(results.starts[number])
+        end = "%d.%d" % self.document.position(results.ends[number])
+        self.text_editor.tag_remove("current_match", "1.0", tk.END)
+        self.text_editor.tag_add("current_match", start, end)
+        self.text_editor.mark_set(tk.INSERT, start)
+        self.text_editor.see(tk.INSERT)
+        self.update_cursor_position()
+        self.find_count_label.config(text=f"{number + 1} of {len(results)}")
+        self.update_status(f"Match {number + 1} of {len(results)}: '{results.query}'")
+    
+    def clear_search(self):
+        """Forget the current search results and their highlights"""
+        if self.search is not None:
+            self.search = None
+            self.text_editor.tag_remove("found", "1.0", tk.END)
+            self.text_editor.tag_remove("current_match", "1.0", tk.END)
+    
+    def on_editor_scrolled(self, tab, first, last):
+        """Keep a tab's scrollbar in step and tag matches scrolled into view"""
+        tab.text_editor.vbar.set(first, last)
+        if tab is not self.tab:
+            return
+        if self.search and not self.search_tag_pending:
+            self.search_tag_pending = True
+            self.root.after_idle(self.tag_visible_matches)
+        if tab.highlighter is not None and not tab.highlighter.complete:
+            self.schedule_highlight()
+    
+    def tag_visible_matches(self):
+        """Tag the blocks of matches overlapping the view, a few large tag_add calls per block"""
+        self.search_tag_pending = False
+        results = self.search
+        if not results:
+            return
+        first = self.text_offset('@0,0')
+        last = self.text_offset('@0,%d lineend' % self.text_editor.winfo_height())
+        visible = results.between(first, last + 1)
+        if not visible:
+            return
+        for block in range(visible.start // SEARCH_TAG_BLOCK, (visible.stop - 1) // SEARCH_TAG_BLOCK + 1):
+            if block not in results.tagged:
+                results.tagged.add(block)
+                self.tag_matches(range(block * SEARCH_TAG_BLOCK, min((block + 1) * SEARCH_TAG_BLOCK, len(results))))
+    
+    def tag_matches(self, numbers):
+        """Tag a range of matches with a single tag_add call"""
+        if not numbers:
+            return
+        results = self.search
+        indices = []
+        for number in numbers:
+            indices.append("%d.%d" % self.document.position(results.starts[number]))
+            indices.append("%d.%d" % self.document.position(results.ends[number]))
+        self.text_editor.tag_add("found", *indices)
     
     def replace(self):
-        """Replace text dialog"""
-        # Simple replace - could be enhanced with a proper dialog
-        find_text = tk.simpledialog.askstring("Replace", "Find:")
-        if find_text:
-            replace_text = tk.simpledialog.askstring("Replace", "Replace with:")
-            if replace_text is not None:
-                content = self.text_editor.get(1.0, tk.END)
-                new_content = content.replace(find_text, replace_text)
-                self.text_editor.delete(1.0, tk.END)
-                self.text_editor.insert(1.0, new_content)
+        """Show the find bar with the replace row"""
+        if self.viewer:
+            messagebox.showinfo("Read Only", "Large files are opened read-only.")
+            return
+        
+        if not self.replace_row.winfo_ismapped():
+            self.replace_row.pack(side=tk.TOP, fill=tk.X)
+        self.show_find_bar()
+    
+    def replace_current(self):
+        """Replace the current match and move to the next one"""
+        if self.viewer:
+            return
+        results = self.search
+        if not results or results.current < 0:
+            self.find_next()
+            return
+        start = results.starts[results.current]
+        end = results.ends[results.current]
+        template = self.replace_var.get()
+        if self.find_regex.get():
+            # Match again among the lines around it, as the search did, so lookarounds, \b, ^ and $ see the same text
+            document = self.document
+            lo = document.line_offset(document.position(start)[0] - 1)
+            hi = document.line_offset(document.position(end)[0])
+            match = results.pattern.match(document.get_text(lo, hi), start - lo)
+            if match is None or match.end() != end - lo:
+                self.find_next()  # The match is out of date
+                return
+            try:
+                replacement = match.expand(template)
+            except (re.error, IndexError) as e:
+                self.update_status(f"Invalid replacement: {e}")
+                return
+        else:
+            replacement = template
+        
+        self.history.close()
+        self.text_editor.replace("%d.%d" % self.document.position(start),
+                                 "%d.%d" % self.document.position(end), replacement)
+        self.history.close()
+        self.text_editor.mark_set(tk.INSERT, "%d.%d" % self.document.position(start + len(replacement)))
+        if self.search:
+            self.select_match(self.search.next_match(start + len(replacement)))
+    
+    def replace_all(self):
+        """Replace every match, or every match in the selection, as a single undo step"""
+        if self.viewer:
+            return
+        query = self.find_var.get()
+        if not query:
+            return
+        regex = self.find_regex.get()
+        try:
+            pattern = search_pattern(query, regex, self.find_match_case.get())
+        except re.error as e:
+            self.update_status(f"Invalid pattern: {e}")
+            return
+        
+        start, end = 0, len(self.document)
+        if self.find_in_selection.get():
+            try:
+                start = self.text_offset(tk.SEL_FIRST)
+                end = self.text_offset(tk.SEL_LAST)
+            except tk.TclError:
+                self.update_status("Replace in selection: nothing is selected")
+                return
+        
+        text = self.document.get_text(start, end)
+        try:
+            changes = [change for change in replacements(pattern, text, self.replace_var.get(), regex, start)
+                       if text[change[0] - start:change[1] - start] != change[2]]
+        except (re.error, IndexError) as e:
+            self.update_status(f"Invalid replacement: {e}")
+            return
+        if not changes:
+            self.update_status(f"No replacements for '{query}'")
+            return
+        
+        # Remember the cursor and view, as offsets shifted by the edits before them
+        cursor = self.text_offset(tk.INSERT)
+        top = self.text_offset('@0,0')
+        def shifted(offset):
+            delta = 0
+            for change_start, change_end, replacement in changes:
+                if change_start >= offset:
+                    break
+                if change_end > offset:
+                    return change_start + delta  # Inside a replaced match
+                delta += len(replacement) - (change_end - change_start)
+            return offset + delta
+        new_cursor = shifted(cursor)
+        new_top = shifted(top)
+        new_end = shifted(end)
+        
+        # One widget replace from the first change to the last, so the document, line index,
+        # stats and undo history take a single edit however many matches there are
+        self.cancel_search()
+        self.clear_search()
+        self.update_status(f"Replacing {len(changes)} occurrences...")
+        self.root.update_idletasks()
+        first, last = changes[0][0], changes[-1][1]
+        self.history.close()
+        self.text_editor.replace("%d.%d" % self.document.position(first),
+                                 "%d.%d" % self.document.position(last), replaced_text(text, changes, start))
+        self.history.close()
+        
+        self.text_editor.mark_set(tk.INSERT, "%d.%d" % self.document.position(new_cursor))
+        self.text_editor.yview("%d.0" % self.document.position(new_top)[0])
+        if self.find_in_selection.get():
+            self.text_editor.tag_add(tk.SEL, "%d.%d" % self.document.position(start),
+                                     "%d.%d" % self.document.position(new_end))
+        self.start_search(query)
+        self.update_status(f"Replaced {len(changes)} occurrences of '{query}'")
+    
+    def go_to_line(self):
+        """Go to line dialog"""
+        if self.viewer:
+            line = simpledialog.askinteger("Go to Line", "Line number:", minvalue=1, parent=self.root)
+        else:
+            count = len(self.document.lines)
+            current = int(self.text_editor.index(tk.INSERT).split('.')[0])
+            line = simpledialog.askinteger("Go to Line", f"Line number (1-{count:,}):", minvalue=1,
+                                           maxvalue=count, initialvalue=current, parent=self.root)
+        if line is None:
+            return
+        
+        if self.viewer:
+            if not self.viewer.go_to_line(line):
+                mapped = self.viewer.mapped
+                if mapped.index_complete:
+                    self.update_status(f"Line {line} is past the end of the file")
+                else:
+                    self.update_status(f"Still indexing lines ({mapped.indexed_bytes / mapped.size:.0%}), try again shortly")
+        else:
+            offset = self.document.line_offset(line - 1)
+            self.text_editor.mark_set(tk.INSERT, "%d.%d" % self.document.position(offset))
+            self.text_editor.see(tk.INSERT)
+        self.update_cursor_position()
     
     # View operations
     def zoom_in(self):
         """Increase font size"""
-        current_font = tkfont.Font(font=self.text_editor['font'])
-        size = current_font['size']
+        size = self.editor_font['size']
         new_size = min(size + 2, 48)  # Max size 48
-        current_font.configure(size=new_size)
+        self.editor_font.configure(size=new_size)
         self.update_status(f"Font size: {new_size}")
     
     def zoom_out(self):
         """Decrease font size"""
-        current_font = tkfont.Font(font=self.text_editor['font'])
-        size = current_font['size']
+        size = self.editor_font['size']
         new_size = max(size - 2, 8)  # Min size 8
-        current_font.configure(size=new_size)
+        self.editor_font.configure(size=new_size)
         self.update_status(f"Font size: {new_size}")
     
     def reset_zoom(self):
         """Reset font size"""
         default_size = 14 if platform.system() == 'Darwin' else 11
-        current_font = tkfont.Font(font=self.text_editor['font'])
-        current_font.configure(size=default_size)
+        self.editor_font.configure(size=default_size)
         self.update_status(f"Font size reset to {default_size}")
     
     def show_word_count(self):
         """Show word count dialog"""
-        content = self.text_editor.get(1.0, tk.END + '-1c')
-        lines = len(content.splitlines())
-        words = len(content.split())
-        chars = len(content)
-        chars_no_spaces = len(content.replace(' ', '').replace('\n', '').replace('\t', ''))
+        if self.viewer:
+            mapped = self.viewer.mapped
+            lines = len(mapped.line_starts) if mapped.index_complete else "still counting..."
+            messagebox.showinfo("Document Statistics",
+                              f"Lines: {lines}\n"
+                              f"Size: {mapped.size:,} bytes")
+            return
         
+        stats = self.stats
         messagebox.showinfo("Document Statistics", 
-                          f"Lines: {lines}\n"
-                          f"Words: {words}\n"
-                          f"Characters: {chars}\n"
-                          f"Characters (no spaces): {chars_no_spaces}")
+                          f"Lines: {stats.lines}\n"
+                          f"Words: {stats.words}\n"
+                          f"Characters: {stats.chars}\n"
+                          f"Characters (no spaces): {stats.chars_no_spaces}")
     
     def quit_app(self):
-        """Quit application"""
-        if self.modified:
-            if not self.ask_save_changes():
-                return
+        """Quit application, offering to save each modified tab"""
+        self.cancel_loading()
+        for tab in list(self.tabs):
+            if tab.modified:
+                self.activate_tab(tab)
+                if not self.ask_save_changes():
+                    return
         
+        for tab in self.tabs:
+            if tab.loader:
+                tab.loader.cancel()
+            if tab.save_job:
+                tab.save_job.wait()
+                self.finish_save(tab.save_job)
+            if tab.viewer:
+                tab.viewer.close()
+            if tab.journal:
+                tab.journal.discard()
+        if self.instance_server:
+            self.instance_server.close()
+        if self.search_pool:
+            if self.file_search:
+                self.file_search.cancel()
+            self.search_pool.shutdown(wait=False, cancel_futures=True)
         self.save_config()
+        if not self.config.flush():
+            messagebox.showerror("Error", f"Could not save settings:\n{self.config.error}")
         self.root.destroy()
     
+    def flush_journal(self):
+        """Periodically push journaled edits to disk and compact a long log"""
+        for tab in self.tabs:
+            journal = tab.journal
+            if journal is None:
+                continue
+            try:
+                journal.flush()
+                journal.finish_compaction()
+                if journal.needs_compaction:
+                    journal.compact(tab.document.snapshot(), len(tab.document))
+            except OSError as e:
+                self.update_status(f"Recovery journal failed: {e}")
+        self.root.after(JOURNAL_FLUSH_MS, self.flush_journal)
+    
+    def offer_recovery(self, file_path=None):
+        """Offer to restore unsaved edits journaled by a session that did not exit cleanly"""
+        recovered = False
+        if file_path:
+            file_path = str(Path(file_path).resolve())
+        for journal_dir, meta, modified in EditJournal.pending(self.journal_dir):
+            if file_path and meta.get('file') != file_path:
+                continue
+            name = Path(meta['file']).name if meta.get('file') else "an untitled document"
+            when = time.strftime('%Y-%m-%d %H:%M', time.localtime(modified))
+            if not messagebox.askyesno("Recover Unsaved Changes",
+                                       f"TextEdit found unsaved changes to {name} from {when}.\n\n"
+                                       "Recover them?"):
+                shutil.rmtree(journal_dir, ignore_errors=True)
+                continue
+            try:
+                meta, text = EditJournal.replay(journal_dir)
+            except (OSError, ValueError) as e:
+                messagebox.showerror("Error", f"Could not recover changes:\n{e}")
+                continue
+            
+            # Each recovered document gets its own tab
+            if not self.tab.blank:
+                self.activate_tab(self.add_tab(EditorTab()))
+            self.journal_paused = True
+            try:
+                self.has_default_text = False
+                self.text_editor.delete(1.0, tk.END)
+                self.text_editor.insert(1.0, text)
+                self.history.reset()
+            finally:
+                self.journal_paused = False
+            self.journal.adopt(journal_dir)
+            self.current_file = meta.get('file')
+            if self.current_file:
+                self.disk_signature = file_signature(self.current_file)
+            self.encoding = meta.get('encoding', 'utf-8')
+            self.bom = meta.get('bom', False)
+            self.newline = meta.get('newline')
+            self.modified = True
+            self.setup_highlighter(self.tab)
+            self.text_editor.mark_set(tk.INSERT, "1.0")
+            self.update_title()
+            self.update_encoding_label()
+            self.update_status(f"Recovered unsaved changes to {name}")
+            recovered = True
+        return recovered
+    
     def run(self):
         """Start the application"""
         self.root.mainloop()
 
+def batch_stats(file_path, text, file_format, options):
+    """The editor's document statistics for a file, as one record"""
+    stats = DocumentStats(PieceTable(text))
+    encoding, bom, newline = file_format
+    yield {
+        'file': file_path,
+        'lines': stats.lines,
+        'words': stats.words,
+        'chars': stats.chars,
+        'chars_no_spaces': stats.chars_no_spaces,
+        'encoding': encoding,
+        'newline': NEWLINE_NAMES.get(newline),
+    }
+
+def batch_find(file_path, text, file_format, options):
+    """One record per match, with its 1-based line and 0-based column"""
+    pattern = search_pattern(options['query'], options['regex'], options['match_case'])
+    lines = LineIndex(text)
+    for match in pattern.finditer(text):
+        start, end = match.span()
+        if end > start:
+            line = lines.line_at(start)
+            yield {'file': file_path, 'line': line + 1, 'col': start - lines[line], 'match': match.group()}
+
+def batch_replace(file_path, text, file_format, options):
+    """Replace every match like Replace All, writing the file back atomically unless it's a dry run"""
+    pattern = search_pattern(options['query'], options['regex'], options['match_case'])
+    parts = []
+    pos = count = 0
+    for start, end, replacement in replacements(pattern, text, options['replacement'], options['regex']):
+        if text[start:end] != replacement:
+            parts.append(text[pos:start])
+            parts.append(replacement)
+            pos = end
+            count += 1
+    written = bool(count) and not options['dry_run']
+    if written:
+        encoding, bom, newline = file_format
+        parts.append(text[pos:])
+        if bom:
+            parts.insert(0, '\ufeff')
+        atomic_write(file_path, parts, encoding, newline=newline)
+    yield {'file': file_path, 'replacements': count, 'written': written}
+
+BATCH_COMMANDS = {
+    'stats': batch_stats,
+    'find': batch_find,
+    'replace': batch_replace,
+}
+
+def batch_file(file_path, command, options):
+    """Worker: run a batch command on one file, never raising
+    
+    Returns the file's records already as JSON lines, so encoding them is
+    spread across the workers too, with how many records and errors they hold.
+    """
+    try:
+        text, *file_format = read_document(file_path)
+        if '\0' in text[:SNIFF_BYTES]:
+            records = [{'file': file_path, 'skipped': 'binary'}]
+        else:
+            records = list(BATCH_COMMANDS[command](file_path, text, file_format, options))
+        errors = 0
+    except (OSError, ValueError, re.error, IndexError) as e:
+        records = [{'file': file_path, 'error': str(e)}]
+        errors = 1
+    lines = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+    return lines, len(records) - errors, errors
+
+def batch_paths(paths):
+    """Files named on the command line, with directories walked as Find in Files does"""
+    for path in paths:
+        if os.path.isdir(path):
+            yield from (file_path for file_path, size in walk_files(path))
+        else:
+            yield path
+
+def run_batch(argv):
+    """textedit --batch: stats, find or replace over many files without a window, as JSON lines"""
+    parser = argparse.ArgumentParser(prog='textedit --batch',
+                                     description="Run editor operations over files, printing one JSON object per line")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help="worker processes (default: one per core)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('stats', parents=[common], help="line, word and character counts").add_argument('paths', nargs='+')
+    for name, help_text in (('find', "every match"), ('replace', "replace every match, in place")):
+        command = commands.add_parser(name, parents=[common], help=help_text)
+        command.add_argument('query')
+        if name == 'replace':
+            command.add_argument('replacement', help="with --regex, may use \\1 or \\g<name>")
+            command.add_argument('-n', '--dry-run', action='store_true', help="count replacements without writing")
+        command.add_argument('-r', '--regex', action='store_true')
+        command.add_argument('-c', '--match-case', action='store_true')
+        command.add_argument('paths', nargs='+')
+    args = parser.parse_args(argv)
+    options = {key: value for key, value in vars(args).items() if key not in ('command', 'paths', 'jobs')}
+    if 'query' in options:
+        try:
+            search_pattern(args.query, args.regex)
+        except re.error as e:
+            parser.error(f"invalid pattern: {e}")
+    
+    # Results stream in file order as workers finish; each worker takes a few files at a time
+    files = list(batch_paths(args.paths))
+    jobs = max(1, min(args.jobs, len(files)))
+    started = time.perf_counter()
+    counts = {'files': len(files), 'records': 0, 'errors': 0}
+    executor = futures.ProcessPoolExecutor(jobs) if jobs > 1 else None
+    try:
+        if executor:
+            results = executor.map(batch_file, files, itertools.repeat(args.command), itertools.repeat(options),
+                                   chunksize=BATCH_CHUNK_FILES)
+        else:
+            results = map(batch_file, files, itertools.repeat(args.command), itertools.repeat(options))
+        for lines, records, errors in results:
+            sys.stdout.write(lines)
+            sys.stdout.flush()
+            counts['records'] += records
+            counts['errors'] += errors
+    except BrokenPipeError:
+        # The reader went away (say, head); stop without a traceback or a flush error at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+    
+    counts['seconds'] = round(time.perf_counter() - started, 3)
+    print(json.dumps(counts), file=sys.stderr)
+    return 1 if counts['errors'] else 0
+
 def main():
     """Main entry point"""
-    if len(sys.argv) > 1:
-        # Command line file argument
-        file_path = sys.argv[1]
-        app = TextEditApp()
-        if Path(file_path).exists():
-            app.load_file(file_path)
-        app.run()
-    else:
-        app = TextEditApp()
-        app.run()
+    args = sys.argv[1:]
+    if args[:1] == ['--batch']:
+        sys.exit(run_batch(args[1:]))
+    profiler = None
+    if '--profile-startup' in args:
+        # Print how long each startup phase took to stderr
+        args.remove('--profile-startup')
+        profiler = StartupProfiler()
+    new_instance = '--new-instance' in args
+    if new_instance:
+        args.remove('--new-instance')
+    
+    # Hand the files to a running TextEdit if there is one; profiling needs a fresh process
+    if not (new_instance or profiler) and forward_to_instance(args):
+        return
+    
+    # Command line file arguments are opened once the window is up
+    app = TextEditApp(args, profiler, InstanceServer.start())
+    app.run()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file